@@ -0,0 +1,95 @@
+# bench_googlebooks_payload.py
+# ------------------------------------------
+# Bytes transferidos y tiempo de decodificación
+# JSON por consulta: respuesta completa de
+# /volumes frente al modo ligero (maxResults=1
+# + fields=LEAN_FIELDS), con y sin gzip.
+#
+# Uso:
+#   python benchmarks/bench_googlebooks_payload.py
+#
+# El benchmark es solo sintético: las respuestas completas se generan a
+# partir de landing/googlebooks_books.csv (googlebooks_payloads) y el modo
+# ligero se obtiene aplicando la proyección `fields=` en local. No mide
+# respuestas reales de la API.
+# ------------------------------------------
+
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import enrich_googlebooks as eg  # noqa: E402
+from googlebooks_payloads import lean_response, make_full_response  # noqa: E402
+
+
+def load_payloads(limit: int):
+    pairs = []
+    rows = pd.read_csv(ROOT / "landing" / "googlebooks_books.csv", sep=";", dtype=str).fillna("")
+    for i, row in enumerate(rows.to_dict(orient="records")[:limit]):
+        full = make_full_response(row, seed=i)
+        pairs.append((row["gb_id"], json.dumps(full).encode("utf-8"),
+                      json.dumps(lean_response(full, eg.LEAN_FIELDS)).encode("utf-8")))
+    return pairs
+
+
+def decode_time(payload: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        json.loads(payload)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def same_row(full: bytes, lean: bytes) -> bool:
+    a = eg.first_item(json.loads(full), "q")
+    b = eg.first_item(json.loads(lean), "q")
+    if a is None or b is None:
+        return a is b
+    ra, rb = eg.extract_googlebooks_fields(a), eg.extract_googlebooks_fields(b)
+    ra.pop("ingestion_date_google"), rb.pop("ingestion_date_google")
+    return ra == rb
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    pairs = load_payloads(args.limit)
+    print(f"[INFO] {len(pairs)} respuestas sintéticas (landing/googlebooks_books.csv)")
+
+    stats = {k: [] for k in ("full", "full_gz", "lean", "lean_gz", "t_full", "t_lean")}
+    mismatches = []
+    for name, full, lean in pairs:
+        stats["full"].append(len(full))
+        stats["full_gz"].append(len(gzip.compress(full)))
+        stats["lean"].append(len(lean))
+        stats["lean_gz"].append(len(gzip.compress(lean)))
+        stats["t_full"].append(decode_time(full, args.repeat))
+        stats["t_lean"].append(decode_time(lean, args.repeat))
+        if not same_row(full, lean):
+            mismatches.append(name)
+
+    m = {k: statistics.mean(v) for k, v in stats.items()}
+    print(f"{'modo':<22}{'bytes':>10}{'bytes gzip':>12}{'decode µs':>12}")
+    print(f"{'completo':<22}{m['full']:>10.0f}{m['full_gz']:>12.0f}{m['t_full'] * 1e6:>12.1f}")
+    print(f"{'ligero (fields=)':<22}{m['lean']:>10.0f}{m['lean_gz']:>12.0f}{m['t_lean'] * 1e6:>12.1f}")
+    print(f"Reducción de bytes en red (gzip ligero vs completo sin gzip): x{m['full'] / m['lean_gz']:.1f}")
+    print(f"Reducción del tiempo de decodificación: x{m['t_full'] / m['t_lean']:.1f}")
+    print(f"Filas distintas tras extract_googlebooks_fields: {mismatches or 'ninguna'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# bench_http_load.py
+# ------------------------------------------
+# Prueba de carga del scraper y del enriquecedor
+# contra el servidor local (fake_http_server.py):
+# libros/s y percentiles de latencia por libro
+# con distintos niveles de concurrencia, sin
+# tocar Goodreads ni Google Books.
+#
+# Uso:
+#   python benchmarks/bench_http_load.py                                # 300 libros, 1..16 hilos/tareas
+#   python benchmarks/bench_http_load.py --target google --concurrency 4,8,16,32
+#   python benchmarks/bench_http_load.py --latency-ms 150 --jitter-ms 100 --rate-429 0.02 --error-rate 0.01
+#   python benchmarks/bench_http_load.py --limit-rps 20 --rate 15      # 429 si se pasa de 20/s; cliente a 15/s
+#   python benchmarks/bench_http_load.py --mode replay                   # fixtures grabadas con --mode record
+#
+# El servidor corre en otro proceso para que sus hilos no compitan por el
+# GIL con los del cliente. Las cachés de HTML y de consultas se desactivan:
+# cada libro es una petición real al servidor.
+# ------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.request import urlopen
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+SERVER = Path(__file__).resolve().parent / "fake_http_server.py"
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fake_http_server import load_goodreads  # noqa: E402
+from synthetic_landing import write_landing  # noqa: E402
+
+TARGETS = ("goodreads", "google")
+DEFAULT_CONCURRENCY = "1,2,4,8,16"
+
+
+# -------------------------
+# Servidor
+# -------------------------
+
+def start_server(args) -> Tuple[subprocess.Popen, str]:
+    cmd = [sys.executable, str(SERVER), "--port", "0", "--mode", args.mode, "--data", str(args.data),
+           "--fixtures", str(args.fixtures), "--filler-kb", str(args.filler_kb),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--error-rate", str(args.error_rate), "--rate-429", str(args.rate_429),
+           "--limit-rps", str(args.limit_rps), "--retry-after", str(args.retry_after), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    m = re.search(r"http://\S+", line)
+    if not m:
+        proc.kill()
+        raise RuntimeError(f"el servidor no arrancó: {line.strip() or proc.wait()}")
+    return proc, m.group(0)
+
+
+def server_stats(base: str, reset: bool = False) -> Dict[str, int]:
+    with urlopen(f"{base}/__stats" + ("?reset=1" if reset else ""), timeout=10) as r:
+        return json.loads(r.read())
+
+
+def landing_dir(rows: int, seed: int) -> Path:
+    """Landing sintética para el catálogo del servidor; se reutiliza si ya existe."""
+    data = RESULTS / "data" / f"http_rows{rows}_s{seed}"
+    if not (data / "landing.json").exists():
+        stats = write_landing(data, rows, seed=seed)
+        (data / "landing.json").write_text(json.dumps(stats, indent=2), encoding="utf-8")
+    return data
+
+
+# -------------------------
+# Medición
+# -------------------------
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None}
+    p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99])
+    return {"p50_ms": round(float(p50), 1), "p90_ms": round(float(p90), 1), "p99_ms": round(float(p99), 1)}
+
+
+def run_goodreads(sg, ids: List[str], workers: int, rate: float) -> Dict:
+    """iter_books_concurrent con `workers` hilos; latencia = descarga + parseo de cada libro."""
+    from utils.utils_http import HostRateLimiter, mount_pool
+
+    sg.RATE_LIMITER = HostRateLimiter(rate)
+    mount_pool(sg.SESSION, workers)
+    latencies: List[float] = []
+    scrape_one = sg._scrape_one
+
+    def timed(book_id):
+        t0 = time.perf_counter()
+        try:
+            return scrape_one(book_id)
+        finally:
+            latencies.append(time.perf_counter() - t0)
+
+    sg._scrape_one = timed
+    try:
+        t0 = time.perf_counter()
+        results = list(sg.iter_books_concurrent(ids, workers))
+        seconds = time.perf_counter() - t0
+    finally:
+        sg._scrape_one = scrape_one
+    ok = sum(bd is not None for _, bd in results)
+    return {"books": len(ids), "ok": ok, "seconds": seconds, "latencies": latencies}
+
+
+def run_google(eg, books: List[Dict], concurrency: int, rate: float) -> Dict:
+    """enrich_books_async con `concurrency` tareas; latencia = todas las consultas de cada libro."""
+    from utils.utils_cache import QueryCache
+
+    latencies: List[float] = []
+    query_one = eg.query_google_books_async
+
+    async def timed(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await query_one(*a, **kw)
+        finally:
+            latencies.append(time.perf_counter() - t0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = eg.QUERY_CACHE
+        eg.QUERY_CACHE = QueryCache(Path(tmp) / "q.sqlite", ttl=0, negative_ttl=0)
+        eg.query_google_books_async = timed
+        try:
+            t0 = time.perf_counter()
+            rows = asyncio.run(eg.enrich_books_async(books, concurrency=concurrency, rate=rate))
+            seconds = time.perf_counter() - t0
+        finally:
+            eg.query_google_books_async = query_one
+            eg.QUERY_CACHE.close()
+            eg.QUERY_CACHE = cache
+    return {"books": len(books), "ok": sum(r is not None for r in rows), "seconds": seconds, "latencies": latencies}
+
+
+# -------------------------
+# CLI
+# -------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Prueba de carga del scraper y el enriquecedor contra un servidor local")
+    ap.add_argument("--target", default=",".join(TARGETS), help="goodreads, google o ambos")
+    ap.add_argument("--books", type=int, default=300, help="libros por nivel de concurrencia")
+    ap.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="hilos (Goodreads) / tareas (Google)")
+    ap.add_argument("--rate", type=float, default=0.0, help="peticiones/s del cliente (0 = sin límite)")
+    ap.add_argument("--rows", type=int, default=1000, help="tamaño de la landing sintética que sirve el servidor")
+    ap.add_argument("--data", type=Path, help="directorio con landing/ (por defecto, una landing sintética)")
+    ap.add_argument("--mode", choices=("synthetic", "replay"), default="synthetic")
+    ap.add_argument("--fixtures", type=Path, default=Path(__file__).resolve().parent / "fixtures" / "http")
+    ap.add_argument("--filler-kb", type=int, default=250)
+    ap.add_argument("--latency-ms", type=float, default=80.0)
+    ap.add_argument("--jitter-ms", type=float, default=40.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--limit-rps", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", type=Path, default=RESULTS / "http_load.json")
+    args = ap.parse_args()
+
+    targets = [t.strip() for t in args.target.split(",") if t.strip()]
+    if any(t not in TARGETS for t in targets):
+        ap.error(f"--target debe ser {', '.join(TARGETS)}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    args.data = args.data or landing_dir(args.rows, args.seed)
+
+    proc, base = start_server(args)
+    try:
+        # Los scripts leen las URLs base y el modo de caché al importarse
+        os.environ["GOODREADS_BASE_URL"] = base
+        os.environ["GOOGLE_API_URL"] = f"{base}/books/v1/volumes"
+        os.environ["GOODREADS_CACHE_MODE"] = "off"
+        import enrich_googlebooks as eg
+        import scrape_goodreads as sg
+
+        # IDs por la búsqueda del propio servidor; para Google, los mismos libros de la landing
+        with contextlib.redirect_stdout(io.StringIO()):
+            ids = sg.get_book_ids_from_search(f"{base}/search?q=bench", limit=args.books)
+        books = load_goodreads(Path(args.data) / "landing" / "goodreads_books.json")[:args.books]
+
+        run = {
+            "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+            "results": [],
+        }
+        print(f"[INFO] Servidor {base} ({args.mode}), latencia {args.latency_ms:g}±{args.jitter_ms:g} ms, "
+              f"503 {args.error_rate:g}, 429 {args.rate_429:g}, límite {args.limit_rps:g}/s")
+        print(f"{'destino':<11}{'conc.':>6}{'libros':>8}{'ok':>7}{'s':>8}{'libros/s':>10}"
+              f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'429':>6}{'5xx':>6}")
+        for target in targets:
+            for c in levels:
+                server_stats(base, reset=True)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if target == "goodreads":
+                        r = run_goodreads(sg, ids, c, args.rate)
+                    else:
+                        r = run_google(eg, books, c, args.rate)
+                stats = server_stats(base)
+                n429 = sum(v for k, v in stats.items() if k.endswith(":429"))
+                n5xx = sum(v for k, v in stats.items() if k.split(":")[-1].startswith("5"))
+                row = {"target": target, "concurrency": c, "books": r["books"], "ok": r["ok"],
+                       "seconds": round(r["seconds"], 3),
+                       "books_per_s": round(r["books"] / r["seconds"], 2) if r["seconds"] else None,
+                       **percentiles(r["latencies"]), "server": stats}
+                run["results"].append(row)
+                print(f"{target:<11}{c:>6}{row['books']:>8}{row['ok']:>7}{row['seconds']:>8.2f}"
+                      f"{row['books_per_s'] or 0:>10.1f}{row['p50_ms'] or 0:>9.0f}{row['p90_ms'] or 0:>9.0f}"
+                      f"{row['p99_ms'] or 0:>9.0f}{n429:>6}{n5xx:>6}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(run, indent=2), encoding="utf-8")
+    print(f"\n[OK] Resultados: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# bench_normalize.py
+# ------------------------------------------
+# Tiempo por llamada de las normalizaciones de
+# utils_isbn frente a sus versiones anteriores
+# (normalize_reference.py), en frío (cachés
+# vacías), en caliente y por lotes, y
+# comprobación de que los resultados coinciden.
+#
+# Uso:
+#   python benchmarks/bench_normalize.py
+#   python benchmarks/bench_normalize.py --rows 100000
+# ------------------------------------------
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import normalize_reference as ref  # noqa: E402
+from utils import utils_isbn as fast  # noqa: E402
+
+
+def load_values(rows: int, seed: int = 0):
+    """Valores reales de landing/, repetidos y con variantes hasta `rows`."""
+    with open(ROOT / "landing" / "goodreads_books.json", encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        good = json.loads(raw)
+    except ValueError:
+        good = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    gg = pd.read_csv(ROOT / "landing" / "googlebooks_books.csv", sep=";", dtype=str)
+    gg = gg.where(gg.notna(), None).to_dict(orient="records")
+
+    rnd = random.Random(seed)
+    titles = [r.get("title") for r in good] + [r.get("title") for r in gg]
+    authors = [r.get("authors") for r in good] + [r.get("authors") for r in gg]
+    publishers = [r.get("publisher") for r in good] + [r.get("publisher") for r in gg]
+    dates = [r.get("publication_date") for r in good] + [r.get("pub_date") for r in gg]
+    dates += ["2019-03-14", "2019-03", "2019", "2019-03-14T10:20:30Z", "1700000000", "March 2019"]
+
+    def sample(pool, variant):
+        # ~1/3 de valores nuevos (en frío), el resto repetidos
+        out = []
+        for i in range(rows):
+            v = rnd.choice(pool)
+            if isinstance(v, str) and rnd.random() < 0.33:
+                v = variant(v, i)
+            out.append(v)
+        return out
+
+    return {
+        "normalize_str": sample(publishers + titles, lambda v, i: f" {v}  {i} "),
+        "normalize_title": sample(titles, lambda v, i: f"{v}: Édition {i}"),
+        "normalize_author": sample(authors, lambda v, i: f"{v}, Autor {i}"),
+        "get_first_author": sample(authors, lambda v, i: f"Autor {i}; {v}"),
+        "iso_date": sample(dates, lambda v, i: f"{1900 + i % 120}-{1 + i % 12:02d}-{1 + i % 28:02d}"),
+    }
+
+
+BATCH = {
+    "normalize_str": fast.normalize_str_batch,
+    "normalize_title": fast.normalize_title_batch,
+    "get_first_author": fast.first_author_batch,
+    "iso_date": fast.iso_date_batch,
+}
+
+
+def clear_caches():
+    for fn in (fast._normalize_text, fast._title_key, fast._split_authors, fast._iso_date_text):
+        fn.cache_clear()
+
+
+def per_call_us(fn, values) -> float:
+    t0 = time.perf_counter()
+    for v in values:
+        fn(v)
+    return (time.perf_counter() - t0) / len(values) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    args = ap.parse_args()
+
+    data = load_values(args.rows)
+    print(f"[INFO] {args.rows} valores por función (landing/ con variantes)")
+    print(f"{'función':<18}{'anterior µs':>13}{'frío µs':>10}{'caliente µs':>13}{'lote µs':>10}{'x frío':>8}{'x lote':>8}")
+
+    mismatches = {}
+    for name, values in data.items():
+        ref_fn, fast_fn = getattr(ref, name), getattr(fast, name)
+        t_ref = per_call_us(ref_fn, values)
+        clear_caches()
+        t_cold = per_call_us(fast_fn, values)
+        t_warm = per_call_us(fast_fn, values)
+
+        batch = BATCH.get(name)
+        if batch:
+            clear_caches()
+            t0 = time.perf_counter()
+            batch(values)
+            t_batch = (time.perf_counter() - t0) / len(values) * 1e6
+
+        diff = sum(1 for v in values if ref_fn(v) != fast_fn(v))
+        if batch:
+            diff += sum(1 for a, b in zip(map(ref_fn, values), batch(values)) if a != b)
+        if diff:
+            mismatches[name] = diff
+
+        b_us, b_x = (f"{t_batch:.2f}", f"{t_ref / t_batch:.1f}") if batch else ("-", "-")
+        print(f"{name:<18}{t_ref:>13.2f}{t_cold:>10.2f}{t_warm:>13.2f}{b_us:>10}{t_ref / t_cold:>8.1f}{b_x:>8}")
+
+    print(f"Resultados distintos de la versión anterior: {mismatches or 'ninguno'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench_parquet_layout.py
+# ------------------------------------------
+# Lecturas filtradas de dim_book: un único
+# Parquet (save_dataframe_robust) frente al
+# dataset particionado por pub_year_bucket e
+# idioma (save_dataset_partitioned), con
+# comprobación de que devuelven las mismas filas.
+#
+# Uso:
+#   python benchmarks/bench_parquet_layout.py
+#   python benchmarks/bench_parquet_layout.py --rows 1000000 --repeat 5
+# ------------------------------------------
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from utils.utils_quality import read_dataset_partitioned, save_dataset_partitioned  # noqa: E402
+
+
+LANGUAGES = ["en", "es", "fr", "de", "it", "pt", "ja", None]
+
+QUERIES = {
+    "language = es": [("language", "=", "es")],
+    "pub_year 2000-2009": [("pub_year", ">=", 2000), ("pub_year", "<=", 2009)],
+    "language = en y pub_year >= 2015": [("language", "=", "en"), ("pub_year", ">=", 2015)],
+    "source_preference = google": [("source_preference", "=", "google")],
+}
+
+
+def load_dim_book(rows: int, seed: int = 0) -> pd.DataFrame:
+    """dim_book de standard/ repetido hasta `rows`, con años e idiomas repartidos."""
+    base = pd.read_parquet(ROOT / "standard" / "dim_book.parquet")
+    reps = -(-rows // len(base))
+    df = pd.concat([base] * reps, ignore_index=True).iloc[:rows].copy()
+
+    rnd = np.random.default_rng(seed)
+    rep = pd.Series(np.arange(rows) // len(base), index=df.index).astype(str)
+    df["canonical_id"] = df["canonical_id"].astype(str) + "-" + rep
+    # copias distintas: si no, el fichero único comprime las repeticiones exactas
+    for col in ("title", "description"):
+        df[col] = df[col].fillna("").astype(str) + " #" + rep
+    df["pub_year"] = rnd.integers(1900, 2026, rows)
+    df["language"] = pd.Series(rnd.choice(np.array(LANGUAGES, dtype=object), rows), dtype=object)
+    return df
+
+
+def timed_read(read, path: Path, filters, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = read(path, filters=filters)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def same_rows(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    return sorted(a["canonical_id"]) == sorted(b["canonical_id"])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    df = load_dim_book(args.rows)
+    print(f"[INFO] dim_book sintético: {len(df)} filas")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single = Path(tmp) / "dim_book.parquet"
+        dataset = Path(tmp) / "dim_book_dataset"
+
+        # Disposición actual de save_dataframe_robust: un fichero, opciones por defecto
+        t0 = time.perf_counter()
+        df.to_parquet(single, index=False)
+        t_single = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        save_dataset_partitioned(df, dataset)
+        t_dataset = time.perf_counter() - t0
+
+        size_single = single.stat().st_size
+        size_dataset = sum(f.stat().st_size for f in dataset.rglob("*.parquet"))
+        print(f"\n{'escritura':<36}{'único':>12}{'particionado':>14}")
+        print(f"{'tiempo (s)':<36}{t_single:>12.2f}{t_dataset:>14.2f}")
+        print(f"{'tamaño (MB)':<36}{size_single / 2**20:>12.1f}{size_dataset / 2**20:>14.1f}")
+
+        print(f"\n{'consulta':<36}{'filas':>9}{'único ms':>11}{'part. ms':>11}{'speedup':>9}")
+        mismatches = 0
+        for name, filters in QUERIES.items():
+            ta, a = timed_read(pd.read_parquet, single, filters, args.repeat)
+            tb, b = timed_read(read_dataset_partitioned, dataset, filters, args.repeat)
+            if not same_rows(a, b):
+                mismatches += 1
+            print(f"{name:<36}{len(a):>9}{ta * 1e3:>11.1f}{tb * 1e3:>11.1f}{ta / tb:>8.1f}x")
+
+    if mismatches:
+        print(f"\n[ERROR] {mismatches} consultas con filas distintas")
+        raise SystemExit(1)
+    print("\n[OK] Mismas filas en las dos disposiciones")
+
+
+if __name__ == "__main__":
+    main()
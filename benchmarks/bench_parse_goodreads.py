@@ -0,0 +1,96 @@
+# bench_parse_goodreads.py
+# ------------------------------------------
+# Tiempo de parseo por página: parser de una
+# sola pasada (parse_book_page) frente a las
+# funciones anteriores (parse_book_legacy).
+#
+# Uso:
+#   python benchmarks/bench_parse_goodreads.py               # páginas de la caché o sintéticas
+#   python benchmarks/bench_parse_goodreads.py --html-dir d/ # ficheros <id>.html
+# ------------------------------------------
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from scrape_goodreads import BASE_URL, parse_book_legacy, parse_book_page  # noqa: E402
+from utils.utils_cache import HtmlCache  # noqa: E402
+from goodreads_pages import make_book_page  # noqa: E402
+
+
+def load_pages(html_dir: Path, cache_dir: Path, limit: int):
+    pages = []
+    if html_dir:
+        for p in sorted(html_dir.glob("*.html"))[:limit]:
+            pages.append((p.stem, p.read_text(encoding="utf-8")))
+        return pages, f"html-dir {html_dir}"
+
+    cache = HtmlCache(cache_dir, mode="offline")
+    for idx in sorted((cache_dir / "index").glob("*/*.json")):
+        meta = json.loads(idx.read_text(encoding="utf-8"))
+        if meta["url"].startswith(BASE_URL):
+            entry = cache.lookup(meta["url"])
+            if entry:
+                pages.append((meta["url"][len(BASE_URL):], entry["html"]))
+        if len(pages) >= limit:
+            break
+    if pages:
+        return pages, f"caché {cache_dir}"
+
+    with open(ROOT / "landing" / "goodreads_books.json", encoding="utf-8") as f:
+        records = json.load(f)
+    return [(r["id"], make_book_page(r)) for r in records[:limit]], "sintéticas (landing/goodreads_books.json)"
+
+
+def time_parser(fn, html, book_id, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(html, book_id)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--html-dir", type=Path)
+    ap.add_argument("--cache-dir", type=Path, default=ROOT / "cache" / "goodreads_html")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    pages, origin = load_pages(args.html_dir, args.cache_dir, args.limit)
+    print(f"[INFO] {len(pages)} páginas ({origin})")
+
+    legacy_t, new_t, diffs = [], [], {}
+    for book_id, html in pages:
+        legacy_t.append(time_parser(parse_book_legacy, html, book_id, args.repeat))
+        new_t.append(time_parser(parse_book_page, html, book_id, args.repeat))
+
+        a = asdict(parse_book_legacy(html, book_id))
+        b = asdict(parse_book_page(html, book_id))
+        for k in a:
+            if a[k] != b[k]:
+                diffs[k] = diffs.get(k, 0) + 1
+
+    kb = statistics.mean(len(h) for _, h in pages) / 1024
+    lm, nm = statistics.mean(legacy_t) * 1000, statistics.mean(new_t) * 1000
+    print(f"Tamaño medio de página: {kb:.0f} KB")
+    print(f"{'parser':<20}{'media ms/pág':>14}{'p50 ms':>10}{'max ms':>10}")
+    for name, ts in (("legacy", legacy_t), ("una pasada", new_t)):
+        ms = [t * 1000 for t in ts]
+        print(f"{name:<20}{statistics.mean(ms):>14.2f}{statistics.median(ms):>10.2f}{max(ms):>10.2f}")
+    print(f"Aceleración: x{lm / nm:.1f}")
+    print(f"Campos distintos entre parsers: {diffs or 'ninguno'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+# bench_pipeline.py
+# ------------------------------------------
+# Rendimiento por etapas sobre landings
+# sintéticas (synthetic_landing.py) de 10k,
+# 100k o 1M fichas. Cada etapa corre en un
+# proceso aparte para medir su propio pico de
+# memoria; tiempos, filas/s y pico RSS quedan
+# en un JSON que sirve de línea base para
+# comparar una ejecución con la anterior.
+#
+# Uso:
+#   python benchmarks/bench_pipeline.py                          # 10k y 100k, todas las etapas
+#   python benchmarks/bench_pipeline.py --sizes 10k,100k,1M
+#   python benchmarks/bench_pipeline.py --stages normalize,iso_date,dedup --repeat 3
+#   python benchmarks/bench_pipeline.py --match-rate 0.9 --missing-isbn 0.05 --duplicate-rate 0.3
+#   python benchmarks/bench_pipeline.py --update-baseline        # esta ejecución pasa a ser la base
+#   python benchmarks/bench_pipeline.py --check-parity --sizes 10k  # mismas salidas en memoria y por bloques
+#
+# La primera ejecución escribe la línea base (benchmarks/results/baseline.json);
+# las siguientes se comparan con ella y salen con código 1 si alguna etapa es
+# más lenta o usa más memoria que la base más la tolerancia.
+# ------------------------------------------
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from synthetic_landing import write_landing  # noqa: E402
+
+
+STAGES = ("normalize", "iso_date", "merge_records", "build_tables", "dedup",
+          "save", "schema_md", "run_pipeline", "run_streaming")
+NEEDS_MERGED = ("dedup", "save", "schema_md")     # parten de las filas ya mezcladas (stage_prepare)
+DEFAULT_SIZES = "10k,100k"
+TOLERANCE = 0.25            # +25% de tiempo o de memoria respecto a la base = regresión
+MIN_SECONDS = 0.05          # por debajo de esto el ruido manda: no se compara el tiempo
+
+# Rutas de integrate_pipeline / integrate_streaming redirigidas a la landing sintética
+PIPELINE_PATHS = {
+    "GOODREADS_FILE": "landing/goodreads_books.json",
+    "GOOGLE_PARQUET": "landing/googlebooks_books.parquet",
+    "GOOGLE_CSV": "landing/googlebooks_books.csv",
+    "DIM_BOOK": "standard/dim_book.parquet",
+    "DIM_BOOK_DATASET": "standard/dim_book_dataset",
+    "RAW_STORE": "standard/raw_store.sqlite",
+    "DUPLICATES": "standard/dim_book_duplicates.parquet",
+    "DETAIL": "standard/book_source_detail.parquet",
+    "INCREMENTAL_STATE": "standard/_incremental_state.json",
+    "METRICS": "docs/quality_metrics.json",
+    "RUN_METRICS": "docs/run_metrics.json",
+    "DOCS_DIR": "docs",
+}
+
+
+def parse_size(text: str) -> int:
+    """"10k" → 10000, "1M" → 1000000."""
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria del proceso en MB, o None si no se puede medir."""
+    if psutil is not None:
+        peak = getattr(psutil.Process().memory_info(), "peak_wset", None)  # solo en Windows
+        if peak is not None:
+            return peak / 2**20
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+# -------------------------
+# Etapas (proceso hijo)
+# -------------------------
+
+def _timed(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        _clear_caches()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _clear_caches():
+    # las normalizaciones memorizan por valor: cada repetición empieza en frío
+    from utils import utils_isbn
+    for obj in vars(utils_isbn).values():
+        if hasattr(obj, "cache_clear"):
+            obj.cache_clear()
+
+
+def _inputs(data: Path):
+    import integrate_pipeline as ip
+    df_good = ip.safe_read_goodreads(data / PIPELINE_PATHS["GOODREADS_FILE"])
+    df_gg = ip.safe_read_google(data / PIPELINE_PATHS["GOOGLE_PARQUET"], data / PIPELINE_PATHS["GOOGLE_CSV"])
+    return df_good, df_gg
+
+
+def _merged_rows(data: Path) -> List[Dict]:
+    # filas de dim_book antes de deduplicar; se guardan junto a la landing
+    # (por versión del código) para que dedup / save / schema_md no repitan el merge
+    import pickle
+    import integrate_pipeline as ip
+    cache = data / f"merged_rows_{ip.code_fingerprint()[:12]}.pickle"
+    if cache.exists():
+        with open(cache, "rb") as f:
+            return pickle.load(f)
+    df_good, df_gg = _inputs(data)
+    goods = df_good.to_dict(orient="records")
+    matches, scores, pos = ip.match_records(df_good, df_gg, goods, "columnar")
+    _, _, raw_refs = ip.record_identity(goods, matches, scores)
+    rows = [m for m, _ in ip.merge_rows(list(range(len(goods))), df_good, df_gg, goods, matches, scores, pos,
+                                        raw_refs, ip.now_ts(), "columnar")]
+    with open(cache, "wb") as f:
+        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return rows
+
+
+def _dim_table(data: Path) -> pa.Table:
+    from dedup_canonical import CanonicalDedup
+    from utils.utils_quality import DIM_BOOK_SCHEMA, conform_table
+    return conform_table(CanonicalDedup().select(_merged_rows(data)), DIM_BOOK_SCHEMA)
+
+
+def stage_prepare(data: Path, repeat: int) -> Dict:
+    # no se mide: deja hecho el merge que reutilizan dedup, save y schema_md
+    return {"rows": len(_merged_rows(data)), "seconds": 0.0}
+
+
+def stage_normalize(data: Path, repeat: int) -> Dict:
+    from utils.utils_isbn import get_first_author, normalize_author, normalize_categories, \
+        normalize_str, normalize_title, to_isbn13
+    df_good, df_gg = _inputs(data)
+    records = [(r, "genres") for r in df_good.to_dict(orient="records")]
+    records += [(r, "categories") for r in df_gg.to_dict(orient="records")]
+
+    def run():
+        for r, categories in records:
+            normalize_title(r.get("title"))
+            normalize_author(r.get("authors"))
+            get_first_author(r.get("authors"))
+            normalize_str(r.get("publisher"))
+            normalize_categories(r.get(categories))
+            to_isbn13(r.get("isbn13"))
+    return {"rows": len(records), "seconds": _timed(run, repeat)}
+
+
+def stage_iso_date(data: Path, repeat: int) -> Dict:
+    from utils.utils_isbn import iso_date
+    df_good, df_gg = _inputs(data)
+    values = df_good["publication_date"].tolist() + df_gg["pub_date"].tolist()
+    return {"rows": len(values), "seconds": _timed(lambda: [iso_date(v) for v in values], repeat)}
+
+
+def stage_merge_records(data: Path, repeat: int) -> Dict:
+    import integrate_pipeline as ip
+    df_good, df_gg = _inputs(data)
+    goods = df_good.to_dict(orient="records")
+
+    def run():
+        by_isbn, by_key = ip.build_google_index(df_gg)
+        for g in goods:
+            m, _ = ip.match_google(g, by_isbn, by_key)
+            ip.merge_records(g, m or {})
+    return {"rows": len(goods), "seconds": _timed(run, repeat)}
+
+
+def stage_build_tables(data: Path, repeat: int) -> Dict:
+    import integrate_pipeline as ip
+    df_good, df_gg = _inputs(data)
+    ts = ip.now_ts()
+    return {"rows": len(df_good), "seconds": _timed(lambda: ip.build_tables(df_good, df_gg, ts), repeat)}
+
+
+def stage_dedup(data: Path, repeat: int) -> Dict:
+    from dedup_canonical import CanonicalDedup
+    rows = _merged_rows(data)
+    return {"rows": len(rows), "seconds": _timed(lambda: CanonicalDedup().select(rows), repeat)}
+
+
+def stage_save(data: Path, repeat: int) -> Dict:
+    from utils.utils_quality import DIM_BOOK_SCHEMA, save_dataframe_robust
+    from dedup_canonical import CanonicalDedup
+    df = pd.DataFrame(CanonicalDedup().select(_merged_rows(data)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "dim_book.parquet"
+        seconds = _timed(lambda: save_dataframe_robust(df, path, ("parquet", "csv"), DIM_BOOK_SCHEMA), repeat)
+    return {"rows": len(df), "seconds": seconds}
+
+
+def stage_schema_md(data: Path, repeat: int) -> Dict:
+    import integrate_pipeline as ip
+    from utils.utils_quality import DIM_BOOK_SCHEMA, write_schema_markdown
+    table = _dim_table(data)
+
+    def run():
+        dim_acc, _ = ip.new_metric_accumulators()
+        dim_acc.update(table)
+        with tempfile.TemporaryDirectory() as tmp:
+            write_schema_markdown(Path(tmp) / "schema.md", profile=dim_acc.summary()["columns"],
+                                  schema=DIM_BOOK_SCHEMA)
+    return {"rows": table.num_rows, "seconds": _timed(run, repeat)}
+
+
+def _point_pipeline_at(landing_root: Path, out: Path):
+    import integrate_pipeline as ip
+    import integrate_streaming as isd
+    for name, rel in PIPELINE_PATHS.items():
+        path = (landing_root if rel.startswith("landing/") else out) / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for mod in (ip, isd):
+            if hasattr(mod, name):
+                setattr(mod, name, path)
+
+
+def stage_run_pipeline(data: Path, repeat: int) -> Dict:
+    import integrate_pipeline as ip
+    rows = len(_inputs(data)[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        _point_pipeline_at(data, Path(tmp))
+        seconds = _timed(lambda: ip.run_pipeline(full_rebuild=True), repeat)
+    return {"rows": rows, "seconds": seconds}
+
+
+def stage_run_streaming(data: Path, repeat: int) -> Dict:
+    import integrate_streaming as isd
+    with open(data / PIPELINE_PATHS["GOODREADS_FILE"], "rb") as f:
+        rows = sum(1 for _ in f)
+    with tempfile.TemporaryDirectory() as tmp:
+        _point_pipeline_at(data, Path(tmp))
+        seconds = _timed(isd.run_streaming, repeat)
+    return {"rows": rows, "seconds": seconds}
+
+
+# Columnas del detalle que no dependen de la ejecución (el timestamp sí)
+PARITY_DETAIL_COLUMNS = ["canonical_id", "from_google", "merge_method", "match_score",
+                         "raw_goodreads_ref", "raw_google_ref"]
+
+
+def check_streaming_parity(data: Path) -> bool:
+    """
+    Ejecuta run_pipeline y run_streaming sobre la misma landing y compara
+    dim_book y book_source_detail, incluidas las referencias al RawStore:
+    el mismo registro debe tener la misma clave en los dos modos.
+    """
+    import integrate_pipeline as ip
+    import integrate_streaming as isd
+
+    tables = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, run in (("memoria", lambda: ip.run_pipeline(full_rebuild=True)), ("bloques", isd.run_streaming)):
+            out = Path(tmp) / mode
+            _point_pipeline_at(data, out)
+            with contextlib.redirect_stdout(io.StringIO()):
+                run()
+            dim = pd.read_parquet(out / PIPELINE_PATHS["DIM_BOOK"])
+            detail = pd.read_parquet(out / PIPELINE_PATHS["DETAIL"], columns=PARITY_DETAIL_COLUMNS)
+            tables[mode] = (dim.sort_values("canonical_id", kind="stable").reset_index(drop=True),
+                            detail.sort_values(PARITY_DETAIL_COLUMNS[:1] + PARITY_DETAIL_COLUMNS[4:],
+                                               kind="stable").reset_index(drop=True))
+
+    ok = True
+    for i, name in enumerate(("dim_book", "book_source_detail")):
+        try:
+            pd.testing.assert_frame_equal(tables["memoria"][i], tables["bloques"][i])
+        except AssertionError as e:
+            print(f"[ERROR] {name} difiere entre memoria y bloques: {e}")
+            ok = False
+    refs = tables["memoria"][1][["raw_goodreads_ref", "raw_google_ref"]]
+    same = (refs.fillna("") == tables["bloques"][1][["raw_goodreads_ref", "raw_google_ref"]].fillna("")).all(axis=1)
+    print(f"[{'OK' if ok else 'ERROR'}] Paridad memoria/bloques ({len(refs)} filas de detalle, "
+          f"{int(same.sum())} con las mismas referencias crudas)")
+    return ok
+
+
+def run_worker(stage: str, data: Path, repeat: int):
+    fn = globals()[f"stage_{stage}"]
+    result = fn(data, repeat)
+    result["rows_per_s"] = round(result["rows"] / result["seconds"], 1) if result["seconds"] else None
+    result["seconds"] = round(result["seconds"], 4)
+    peak = peak_rss_mb()
+    result["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+    print("RESULT " + json.dumps(result))
+
+
+# -------------------------
+# Orquestación (proceso padre)
+# -------------------------
+
+def landing_for(rows: int, args) -> Path:
+    """Landing sintética de `rows` fichas con los parámetros pedidos; se reutiliza si ya existe."""
+    name = f"rows{rows}_m{args.match_rate}_i{args.missing_isbn}_d{args.duplicate_rate}_s{args.seed}"
+    data = RESULTS / "data" / name
+    info = data / "landing.json"
+    if not info.exists():
+        t0 = time.perf_counter()
+        stats = write_landing(data, rows, args.match_rate, args.missing_isbn, args.duplicate_rate, args.seed)
+        stats["generate_seconds"] = round(time.perf_counter() - t0, 2)
+        info.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+        print(f"[INFO] Landing sintética: {data} ({stats['goodreads_rows']} Goodreads, "
+              f"{stats['google_rows']} Google, {stats['generate_seconds']:.1f} s)")
+    return data
+
+
+def run_stage(stage: str, data: Path, repeat: int) -> Dict:
+    proc = subprocess.run([sys.executable, __file__, "--worker", stage, "--data", str(data), "--repeat", str(repeat)],
+                          capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    tail = "\n".join((proc.stderr or proc.stdout).strip().splitlines()[-5:])
+    raise RuntimeError(f"la etapa {stage} terminó sin resultado (código {proc.returncode}):\n{tail}")
+
+
+def environment() -> Dict:
+    import os
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare(run: Dict, base: Dict, tolerance: float) -> List[str]:
+    """Etapas más lentas o con más memoria que la base más `tolerance`."""
+    regressions = []
+    for size, res in run["sizes"].items():
+        for stage, r in res["stages"].items():
+            b = base.get("sizes", {}).get(size, {}).get("stages", {}).get(stage)
+            if not b:
+                continue
+            if b["seconds"] >= MIN_SECONDS and r["seconds"] > b["seconds"] * (1 + tolerance):
+                regressions.append(f"{size} {stage}: {b['seconds']:.3f} s → {r['seconds']:.3f} s")
+            if r["peak_rss_mb"] is None or b["peak_rss_mb"] is None:
+                continue
+            if r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(f"{size} {stage}: {b['peak_rss_mb']:.0f} MB → {r['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks por etapa sobre landings sintéticas")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="fichas de Goodreads, p. ej. 10k,100k,1M")
+    ap.add_argument("--stages", default=",".join(STAGES), help=f"etapas a medir ({', '.join(STAGES)})")
+    ap.add_argument("--repeat", type=int, default=1, help="repeticiones por etapa (se queda la mejor)")
+    ap.add_argument("--match-rate", type=float, default=0.6, help="fracción de obras con fila en Google")
+    ap.add_argument("--missing-isbn", type=float, default=0.15, help="fracción de obras sin ISBN")
+    ap.add_argument("--duplicate-rate", type=float, default=0.1, help="fracción de fichas que repiten obra")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", type=Path, default=RESULTS / "latest.json")
+    ap.add_argument("--baseline", type=Path, default=RESULTS / "baseline.json")
+    ap.add_argument("--update-baseline", action="store_true", help="guardar esta ejecución como línea base")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    ap.add_argument("--check-parity", action="store_true",
+                    help="comparar las salidas de run_pipeline y run_streaming en vez de medir")
+    ap.add_argument("--worker", choices=STAGES + ("prepare",), help=argparse.SUPPRESS)
+    ap.add_argument("--data", type=Path, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.data, args.repeat)
+        return
+
+    if args.check_parity:
+        results = [check_streaming_parity(landing_for(parse_size(s), args))
+                   for s in args.sizes.split(",") if s.strip()]
+        raise SystemExit(0 if all(results) else 1)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        ap.error(f"etapas desconocidas: {', '.join(unknown)}")
+
+    run = {
+        "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "environment": environment(),
+        "params": {"match_rate": args.match_rate, "missing_isbn": args.missing_isbn,
+                   "duplicate_rate": args.duplicate_rate, "seed": args.seed, "repeat": args.repeat},
+        "sizes": {},
+    }
+    base = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    failed = 0
+
+    for rows in (parse_size(s) for s in args.sizes.split(",") if s.strip()):
+        data = landing_for(rows, args)
+        res = run["sizes"][str(rows)] = {
+            "landing": json.loads((data / "landing.json").read_text(encoding="utf-8")), "stages": {}}
+        if any(s in NEEDS_MERGED for s in stages):
+            run_stage("prepare", data, 1)
+        print(f"\n{rows} fichas")
+        print(f"{'etapa':<16}{'filas':>10}{'s':>10}{'filas/s':>12}{'pico MB':>10}{'vs base':>9}")
+        for stage in stages:
+            try:
+                r = run_stage(stage, data, args.repeat)
+            except RuntimeError as e:
+                failed += 1
+                print(f"[ERROR] {e}")
+                continue
+            res["stages"][stage] = r
+            b = base.get("sizes", {}).get(str(rows), {}).get("stages", {}).get(stage)
+            ratio = f"{r['seconds'] / b['seconds']:>8.2f}x" if b and b["seconds"] else f"{'-':>9}"
+            peak = f"{r['peak_rss_mb']:>10.0f}" if r["peak_rss_mb"] is not None else f"{'n/d':>10}"
+            print(f"{stage:<16}{r['rows']:>10}{r['seconds']:>10.3f}{r['rows_per_s'] or 0:>12.0f}{peak}{ratio}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(run, indent=2), encoding="utf-8")
+    print(f"\n[OK] Resultados: {args.output}")
+
+    regressions = compare(run, base, args.tolerance) if base else []
+    if not base or args.update_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2), encoding="utf-8")
+        print(f"[OK] Línea base: {args.baseline}")
+    for r in regressions:
+        print(f"[WARN] Regresión: {r}")
+    if regressions or failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# fake_http_server.py
+# ------------------------------------------
+# Servidor local que hace de Goodreads y de
+# Google Books para pruebas de carga sin red:
+#   - /search?q=...&page=N   → página de resultados con enlaces /book/show/<id>
+#   - /book/show/<id>        → ficha con __NEXT_DATA__ (goodreads_pages.py)
+#   - /books/v1/volumes?q=.. → JSON de /volumes, respetando maxResults y fields=
+#   - /__stats               → contadores por ruta y código (?reset=1 los pone a 0)
+#
+# Latencia, errores 5xx y 429 configurables. Modos:
+#   - synthetic: respuestas generadas a partir de <data>/landing/
+#   - record:    hace de proxy hacia los sitios reales y graba cada respuesta
+#   - replay:    sirve solo lo grabado (404 si falta)
+#
+# Uso:
+#   python benchmarks/fake_http_server.py --port 8765 --latency-ms 80 --rate-429 0.02
+#   GOODREADS_BASE_URL=http://127.0.0.1:8765 \
+#   GOOGLE_API_URL=http://127.0.0.1:8765/books/v1/volumes python src/enrich_googlebooks.py
+# ------------------------------------------
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "http"
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from goodreads_pages import make_book_page  # noqa: E402
+from googlebooks_payloads import lean_response, make_full_response  # noqa: E402
+from utils.utils_isbn import normalize_title, to_isbn13  # noqa: E402
+
+UPSTREAMS = {"goodreads": "https://www.goodreads.com", "google": "https://www.googleapis.com"}
+SEARCH_PAGE_SIZE = 20
+MODES = ("synthetic", "record", "replay")
+
+
+# -------------------------
+# Datos
+# -------------------------
+
+def load_goodreads(path: Path) -> List[Dict]:
+    text = path.read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class Catalog:
+    """Libros de <data>/landing/ indexados como los buscarían el scraper y el enriquecedor."""
+
+    def __init__(self, data_dir: Path, filler_kb: int = 250):
+        landing = Path(data_dir) / "landing"
+        self.filler_kb = filler_kb
+        self.books = load_goodreads(landing / "goodreads_books.json")
+        self.by_id = {str(b["id"]): b for b in self.books}
+
+        gg = pd.read_csv(landing / "googlebooks_books.csv", sep=";", dtype=str)
+        rows = gg.astype(object).where(gg.notna(), None).to_dict("records")
+        self.by_isbn: Dict[str, Dict] = {}
+        self.by_title: Dict[str, Dict] = {}
+        for row in rows:
+            for raw in (row.get("isbn13"), row.get("isbn10")):
+                isbn = to_isbn13(raw) if raw else None
+                if isbn:
+                    self.by_isbn.setdefault(isbn, row)
+            key = normalize_title(row.get("title"))
+            if key:
+                self.by_title.setdefault(key, row)
+
+    def search_page(self, page: int) -> str:
+        start = (page - 1) * SEARCH_PAGE_SIZE
+        rows = "".join(
+            f'<tr itemscope itemtype="http://schema.org/Book"><td>'
+            f'<a class="bookTitle" href="/book/show/{b["id"]}?from_search=true">'
+            f'<span itemprop="name">{escape(b.get("title") or "")}</span></a></td></tr>'
+            for b in self.books[start:start + SEARCH_PAGE_SIZE])
+        return ("<!DOCTYPE html><html><head><title>Search results | Goodreads</title></head><body>"
+                f'<table class="tableList">{rows}</table></body></html>')
+
+    @lru_cache(maxsize=4096)
+    def book_page(self, book_id: str) -> Optional[str]:
+        rec = self.by_id.get(book_id)
+        return make_book_page(rec, filler_kb=self.filler_kb) if rec else None
+
+    def volumes(self, query: str) -> Dict:
+        # isbn:<n> | intitle:"..." [inauthor:"..."]
+        row = None
+        m = re.match(r"\s*isbn:(\S+)", query)
+        if m:
+            row = self.by_isbn.get(to_isbn13(m.group(1)) or m.group(1))
+        else:
+            m = re.search(r'intitle:"([^"]*)"', query)
+            if m:
+                row = self.by_title.get(normalize_title(m.group(1)))
+        if row is None:
+            return {"kind": "books#volumes", "totalItems": 0}
+        seed = int(hashlib.sha256(query.encode("utf-8")).hexdigest()[:8], 16)
+        return make_full_response(row, seed=seed)
+
+
+# -------------------------
+# Fixtures grabadas
+# -------------------------
+
+class FixtureStore:
+    """Una respuesta por petición: <root>/<upstream>/<sha(path?query)>.json.gz"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, upstream: str, target: str) -> Path:
+        return self.root / upstream / f"{hashlib.sha256(target.encode('utf-8')).hexdigest()[:24]}.json.gz"
+
+    def load(self, upstream: str, target: str) -> Optional[Dict]:
+        try:
+            with gzip.open(self._path(upstream, target), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def save(self, upstream: str, target: str, status: int, content_type: str, body: str):
+        path = self._path(upstream, target)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"target": target, "status": status, "content_type": content_type, "body": body},
+                      f, ensure_ascii=False)
+
+
+# -------------------------
+# Servidor
+# -------------------------
+
+class FaultInjector:
+    """Latencia (media ± jitter), errores 503, 429 aleatorios y un límite opcional de peticiones/s."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 rate_429: float = 0.0, limit_rps: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.limit_rps = limit_rps
+        self.retry_after = retry_after
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window: List[float] = []
+
+    def _over_limit(self) -> bool:
+        if self.limit_rps <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.limit_rps:
+                return True
+            self._window.append(now)
+        return False
+
+    def decide(self) -> Tuple[float, Optional[int]]:
+        """(segundos de espera, código de error o None)"""
+        with self._lock:
+            delay = max(0.0, self._rnd.uniform(self.latency - self.jitter, self.latency + self.jitter))
+            roll = self._rnd.random()
+        if self._over_limit() or roll < self.rate_429:
+            return delay, 429
+        if roll < self.rate_429 + self.error_rate:
+            return delay, 503
+        return delay, None
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, mode: str, catalog: Optional[Catalog], store: FixtureStore,
+                 faults: FaultInjector):
+        super().__init__(address, Handler)
+        self.mode = mode
+        self.catalog = catalog
+        self.store = store
+        self.faults = faults
+        self.upstream = requests.Session()
+        self.stats: Counter = Counter()
+        self.stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive, como los sitios reales
+    server: StandInServer
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = "text/html; charset=utf-8",
+              headers: Optional[Dict[str, str]] = None):
+        data = body.encode("utf-8")
+        out = {"Content-Type": content_type, **(headers or {})}
+        if len(data) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, compresslevel=1)
+            out["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for k, v in out.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        qs = parse_qs(url.query)
+
+        if url.path == "/__stats":
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+                if qs.get("reset"):
+                    self.server.stats.clear()
+            return self._send(200, json.dumps(stats), "application/json")
+
+        upstream = "google" if url.path.startswith("/books/v1/") else "goodreads"
+        route = "volumes" if upstream == "google" else "search" if url.path == "/search" else "book"
+
+        delay, error = self.server.faults.decide()
+        if delay:
+            time.sleep(delay)
+        if error:
+            self.server.count(f"{route}:{error}")
+            headers = {"Retry-After": f"{self.server.faults.retry_after:g}"} if error == 429 else None
+            return self._send(error, "", "text/plain", headers)
+
+        status, content_type, body = self._respond(upstream, route, url.path, qs)
+        self.server.count(f"{route}:{status}")
+        self._send(status, body, content_type)
+
+    def _respond(self, upstream: str, route: str, path: str, qs: Dict[str, List[str]]) -> Tuple[int, str, str]:
+        mode = self.server.mode
+        if mode == "replay":
+            fx = self.server.store.load(upstream, self.path)
+            if fx is None:
+                return 404, "text/plain", f"sin fixture para {self.path}"
+            return fx["status"], fx["content_type"], fx["body"]
+
+        if mode == "record":
+            r = self.server.upstream.get(UPSTREAMS[upstream] + self.path, timeout=30,
+                                         headers={"User-Agent": self.headers.get("User-Agent", "")})
+            content_type = r.headers.get("Content-Type", "text/html; charset=utf-8")
+            if r.status_code == 200:
+                self.server.store.save(upstream, self.path, r.status_code, content_type, r.text)
+            return r.status_code, content_type, r.text
+
+        catalog = self.server.catalog
+        if route == "volumes":
+            data = catalog.volumes((qs.get("q") or [""])[0])
+            if "fields" in qs:
+                data = lean_response(data, qs["fields"][0], int((qs.get("maxResults") or ["10"])[0]))
+            return 200, "application/json; charset=utf-8", json.dumps(data, ensure_ascii=False)
+        if route == "search":
+            return 200, "text/html; charset=utf-8", catalog.search_page(int((qs.get("page") or ["1"])[0]))
+
+        m = re.match(r"/book/show/(\d+)", path)
+        html = catalog.book_page(m.group(1)) if m else None
+        if html is None:
+            return 404, "text/plain", "not found"
+        return 200, "text/html; charset=utf-8", html
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, mode: str = "synthetic",
+                data_dir: Path = ROOT, fixtures: Path = FIXTURES, filler_kb: int = 250,
+                **fault_kwargs) -> StandInServer:
+    if mode not in MODES:
+        raise ValueError(f"Modo no válido: {mode} (usar {', '.join(MODES)})")
+    catalog = Catalog(data_dir, filler_kb) if mode == "synthetic" else None
+    return StandInServer((host, port), mode, catalog, FixtureStore(fixtures), FaultInjector(**fault_kwargs))
+
+
+# -------------------------
+# CLI
+# -------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Servidor local que imita Goodreads y Google Books")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="0 = puerto libre")
+    ap.add_argument("--mode", choices=MODES, default="synthetic")
+    ap.add_argument("--data", default=str(ROOT), help="directorio con landing/ (modo synthetic)")
+    ap.add_argument("--fixtures", default=str(FIXTURES), help="fixtures grabadas (modos record/replay)")
+    ap.add_argument("--filler-kb", type=int, default=250, help="tamaño aproximado de CSS/JS en cada ficha")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="fracción de respuestas 429")
+    ap.add_argument("--limit-rps", type=float, default=0.0, help="429 por encima de N peticiones/s (0 = sin límite)")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="cabecera Retry-After de los 429 (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    server = make_server(args.host, args.port, args.mode, Path(args.data), Path(args.fixtures), args.filler_kb,
+                         latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                         rate_429=args.rate_429, limit_rps=args.limit_rps, retry_after=args.retry_after,
+                         seed=args.seed)
+    host, port = server.server_address[:2]
+    # La primera línea la lee bench_http_load.py para saber el puerto
+    print(f"[INFO] Escuchando en http://{host}:{port} (modo {args.mode})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# goodreads_pages.py
+# ------------------------------------------
+# Generador de páginas /book/show/<id> con la
+# misma estructura que Goodreads (DOM + ld+json
+# + estado __NEXT_DATA__) para benchmarks y
+# pruebas sin red.
+# ------------------------------------------
+
+import json
+import random
+from datetime import datetime
+from html import escape
+from typing import Dict, List
+
+
+def _filler(size: int, seed: int) -> str:
+    # Simula los bundles de CSS/JS que inflan la página real (~cientos de KB)
+    rnd = random.Random(seed)
+    chunk = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz{}();=.,") for _ in range(1024))
+    return chunk * max(1, size // 1024)
+
+
+def make_book_page(rec: Dict, filler_kb: int = 250, extra_editions: int = 12) -> str:
+    """Construye el HTML de una ficha a partir de un registro con el formato de BookData."""
+    bid = str(rec["id"])
+    authors: List[str] = rec.get("authors") or []
+    work_ref = f"Work:kca://work/amzn1.gr.work.v1.{bid}"
+    contrib_refs = [f"Contributor:kca://author/amzn1.gr.author.v1.{bid}.{i}" for i in range(len(authors))]
+
+    ts = rec.get("publication_timestamp")
+    if ts is None and rec.get("publication_date"):
+        ts = int(datetime.strptime(rec["publication_date"], "%Y-%m-%d").timestamp() * 1000)
+
+    details = {
+        "__typename": "BookDetails",
+        "asin": None,
+        "format": rec.get("format"),
+        "numPages": rec.get("num_pages"),
+        "publicationTime": ts,
+        "publisher": rec.get("publisher"),
+        "isbn": rec.get("isbn"),
+        "isbn13": rec.get("isbn13"),
+        "language": {"__typename": "Language", "name": (rec.get("language") or "english").title()},
+    }
+
+    book = {
+        "__typename": "Book",
+        "id": f"kca://book/amzn1.gr.book.v1.{bid}",
+        "legacyId": int(bid) if bid.isdigit() else bid,
+        "webUrl": f"https://www.goodreads.com/book/show/{bid}",
+        "title": rec.get("title"),
+        "titleComplete": rec.get("title"),
+        "description": rec.get("description"),
+        'description({"stripped":true})': rec.get("description"),
+        "primaryContributorEdge": {"__typename": "BookContributorEdge", "role": "Author",
+                                   "node": {"__ref": contrib_refs[0]}} if contrib_refs else None,
+        "secondaryContributorEdges": [{"__typename": "BookContributorEdge", "role": "Contributor",
+                                       "node": {"__ref": r}} for r in contrib_refs[1:]],
+        "bookGenres": [{"__typename": "BookGenre",
+                        "genre": {"__typename": "Genre", "name": g,
+                                  "webUrl": f"https://www.goodreads.com/genres/{g.lower()}"}}
+                       for g in rec.get("genres") or []],
+        "details": details,
+        "work": {"__ref": work_ref},
+    }
+
+    state = {"ROOT_QUERY": {"__typename": "Query",
+                            f'getBookByLegacyId({{"legacyId":"{bid}"}})': {"__ref": f"Book:{book['id']}"}}}
+    state[f"Book:{book['id']}"] = book
+    # Otras ediciones / recomendados: el estado real trae muchos Book secundarios
+    for i in range(extra_editions):
+        other = f"{bid}{i:02d}"
+        state[f"Book:kca://book/amzn1.gr.book.v1.{other}"] = {
+            "__typename": "Book", "legacyId": int(other) if other.isdigit() else other,
+            "title": f"{rec.get('title')} (edition {i})", "description": (rec.get("description") or "")[:200],
+            "details": None,
+        }
+    for name, ref in zip(authors, contrib_refs):
+        state[ref] = {"__typename": "Contributor", "name": name,
+                      "webUrl": f"https://www.goodreads.com/author/show/{ref[-8:]}"}
+    state[work_ref] = {"__typename": "Work", "stats": {
+        "__typename": "WorkStats",
+        "averageRating": rec.get("rating_value"),
+        "ratingsCount": rec.get("rating_count"),
+        "textReviewsCount": (rec.get("rating_count") or 0) // 10,
+    }}
+
+    next_data = {"props": {"pageProps": {"apolloState": state, "params": {"book_id": bid}}},
+                 "page": "/book/show/[book_id]", "query": {"book_id": bid}, "buildId": "bench"}
+
+    ld = {
+        "@context": "https://schema.org", "@type": "Book", "name": rec.get("title"),
+        "bookFormat": rec.get("format"), "numberOfPages": rec.get("num_pages"),
+        "inLanguage": rec.get("language"), "isbn": rec.get("isbn13"),
+        "author": [{"@type": "Person", "name": a} for a in authors],
+        "aggregateRating": {"@type": "AggregateRating", "ratingValue": rec.get("rating_value"),
+                            "ratingCount": rec.get("rating_count"), "reviewCount": 0},
+    }
+
+    contributors = "".join(
+        f'<a class="ContributorLink" href="#"><span class="ContributorLink__name" data-testid="name">{escape(a)}</span></a>'
+        for a in authors)
+
+    seed = sum(map(ord, bid))
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"/>"
+        f"<title>{escape(rec.get('title') or '')} | Goodreads</title>"
+        f"<style>{_filler(filler_kb * 512, seed)}</style>"
+        f'<script type="application/ld+json">{json.dumps(ld, separators=(",", ":"))}</script>'
+        "</head><body><div id=\"__next\"><main class=\"PageFrame\">"
+        f'<h1 class="Text Text__title1" data-testid="bookTitle">{escape(rec.get("title") or "")}</h1>'
+        f'<div class="ContributorLinksList">{contributors}</div>'
+        f'<div class="RatingStatistics__rating">{rec.get("rating_value") or ""}</div>'
+        f'<div class="DetailsLayoutRightParagraph">{escape(rec.get("description") or "")}</div>'
+        "</main></div>"
+        f"<script>{_filler(filler_kb * 512, seed + 1)}</script>"
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(next_data, separators=(",", ":"))}</script>'
+        "</body></html>"
+    )
@@ -0,0 +1,146 @@
+# googlebooks_payloads.py
+# ------------------------------------------
+# Respuestas de /volumes para benchmarks y
+# pruebas sin red: proyección local de la
+# sintaxis `fields=` de Google y generación
+# de respuestas completas a partir de filas
+# de la landing de Google Books.
+# ------------------------------------------
+
+import random
+from typing import Any, Dict, Optional
+
+
+# -------------------------
+# Proyección `fields=`
+# -------------------------
+
+def parse_fields(spec: str) -> Dict[str, Optional[dict]]:
+    """'items(id,volumeInfo(title))' → {'items': {'id': None, 'volumeInfo': {'title': None}}}"""
+    def parse(i: int):
+        out, name = {}, ""
+        while i < len(spec):
+            c = spec[i]
+            if c == "(":
+                sub, i = parse(i + 1)
+                out[name.strip()] = sub
+                name = ""
+            elif c == ")":
+                break
+            elif c == ",":
+                if name.strip():
+                    out[name.strip()] = None
+                name = ""
+            else:
+                name += c
+            i += 1
+        if name.strip():
+            out[name.strip()] = None
+        return out, i
+
+    return parse(0)[0]
+
+
+def apply_fields(obj: Any, mask: Optional[dict]) -> Any:
+    if mask is None:
+        return obj
+    if isinstance(obj, list):
+        return [apply_fields(x, mask) for x in obj]
+    if isinstance(obj, dict):
+        return {k: apply_fields(obj[k], sub) for k, sub in mask.items() if k in obj}
+    return obj
+
+
+def lean_response(full: Dict, fields: str, max_results: int = 1) -> Dict:
+    # Lo que devolvería Google con maxResults + fields
+    data = dict(full)
+    if "items" in data:
+        data["items"] = data["items"][:max_results]
+    return apply_fields(data, parse_fields(fields))
+
+
+# -------------------------
+# Respuestas completas sintéticas
+# -------------------------
+
+def _split(v) -> list:
+    return [x.strip() for x in str(v).split(";") if x.strip()] if v else []
+
+
+def make_volume(row: Dict, rnd: random.Random) -> Dict:
+    """Volumen con la forma completa de la API (volumeInfo, saleInfo, accessInfo, searchInfo)."""
+    gb_id = row.get("gb_id") or "".join(rnd.choice("abcdefghijkLMNOPQ0123456789_-") for _ in range(12))
+    ids = []
+    if row.get("isbn13"):
+        ids.append({"type": "ISBN_13", "identifier": str(row["isbn13"])})
+    if row.get("isbn10"):
+        ids.append({"type": "ISBN_10", "identifier": str(row["isbn10"])})
+
+    volume = {
+        "title": row.get("title"),
+        "authors": _split(row.get("authors")),
+        "publisher": row.get("publisher"),
+        "publishedDate": row.get("pub_date"),
+        "description": row.get("description"),
+        "industryIdentifiers": ids,
+        "readingModes": {"text": rnd.random() < 0.5, "image": rnd.random() < 0.5},
+        "pageCount": int(float(row["pageCount"])) if row.get("pageCount") else None,
+        "printType": "BOOK",
+        "categories": _split(row.get("categories")),
+        "averageRating": round(rnd.uniform(3, 5), 1),
+        "ratingsCount": rnd.randint(1, 500),
+        "maturityRating": "NOT_MATURE",
+        "allowAnonLogging": False,
+        "contentVersion": f"{rnd.randint(0, 9)}.{rnd.randint(0, 9)}.{rnd.randint(0, 9)}.0.preview.{rnd.randint(0, 3)}",
+        "panelizationSummary": {"containsEpubBubbles": False, "containsImageBubbles": False},
+        "imageLinks": {
+            "smallThumbnail": f"http://books.google.com/books/content?id={gb_id}&printsec=frontcover&img=1&zoom=5&edge=curl&source=gbs_api",
+            "thumbnail": f"http://books.google.com/books/content?id={gb_id}&printsec=frontcover&img=1&zoom=1&edge=curl&source=gbs_api",
+        },
+        "language": row.get("language") or "en",
+        "previewLink": f"http://books.google.es/books?id={gb_id}&printsec=frontcover&hl=&cd=1&source=gbs_api",
+        "infoLink": row.get("gb_url") or f"http://books.google.es/books?id={gb_id}&hl=&source=gbs_api",
+        "canonicalVolumeLink": f"https://books.google.com/books/about/x.html?hl=&id={gb_id}",
+    }
+    if row.get("subtitle"):
+        volume["subtitle"] = row["subtitle"]
+    volume = {k: v for k, v in volume.items() if v not in (None, [])}
+
+    sale = {"country": "ES", "saleability": "NOT_FOR_SALE", "isEbook": False}
+    if row.get("price_amount"):
+        price = {"amount": float(row["price_amount"]), "currencyCode": row.get("price_currency") or "EUR"}
+        sale = {"country": "ES", "saleability": "FOR_SALE", "isEbook": True,
+                "listPrice": dict(price), "retailPrice": price,
+                "buyLink": f"https://play.google.com/store/books/details?id={gb_id}&rdid=book-{gb_id}&rdot=1&source=gbs_api",
+                "offers": [{"finskyOfferType": 1,
+                            "listPrice": {"amountInMicros": price["amount"] * 1e6, "currencyCode": price["currencyCode"]},
+                            "retailPrice": {"amountInMicros": price["amount"] * 1e6, "currencyCode": price["currencyCode"]}}]}
+
+    return {
+        "kind": "books#volume",
+        "id": gb_id,
+        "etag": "".join(rnd.choice("ABCDEFabcdef0123456789") for _ in range(11)),
+        "selfLink": f"https://www.googleapis.com/books/v1/volumes/{gb_id}",
+        "volumeInfo": volume,
+        "saleInfo": sale,
+        "accessInfo": {
+            "country": "ES", "viewability": "PARTIAL", "embeddable": True, "publicDomain": False,
+            "textToSpeechPermission": "ALLOWED",
+            "epub": {"isAvailable": True, "acsTokenLink": f"http://books.google.es/books/download/x-sample-epub.acsm?id={gb_id}&format=epub&output=acs4_fulfillment_token&dl_type=sample&source=gbs_api"},
+            "pdf": {"isAvailable": True, "acsTokenLink": f"http://books.google.es/books/download/x-sample-pdf.acsm?id={gb_id}&format=pdf&output=acs4_fulfillment_token&dl_type=sample&source=gbs_api"},
+            "webReaderLink": f"http://play.google.com/books/reader?id={gb_id}&hl=&source=gbs_api",
+            "accessViewStatus": "SAMPLE", "quoteSharingAllowed": False,
+        },
+        "searchInfo": {"textSnippet": (row.get("description") or "")[:160]},
+    }
+
+
+def make_full_response(row: Dict, seed: int = 0, total_items: int = 10) -> Dict:
+    # El primer item es el libro buscado; el resto, coincidencias parciales
+    rnd = random.Random(seed)
+    items = [make_volume(row, rnd)]
+    for i in range(total_items - 1):
+        other = dict(row, gb_id=None, gb_url=None, isbn13=None, isbn10=None,
+                     title=f"{row.get('title')} ({i + 2})")
+        items.append(make_volume(other, rnd))
+    return {"kind": "books#volumes", "totalItems": rnd.randint(total_items, 400), "items": items}
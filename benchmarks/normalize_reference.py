@@ -0,0 +1,82 @@
+# normalize_reference.py
+# ------------------------------------------
+# Versiones anteriores de las normalizaciones
+# de utils_isbn (sin cachés ni atajos), como
+# referencia de resultados y de tiempos.
+# ------------------------------------------
+
+import re
+import unicodedata
+from typing import Any, Optional, List
+from dateutil import parser as date_parser
+from datetime import datetime
+
+
+def normalize_str(val: Any) -> Optional[str]:
+    if val is None:
+        return None
+    s = str(val).strip()
+    if not s or s.lower() == "nan":
+        return None
+    s = re.sub(r"\s+", " ", s)
+    if s.endswith(".0") and s[:-2].isdigit():
+        s = s[:-2]
+    return s
+
+
+def _strip_accents(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def normalize_title(title: Any) -> Optional[str]:
+    t = normalize_str(title)
+    if not t:
+        return None
+    t = _strip_accents(t.lower())
+    t = re.sub(r"[^\w\s]", "", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def normalize_author(auth: Any) -> List[str]:
+    if not auth:
+        return []
+    if isinstance(auth, str):
+        parts = re.split(r"[|,;]", auth)
+    elif isinstance(auth, list):
+        parts = auth
+    else:
+        return []
+    return [normalize_str(p) for p in parts if normalize_str(p)]
+
+
+def get_first_author(auth: Any) -> str:
+    a = normalize_author(auth)
+    return a[0] if a else ""
+
+
+def iso_date(v: Any) -> Optional[str]:
+    if not v:
+        return None
+    s = str(v).strip()
+    if not s:
+        return None
+
+    try:
+        dt = date_parser.parse(s, default=datetime(1, 1, 1))
+        y, m, d = dt.year, dt.month, dt.day
+        if d != 1:
+            return dt.date().isoformat()
+        if m != 1:
+            return f"{y:04d}-{m:02d}"
+        return f"{y:04d}"
+    except:
+        pass
+
+    if re.match(r"^\d{4}-\d{2}-\d{2}$", s):
+        return s
+    if re.match(r"^\d{4}-\d{2}$", s):
+        return s
+    if re.match(r"^\d{4}$", s):
+        return s
+
+    return None
@@ -0,0 +1,228 @@
+# synthetic_landing.py
+# ------------------------------------------
+# Generador de landings sintéticas del tamaño
+# que se quiera: goodreads_books.json (NDJSON)
+# y googlebooks_books.csv con el formato de
+# los scrapers, vocabulario sacado de landing/
+# y proporciones controlables de cruces con
+# Google, ISBN ausentes y ediciones repetidas.
+# ------------------------------------------
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+
+GOOGLE_COLUMNS = [
+    "gb_id", "gb_url", "title", "subtitle", "authors", "publisher", "pub_date", "language",
+    "categories", "description", "pageCount", "isbn13", "isbn10", "price_amount", "price_currency",
+    "ingestion_date_google", "query_url",
+]
+
+FORMATS = ["Paperback", "Hardcover", "Kindle Edition", "ebook", "Audiobook", "Mass Market Paperback", None]
+LANGUAGES = ["english", "english", "english", "spanish", "french", "german", "italian", None]
+GOOGLE_LANGUAGES = {"english": "en", "spanish": "es", "french": "fr", "german": "de", "italian": "it"}
+EXTRA_GOOGLE_RATE = 0.2     # filas de Google sin pareja en Goodreads, respecto a las que casan
+FUZZY_SHARE = 1 / 3         # de los cruces sin ISBN, cuántos llevan el título retocado (matching aproximado)
+
+
+# -------------------------
+# Vocabulario
+# -------------------------
+
+def load_vocabulary() -> Dict[str, List[str]]:
+    """Palabras, nombres, editoriales, géneros y frases de las landings reales."""
+    with open(ROOT / "landing" / "goodreads_books.json", encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        good = json.loads(raw)
+    except ValueError:
+        good = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    gg = pd.read_csv(ROOT / "landing" / "googlebooks_books.csv", sep=";", dtype=str).fillna("")
+
+    titles = [r.get("title") or "" for r in good] + gg["title"].tolist()
+    words = sorted({w for t in titles for w in re.findall(r"[A-Za-z][A-Za-z'\-]{2,}", t)})
+    names = [a for r in good for a in (r.get("authors") or [])]
+    firsts = sorted({n.split()[0] for n in names if " " in n})
+    lasts = sorted({n.split()[-1] for n in names if " " in n})
+    publishers = sorted({r.get("publisher") for r in good if r.get("publisher")} | set(gg["publisher"]) - {""})
+    genres = sorted({g for r in good for g in (r.get("genres") or [])})
+    texts = [r.get("description") or "" for r in good] + gg["description"].tolist()
+    sentences = sorted({s.strip() for t in texts for s in re.split(r"(?<=[.!?])\s+", t) if len(s.strip()) > 20})
+    return {"words": words, "firsts": firsts, "lasts": lasts, "publishers": publishers,
+            "genres": genres, "sentences": sentences}
+
+
+# -------------------------
+# Generación
+# -------------------------
+
+def isbn13_batch(n: int, offset: int = 0) -> np.ndarray:
+    """n ISBN-13 válidos y distintos (978 + 9 dígitos + control)."""
+    body = (np.arange(offset, offset + n, dtype=np.int64) * 7919 + 123457) % 10**9
+    digits = np.zeros((n, 12), dtype=np.int64)
+    digits[:, :3] = [9, 7, 8]
+    for k in range(9):
+        digits[:, 11 - k] = (body // 10**k) % 10
+    check = (10 - (digits @ np.tile([1, 3], 6)) % 10) % 10
+    return np.array([f"978{b:09d}{c}" for b, c in zip(body.tolist(), check.tolist())], dtype=object)
+
+
+def isbn10_of(isbn13: str) -> str:
+    body = isbn13[3:12]
+    s = sum((10 - i) * int(d) for i, d in enumerate(body)) % 11
+    c = (11 - s) % 11
+    return body + ("X" if c == 10 else str(c))
+
+
+def _pick(rng: np.random.Generator, values: List, n: int) -> List:
+    return [values[i] for i in rng.integers(0, len(values), n)]
+
+
+def make_works(n: int, missing_isbn: float, vocab: Dict[str, List[str]], rng: np.random.Generator) -> Dict[str, List]:
+    """Obras distintas (columnas como listas): lo que comparten todas sus ediciones."""
+    words = vocab["words"]
+    n_words = rng.integers(2, 8, n)
+    title_idx = rng.integers(0, len(words), n_words.sum())
+    cuts = np.cumsum(n_words)[:-1]
+    titles = [" ".join(words[i] for i in part) for part in np.split(title_idx, cuts)]
+    titles = [f"{t} {k}" for t, k in zip(titles, range(n))]     # únicos aunque el vocabulario sea pequeño
+
+    n_auth = rng.choice([1, 1, 1, 2, 2, 3], n)
+    firsts = _pick(rng, vocab["firsts"], int(n_auth.sum()))
+    lasts = _pick(rng, vocab["lasts"], int(n_auth.sum()))
+    full = [f"{a} {b}" for a, b in zip(firsts, lasts)]
+    authors = [full[s:e] for s, e in zip(np.r_[0, np.cumsum(n_auth)[:-1]], np.cumsum(n_auth))]
+
+    isbn13 = isbn13_batch(n)
+    isbn13[rng.random(n) < missing_isbn] = None
+    return {
+        "title": titles,
+        "authors": authors,
+        "publisher": _pick(rng, vocab["publishers"], n),
+        "year": rng.integers(1950, 2026, n).tolist(),
+        "isbn13": isbn13.tolist(),
+        "language": _pick(rng, LANGUAGES, n),
+    }
+
+
+def _description(rng: np.random.Generator, sentences: List[str]) -> str:
+    return " ".join(_pick(rng, sentences, int(rng.integers(1, 8))))
+
+
+def write_goodreads(path: Path, works: Dict[str, List], rows: int, vocab: Dict[str, List[str]],
+                    rng: np.random.Generator) -> np.ndarray:
+    """NDJSON de `rows` fichas; las que pasan de len(works) son ediciones repetidas. Devuelve la obra de cada ficha."""
+    n_works = len(works["title"])
+    work_of = np.r_[np.arange(min(rows, n_works)), rng.integers(0, n_works, max(0, rows - n_works))]
+    rng.shuffle(work_of)
+    month = rng.integers(1, 13, rows)
+    day = rng.integers(1, 29, rows)
+    secs = rng.integers(0, 86400, rows)
+    genres = vocab["genres"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i, k in enumerate(work_of.tolist()):
+            work = {c: v[k] for c, v in works.items()}
+            date = None if rng.random() < 0.03 else f"{work['year']}-{month[i]:02d}-{day[i]:02d}"
+            ts = int(pd.Timestamp(date).timestamp() * 1000) if date else None
+            rec = {
+                "id": str(i),
+                "url": f"https://www.goodreads.com/book/show/{10_000_000 + i}",
+                "title": work["title"],
+                "authors": work["authors"],
+                "rating_value": round(float(rng.uniform(2.5, 4.8)), 2),
+                "rating_count": int(rng.integers(0, 200_000)),
+                "isbn": isbn10_of(work["isbn13"]) if work["isbn13"] else None,
+                "isbn13": work["isbn13"],
+                "format": FORMATS[int(rng.integers(0, len(FORMATS)))],
+                "num_pages": None if rng.random() < 0.05 else int(rng.integers(40, 1200)),
+                "publisher": work["publisher"],
+                "publication_timestamp": ts,
+                "publication_date": date,
+                "language": work["language"],
+                "genres": list(dict.fromkeys(_pick(rng, genres, int(rng.integers(0, 10))))),
+                "description": None if rng.random() < 0.05 else _description(rng, vocab["sentences"]),
+                "ingestion_date": f"2025-11-22 {secs[i] // 3600:02d}:{secs[i] // 60 % 60:02d}:{secs[i] % 60:02d}",
+            }
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    return work_of
+
+
+def write_google(path: Path, works: Dict[str, List], match_rate: float, vocab: Dict[str, List[str]],
+                 rng: np.random.Generator) -> int:
+    """CSV con una fila por obra que casa (por ISBN, título + autor o aproximado) y filas sueltas."""
+    n_works = len(works["title"])
+    matched = np.flatnonzero(rng.random(n_works) < match_rate).tolist()
+    extra = int(len(matched) * EXTRA_GOOGLE_RATE)
+    others = make_works(extra, 0.0, vocab, rng)
+    others["isbn13"] = isbn13_batch(extra, offset=n_works).tolist()
+    others["title"] = ["Other " + t for t in others["title"]]
+    sel = {c: [works[c][k] for k in matched] + others[c] for c in works}
+    n = len(sel["title"])
+
+    titles = sel["title"]
+    no_isbn = np.array([x is None for x in sel["isbn13"]], dtype=bool)
+    fuzzy = no_isbn & (rng.random(n) < FUZZY_SHARE)
+    for i in np.flatnonzero(fuzzy):
+        t = titles[i]
+        titles[i] = t[0] + t[2:] if len(t) > 12 else t + "s"   # una letra menos: ya no casa exacto
+
+    month = rng.integers(1, 13, n)
+    day = rng.integers(1, 29, n)
+    granularity = rng.integers(0, 3, n)
+    dates = [str(y) if g == 0 else f"{y}-{m:02d}" if g == 1 else f"{y}-{m:02d}-{d:02d}"
+             for y, m, d, g in zip(sel["year"], month.tolist(), day.tolist(), granularity.tolist())]
+    priced = rng.random(n) < 0.3
+    gb_ids = [f"gb{i:010d}" for i in rng.permutation(n)]
+    secs = rng.integers(0, 86400, n)
+    isbn13 = sel["isbn13"]
+    df = pd.DataFrame({
+        "gb_id": gb_ids,
+        "gb_url": [f"http://books.google.es/books?id={g}&source=gbs_api" for g in gb_ids],
+        "title": titles,
+        "subtitle": [None] * n,
+        "authors": [", ".join(a) for a in sel["authors"]],
+        "publisher": sel["publisher"],
+        "pub_date": dates,
+        "language": [GOOGLE_LANGUAGES.get(lang) for lang in sel["language"]],
+        "categories": _pick(rng, vocab["genres"], n),
+        "description": [_description(rng, vocab["sentences"]) for _ in range(n)],
+        "pageCount": rng.integers(40, 1200, n).astype(float),
+        "isbn13": isbn13,
+        "isbn10": [isbn10_of(x) if x else None for x in isbn13],
+        "price_amount": np.where(priced, np.round(rng.uniform(0, 60, n), 2), np.nan),
+        "price_currency": np.where(priced, "EUR", None),
+        "ingestion_date_google": [f"2025-11-22 {s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in secs.tolist()],
+        "query_url": [f"https://www.googleapis.com/books/v1/volumes?q=isbn:{x}" if x else None for x in isbn13],
+    }, columns=GOOGLE_COLUMNS)
+    df = df.sample(frac=1.0, random_state=int(rng.integers(0, 2**31)))
+    df.to_csv(path, sep=";", index=False)
+    return n
+
+
+def write_landing(out: Path, rows: int, match_rate: float = 0.6, missing_isbn: float = 0.15,
+                  duplicate_rate: float = 0.1, seed: int = 0) -> Dict:
+    """
+    Escribe out/landing/goodreads_books.json y googlebooks_books.csv:
+      - rows:           fichas de Goodreads
+      - match_rate:     fracción de obras con fila en Google
+      - missing_isbn:   fracción de obras sin ISBN (cruce por título + autor o aproximado)
+      - duplicate_rate: fracción de fichas que son otra edición de una obra ya vista
+                        (mismo canonical_id: trabajo para la deduplicación)
+    """
+    rng = np.random.default_rng(seed)
+    vocab = load_vocabulary()
+    landing = Path(out) / "landing"
+    landing.mkdir(parents=True, exist_ok=True)
+
+    works = make_works(max(1, round(rows * (1 - duplicate_rate))), missing_isbn, vocab, rng)
+    write_goodreads(landing / "goodreads_books.json", works, rows, vocab, rng)
+    google_rows = write_google(landing / "googlebooks_books.csv", works, match_rate, vocab, rng)
+    return {"goodreads_rows": rows, "google_rows": google_rows, "works": len(works["title"]),
+            "match_rate": match_rate, "missing_isbn": missing_isbn,
+            "duplicate_rate": duplicate_rate, "seed": seed}
@@ -0,0 +1,128 @@
+# dedup_canonical.py
+# ------------------------------------------
+# Deduplicación por canonical_id en una sola
+# pasada: para cada clave se guarda solo la
+# mejor fila vista (criterios configurables),
+# y las que pierden quedan para auditoría.
+# Sirve igual en memoria y por bloques.
+# ------------------------------------------
+
+from typing import Dict, List, Sequence, Tuple
+
+
+DEDUP_CRITERIA = ("completeness", "freshest", "source")
+DEFAULT_CRITERIA = ("completeness",)
+SOURCES = ("goodreads", "google")
+DEFAULT_PREFERRED_SOURCE = "goodreads"
+
+INGESTION_COLUMNS = ("ingestion_date_goodreads", "ingestion_date_google")
+
+
+def _isnull(v) -> bool:
+    return v is None or (isinstance(v, float) and v != v)
+
+
+def completeness(row: Dict) -> int:
+    return sum(1 for v in row.values() if not _isnull(v))
+
+
+def freshness(row: Dict) -> str:
+    # fechas ISO-8601: la comparación de cadenas respeta el orden temporal
+    dates = [row.get(c) for c in INGESTION_COLUMNS]
+    return max((str(d) for d in dates if not _isnull(d)), default="")
+
+
+def parse_criteria(text: str) -> Tuple[str, ...]:
+    """"freshest,completeness" → ("freshest", "completeness"); ValueError si hay desconocidos."""
+    criteria = tuple(dict.fromkeys(c.strip().lower() for c in text.split(",") if c.strip()))
+    unknown = [c for c in criteria if c not in DEDUP_CRITERIA]
+    if unknown or not criteria:
+        raise ValueError(f"criterios no válidos: {', '.join(unknown) or '(ninguno)'}; "
+                         f"disponibles: {', '.join(DEDUP_CRITERIA)}")
+    return criteria
+
+
+class CanonicalDedup:
+    """
+    Mejor fila por canonical_id en una pasada (tabla hash clave → (rango,
+    posición)), sin ordenar la entrada. El rango compara los criterios en el
+    orden dado:
+      - completeness: número de campos no nulos
+      - freshest:     fecha de ingesta más reciente (Goodreads o Google)
+      - source:       source_preference igual a `preferred_source`
+    A igualdad gana la primera fila de la entrada. Las filas se pasan con su
+    posición global (`add`), así que funciona igual por bloques.
+    """
+
+    def __init__(self, criteria: Sequence[str] = DEFAULT_CRITERIA,
+                 preferred_source: str = DEFAULT_PREFERRED_SOURCE):
+        unknown = [c for c in criteria if c not in DEDUP_CRITERIA]
+        if unknown or not criteria:
+            raise ValueError(f"Criterios de deduplicación no válidos: {unknown} (usar {', '.join(DEDUP_CRITERIA)})")
+        if preferred_source not in SOURCES:
+            raise ValueError(f"Fuente preferida no válida: {preferred_source} (usar {', '.join(SOURCES)})")
+        self.criteria = tuple(criteria)
+        self.preferred_source = preferred_source
+        self.best: Dict[str, Tuple[Tuple, int]] = {}
+        self._losers: Dict[int, Tuple[str, Tuple]] = {}
+        self.losers: List[Dict] = []
+
+    def rank(self, row: Dict) -> Tuple:
+        out = []
+        for c in self.criteria:
+            if c == "completeness":
+                out.append(completeness(row))
+            elif c == "freshest":
+                out.append(freshness(row))
+            else:
+                out.append(int(row.get("source_preference") == self.preferred_source))
+        return tuple(out)
+
+    def add(self, row: Dict, pos: int):
+        cid = row["canonical_id"]
+        rank = self.rank(row)
+        cur = self.best.get(cid)
+        if cur is None:
+            self.best[cid] = (rank, pos)
+        elif rank > cur[0]:
+            self._losers[cur[1]] = (cid, cur[0])
+            self.best[cid] = (rank, pos)
+        else:
+            self._losers[pos] = (cid, rank)
+
+    def is_loser(self, pos: int) -> bool:
+        return pos in self._losers
+
+    def reason(self, pos: int) -> str:
+        """Criterio por el que perdió la fila `pos`: el primero en que la ganadora es mejor."""
+        cid, rank = self._losers[pos]
+        winner = self.best[cid][0]
+        for c, a, b in zip(self.criteria, rank, winner):
+            if a != b:
+                return c
+        return "position"
+
+    @property
+    def duplicates(self) -> int:
+        return len(self._losers)
+
+    def select(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Deduplicación en memoria: devuelve una fila por canonical_id ordenadas
+        por completitud descendente (y posición), y deja en `self.losers` las
+        descartadas con la columna dedup_reason.
+        """
+        for pos, row in enumerate(rows):
+            self.add(row, pos)
+        # solo se ordenan las ganadoras, y por una clave entera
+        order = sorted((pos for _, pos in self.best.values()),
+                       key=lambda p: (-completeness(rows[p]), p))
+        self.losers = [dict(rows[p], dedup_reason=self.reason(p)) for p in sorted(self._losers)]
+        return [rows[p] for p in order]
+
+
+def select_best(rows: List[Dict], criteria: Sequence[str] = DEFAULT_CRITERIA,
+                preferred_source: str = DEFAULT_PREFERRED_SOURCE) -> Tuple[List[Dict], List[Dict]]:
+    """(ganadoras, descartadas) de `rows` con CanonicalDedup."""
+    dedup = CanonicalDedup(criteria, preferred_source)
+    return dedup.select(rows), dedup.losers
@@ -1,16 +1,75 @@
+import argparse
+import asyncio
+import hashlib
 import json
 import time
+import aiohttp
 import requests
 import pandas as pd
 import os
-from typing import Dict, Any, Optional
-
-GOOGLE_API_URL = "https://www.googleapis.com/books/v1/volumes"
-HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlencode
+
+from utils.utils_http import AsyncTokenBucket, retry_after_seconds
+from utils.utils_cache import QueryCache
+from utils.utils_runmetrics import RunMetrics, get_logger
+from utils.utils_isbn import normalize_str, normalize_title, get_first_author, to_isbn13
+
+# Sobrescribible para apuntar a un servidor local (benchmarks/fake_http_server.py)
+GOOGLE_API_URL = os.environ.get("GOOGLE_API_URL", "https://www.googleapis.com/books/v1/volumes")
+# Google solo comprime la respuesta si el User-Agent contiene "gzip"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) books-pipeline (gzip)",
+    "Accept-Encoding": "gzip",
+}
+
+# Modo ligero: un solo resultado y solo los campos que lee extract_googlebooks_fields
+LEAN_MODE = True
+LEAN_FIELDS = (
+    "items("
+    "id,"
+    "volumeInfo(title,subtitle,authors,publisher,publishedDate,language,categories,"
+    "description,pageCount,industryIdentifiers,infoLink),"
+    "saleInfo(saleability,retailPrice)"
+    ")"
+)
 
 LANDING_PATH = "landing/googlebooks_books.csv"
 GOODREADS_JSON = "landing/goodreads_books.json"
 
+# Modo incremental: estado por libro de Goodreads y frecuencia de checkpoint
+CHECKPOINT_PATH = "landing/googlebooks_checkpoint.json"
+CHECKPOINT_EVERY = 100
+
+LANDING_COLUMNS = [
+    "gb_id", "gb_url", "title", "subtitle", "authors", "publisher",
+    "pub_date", "language", "categories", "description", "pageCount",
+    "isbn13", "isbn10", "price_amount", "price_currency",
+    "ingestion_date_google", "query_url"
+]
+
+# Motor asíncrono: peticiones simultáneas, ritmo global y timeout por petición
+MAX_CONCURRENCY = 8
+REQUESTS_PER_SECOND = 5.0
+REQUEST_TIMEOUT = 20
+MAX_RETRIES = 2
+
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+
+# Caché de respuestas: las consultas sin resultados caducan antes
+CACHE_DB = "cache/googlebooks_queries.sqlite"
+CACHE_TTL = 30 * 24 * 3600
+NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+
+QUERY_CACHE = QueryCache(CACHE_DB, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL)
+
+# Tiempos por etapa, latencias y contadores (docs/run_metrics.json). Los mensajes
+# por libro y por petición salen a nivel DEBUG (--log-level DEBUG para verlos)
+RUN_METRICS_PATH = "docs/run_metrics.json"
+RUN = RunMetrics("enrich_googlebooks")
+LOG = get_logger("enrich_googlebooks")
+
 
 # --------------------------------------------------
 # 1️⃣ Cargar JSON de Goodreads
@@ -18,55 +77,101 @@ GOODREADS_JSON = "landing/goodreads_books.json"
 def load_goodreads_json() -> list:
     print("[INFO] Cargando goodreads_books.json...")
     with open(GOODREADS_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+        text = f.read()
+
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+
+    # NDJSON (salida en streaming del scraper). Si el scraper sigue escribiendo
+    # (orquestador), la última línea puede estar a medias: se deja para la próxima
+    if not text.endswith("\n"):
+        text = text[:text.rfind("\n") + 1]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
 
 
 # --------------------------------------------------
 # 2️⃣ Hacer búsqueda en Google Books
 # --------------------------------------------------
+def first_item(data: Optional[Dict], api_url: str) -> Optional[Dict]:
+    if not data or "items" not in data:
+        return None
+    item = dict(data["items"][0])
+    item["_query_url"] = api_url
+    return item
+
+
+def request_url(api_url: str, lean: Optional[bool] = None) -> str:
+    # api_url (?q=...) es lo que se guarda como query_url; la petición real
+    # añade la proyección de campos en modo ligero
+    if not (LEAN_MODE if lean is None else lean):
+        return api_url
+    return f"{api_url}&{urlencode({'maxResults': 1, 'fields': LEAN_FIELDS})}"
+
+
+def cache_key(query: str) -> str:
+    # Las proyecciones ligeras y las respuestas completas no son intercambiables:
+    # cada modo tiene sus propias entradas en la caché
+    return f"{'lean' if LEAN_MODE else 'full'}:{query}"
+
+
 def google_books_search(query: str) -> Optional[Dict]:
     api_url = f"{GOOGLE_API_URL}?q={query}"
-    print(f"[DEBUG] API call: {api_url}")
+
+    hit, data = QUERY_CACHE.get(cache_key(query))
+    if hit:
+        return first_item(data, api_url)
+
+    LOG.debug("API call: %s", api_url)
 
     try:
-        r = requests.get(api_url, headers=HEADERS, timeout=20)
+        t0 = time.perf_counter()
+        r = SESSION.get(request_url(api_url), timeout=REQUEST_TIMEOUT)
+        RUN.observe("googlebooks", time.perf_counter() - t0)
+        RUN.count(f"http_{r.status_code}")
         if r.status_code != 200:
-            print(f"[WARNING] Error HTTP {r.status_code}")
+            LOG.warning("Error HTTP %s", r.status_code)
             return None
 
         data = r.json()
-        if "items" not in data:
-            return None
-
-        item = data["items"][0]
-        item["_query_url"] = api_url
-        return item
+        QUERY_CACHE.put(cache_key(query), data)
+        return first_item(data, api_url)
 
     except Exception as e:
-        print(f"[ERROR] Excepción en la búsqueda: {e}")
+        RUN.count("http_errors")
+        LOG.error("Excepción en la búsqueda: %s", e)
         return None
 
 
 # --------------------------------------------------
 # 3️⃣ Estrategia de búsqueda combinada
 # --------------------------------------------------
-def query_google_books(isbn13: Optional[str], isbn10: Optional[str], title: str, authors: list) -> Optional[Dict]:
-    clean_title = title.replace('"', "").replace("'", "").strip()
+def build_queries(isbn13: Optional[str], isbn10: Optional[str], title: str, authors: list) -> List[str]:
+    clean_title = (title or "").replace('"', "").replace("'", "").strip()
     author = authors[0] if isinstance(authors, list) and authors else ""
 
-    queries = [
-        f"isbn:{isbn13}" if isbn13 else None,
-        f"isbn:{isbn10}" if isbn10 else None,
+    # isbn: busca por ISBN-10 y ISBN-13 indistintamente; si los dos son el
+    # mismo libro basta una consulta, con el ISBN-13 normalizado
+    isbns = []
+    for raw in (isbn13, isbn10):
+        if raw:
+            isbn = to_isbn13(raw) or raw
+            if isbn not in isbns:
+                isbns.append(isbn)
+
+    queries = [f"isbn:{isbn}" for isbn in isbns] + [
         f'intitle:"{clean_title}" inauthor:"{author}"' if clean_title and author else None,
         f'intitle:"{clean_title}"' if clean_title else None
     ]
+    return [q for q in queries if q]
 
-    for query in filter(None, queries):
+
+def query_google_books(isbn13: Optional[str], isbn10: Optional[str], title: str, authors: list) -> Optional[Dict]:
+    for query in build_queries(isbn13, isbn10, title, authors):
         item = google_books_search(query)
         if item:
             return item
 
-    print(f"[INFO] Sin resultados para: {title}")
+    LOG.debug("Sin resultados para: %s", title)
     return None
 
 
@@ -119,45 +224,288 @@ def extract_googlebooks_fields(item: Dict[str, Any]) -> Dict[str, Any]:
 
 
 # --------------------------------------------------
-# 5️⃣ Guardar resultado CSV
+# 5️⃣ Motor asíncrono de enriquecimiento
+# --------------------------------------------------
+async def fetch_volumes_async(session: aiohttp.ClientSession, limiter: AsyncTokenBucket,
+                              api_url: str) -> Optional[Dict]:
+    # Respuesta cruda de /volumes, o None si hubo error HTTP / de red
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            RUN.count("http_retries")
+        await limiter.acquire()
+        LOG.debug("API call: %s", api_url)
+        try:
+            t0 = time.perf_counter()
+            async with session.get(request_url(api_url)) as r:
+                RUN.count(f"http_{r.status}")
+                if r.status == 429:
+                    RUN.observe("googlebooks", time.perf_counter() - t0)
+                    limiter.backoff(retry_after_seconds(r))
+                    continue
+                if r.status != 200:
+                    RUN.observe("googlebooks", time.perf_counter() - t0)
+                    LOG.warning("Error HTTP %s", r.status)
+                    return None
+                data = await r.json(content_type=None)
+                RUN.observe("googlebooks", time.perf_counter() - t0)
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            RUN.count("http_errors")
+            LOG.error("Excepción en la búsqueda: %r", e)
+            return None
+
+    LOG.warning("Demasiados 429 para: %s", api_url)
+    return None
+
+
+async def google_books_search_async(session: aiohttp.ClientSession, limiter: AsyncTokenBucket,
+                                    query: str, inflight: Dict[str, asyncio.Future]) -> Optional[Dict]:
+    """
+    Igual que google_books_search pero asíncrona. Si la misma consulta ya está
+    en vuelo (p. ej. dos ediciones con el mismo título) se espera a esa
+    petición en lugar de lanzar otra.
+    """
+    api_url = f"{GOOGLE_API_URL}?q={query}"
+    key = QueryCache.normalize(query)
+
+    if key in inflight:
+        QUERY_CACHE.count("coalesced")
+        return first_item(await asyncio.shield(inflight[key]), api_url)
+
+    hit, data = QUERY_CACHE.get(cache_key(query))
+    if hit:
+        return first_item(data, api_url)
+
+    fut = asyncio.get_running_loop().create_future()
+    inflight[key] = fut
+    data = None
+    try:
+        data = await fetch_volumes_async(session, limiter, api_url)
+        if data is not None:
+            QUERY_CACHE.put(cache_key(query), data)
+    finally:
+        fut.set_result(data)
+        del inflight[key]
+
+    return first_item(data, api_url)
+
+
+async def query_google_books_async(session: aiohttp.ClientSession, limiter: AsyncTokenBucket,
+                                   book: Dict, inflight: Dict[str, asyncio.Future]) -> Optional[Dict]:
+    queries = build_queries(book.get("isbn13"), book.get("isbn"),
+                            book.get("title", ""), book.get("authors", []))
+    for query in queries:
+        item = await google_books_search_async(session, limiter, query, inflight)
+        if item:
+            return item
+
+    LOG.debug("Sin resultados para: %s", book.get("title"))
+    return None
+
+
+async def enrich_books_async(books: List[Dict], concurrency: int = MAX_CONCURRENCY,
+                             rate: float = REQUESTS_PER_SECOND,
+                             timeout: float = REQUEST_TIMEOUT) -> List[Optional[Dict]]:
+    """
+    Enriquece `books` con `concurrency` tareas sobre una única ClientSession
+    (keep-alive) y un token bucket común. Devuelve una fila por libro, en el
+    mismo orden, o None si no hubo coincidencia.
+    """
+    limiter = AsyncTokenBucket(rate)
+    inflight: Dict[str, asyncio.Future] = {}
+    results: List[Optional[Dict]] = [None] * len(books)
+    next_idx = iter(range(len(books)))
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=client_timeout) as session:
+        async def worker():
+            for i in next_idx:
+                book = books[i]
+                LOG.debug("Procesando: %s", book.get("title"))
+                with RUN.stage("query", rows=1):
+                    item = await query_google_books_async(session, limiter, book, inflight)
+                if item:
+                    with RUN.stage("parse", rows=1):
+                        results[i] = extract_googlebooks_fields(item)
+                else:
+                    LOG.debug("Libro sin coincidencia en Google Books → omitido")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(books))))))
+
+    return results
+
+
+def enrich_books(books: List[Dict], **kwargs) -> List[Dict]:
+    return [row for row in asyncio.run(enrich_books_async(books, **kwargs)) if row]
+
+
+# --------------------------------------------------
+# 6️⃣ Guardar resultado CSV
 # --------------------------------------------------
 def save_googlebooks_csv(rows: list):
     df = pd.DataFrame(rows)
+    df = df.reindex(columns=LANDING_COLUMNS)
 
-    ordered_cols = [
-        "gb_id", "gb_url", "title", "subtitle", "authors", "publisher",
-        "pub_date", "language", "categories", "description", "pageCount",
-        "isbn13", "isbn10", "price_amount", "price_currency",
-        "ingestion_date_google", "query_url"
-    ]
+    # Escritura atómica: un corte a mitad nunca deja un CSV truncado
+    os.makedirs(os.path.dirname(LANDING_PATH) or ".", exist_ok=True)
+    tmp = f"{LANDING_PATH}.tmp"
+    df.to_csv(tmp, index=False, encoding="utf-8", sep=";")
+    os.replace(tmp, LANDING_PATH)
+    print(f"[INFO] Archivo generado: {LANDING_PATH}")
 
-    df = df.reindex(columns=ordered_cols)
 
-    os.makedirs("landing", exist_ok=True)
-    df.to_csv(LANDING_PATH, index=False, encoding="utf-8", sep=";")
-    print(f"[INFO] Archivo generado: {LANDING_PATH}")
+# --------------------------------------------------
+# 7️⃣ Enriquecimiento incremental
+# --------------------------------------------------
+def record_keys(isbn13: Any, isbn10: Any, title: Any, authors: Any) -> List[str]:
+    # Claves de identidad de un libro, de más a menos fiable
+    keys = []
+    if normalize_str(isbn13):
+        keys.append(f"isbn13:{normalize_str(isbn13)}")
+    if normalize_str(isbn10):
+        keys.append(f"isbn10:{normalize_str(isbn10).upper()}")
+    tnorm, afirst = normalize_title(title), get_first_author(authors)
+    if tnorm and afirst:
+        keys.append(f"ta:{tnorm}||{afirst.lower()}")
+    return keys
+
+
+def goodreads_key(book: Dict) -> str:
+    # Sin ISBN ni título + autor, el libro se identifica por su id de Goodreads
+    # (o su URL): así queda en el checkpoint y no se vuelve a consultar cada vez
+    keys = record_keys(book.get("isbn13"), book.get("isbn"), book.get("title"), book.get("authors"))
+    if keys:
+        return keys[0]
+    if normalize_str(book.get("id")):
+        return f"gr:{normalize_str(book.get('id'))}"
+    if normalize_str(book.get("url")):
+        return f"url:{normalize_str(book.get('url'))}"
+    return f"fp:{goodreads_fingerprint(book)}"
+
+
+def goodreads_fingerprint(book: Dict) -> str:
+    # Solo los campos que determinan las consultas a la API
+    fields = [book.get("isbn13"), book.get("isbn"), book.get("title"), get_first_author(book.get("authors"))]
+    return hashlib.sha1(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_landing_rows() -> List[Dict]:
+    if not os.path.exists(LANDING_PATH):
+        return []
+    df = pd.read_csv(LANDING_PATH, sep=";", dtype=str)
+    return [{k: (None if pd.isna(v) else v) for k, v in r.items()} for r in df.to_dict(orient="records")]
+
+
+def load_checkpoint() -> Dict[str, Dict]:
+    if not os.path.exists(CHECKPOINT_PATH):
+        return {}
+    with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("records", {})
+
+
+def save_checkpoint(state: Dict[str, Dict], rows_by_id: Dict[str, Dict], goodreads: List[Dict]):
+    # Solo se conservan las filas a las que apunta algún libro actual, en orden de Goodreads
+    keep = []
+    for book in goodreads:
+        gb_id = (state.get(goodreads_key(book)) or {}).get("gb_id")
+        if gb_id and gb_id in rows_by_id and gb_id not in keep:
+            keep.append(gb_id)
+    save_googlebooks_csv([rows_by_id[g] for g in keep])
+
+    tmp = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "records": state}, f, ensure_ascii=False)
+    os.replace(tmp, CHECKPOINT_PATH)
+
+
+def bootstrap_state(goodreads: List[Dict], rows: List[Dict]) -> Dict[str, Dict]:
+    """
+    Sin checkpoint previo: un libro se da por enriquecido si alguna fila de la
+    landing existente coincide por ISBN13, ISBN10 o título + primer autor, o
+    si la fila salió de una de las consultas que generaría el libro (query_url).
+    """
+    index = {}
+    for row in rows:
+        keys = record_keys(row.get("isbn13"), row.get("isbn10"), row.get("title"), row.get("authors"))
+        if row.get("query_url") and "?q=" in row["query_url"]:
+            keys.append("q:" + QueryCache.normalize(row["query_url"].split("?q=", 1)[1]))
+        for k in keys:
+            index.setdefault(k, row.get("gb_id"))
+
+    state = {}
+    for book in goodreads:
+        key = goodreads_key(book)
+        keys = record_keys(book.get("isbn13"), book.get("isbn"), book.get("title"), book.get("authors"))
+        keys += ["q:" + QueryCache.normalize(q) for q in
+                 build_queries(book.get("isbn13"), book.get("isbn"), book.get("title", ""), book.get("authors", []))]
+        gb_id = next((index[k] for k in keys if k in index), None)
+        if key and gb_id:
+            state[key] = {"fp": goodreads_fingerprint(book), "gb_id": gb_id, "checked_at": time.time()}
+    return state
+
+
+def pending_books(goodreads: List[Dict], state: Dict[str, Dict]) -> List[Dict]:
+    # Nuevos, cambiados, o sin coincidencia y con la caché negativa ya vencida
+    pending = []
+    for book in goodreads:
+        entry = state.get(goodreads_key(book))
+        if entry is None or entry.get("fp") != goodreads_fingerprint(book):
+            pending.append(book)
+        elif entry.get("gb_id") is None and time.time() - entry.get("checked_at", 0) >= NEGATIVE_CACHE_TTL:
+            pending.append(book)
+    return pending
+
+
+def enrich_incremental(goodreads: List[Dict], full: bool = False):
+    rows = [] if full else load_landing_rows()
+    state = {} if full else load_checkpoint()
+    if not full and not state and rows:
+        state = bootstrap_state(goodreads, rows)
+        print(f"[INFO] Checkpoint inicial a partir de la landing: {len(state)} libros ya enriquecidos")
+
+    rows_by_id = {r["gb_id"]: r for r in rows if r.get("gb_id")}
+    todo = pending_books(goodreads, state)
+    print(f"[INFO] Goodreads: {len(goodreads)} | pendientes de enriquecer: {len(todo)}")
+
+    for start in range(0, len(todo), CHECKPOINT_EVERY):
+        batch = todo[start:start + CHECKPOINT_EVERY]
+        for book, row in zip(batch, asyncio.run(enrich_books_async(batch))):
+            key = goodreads_key(book)
+            if row:
+                rows_by_id[row["gb_id"]] = row
+            state[key] = {"fp": goodreads_fingerprint(book),
+                          "gb_id": row["gb_id"] if row else None,
+                          "checked_at": time.time()}
+        with RUN.stage("write", rows=len(batch)):
+            save_checkpoint(state, rows_by_id, goodreads)
+        print(f"[INFO] Checkpoint: {min(start + CHECKPOINT_EVERY, len(todo))}/{len(todo)}")
+
+    if not todo:
+        save_checkpoint(state, rows_by_id, goodreads)
 
 
 # --------------------------------------------------
 # 🚀 MAIN
 # --------------------------------------------------
 if __name__ == "__main__":
-    goodreads = load_goodreads_json()
-
-    enriched_rows = []
-    for book in goodreads:
-        print(f"\n📘 Procesando: {book.get('title')}")
-        item = query_google_books(
-            book.get("isbn13"),
-            book.get("isbn"),
-            book.get("title", ""),
-            book.get("authors", [])
-        )
-        time.sleep(0.5)
-
-        if item:
-            enriched_rows.append(extract_googlebooks_fields(item))
-        else:
-            print("[INFO] Libro sin coincidencia en Google Books → omitido")
+    ap = argparse.ArgumentParser(description="Enriquecimiento con Google Books")
+    ap.add_argument("--full", action="store_true",
+                    help="re-enriquecer todos los libros ignorando la landing y el checkpoint")
+    ap.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                    help="nivel de log; DEBUG muestra cada libro y cada petición (por defecto INFO)")
+    ap.add_argument("--profile-stage",
+                    help="perfilar con cProfile una etapa (query, parse, write) y guardar el .prof en docs/")
+    args = ap.parse_args()
+    if args.log_level:
+        get_logger("enrich_googlebooks", args.log_level)
+    if args.profile_stage:
+        RUN.profile_stage = args.profile_stage
 
-    save_googlebooks_csv(enriched_rows)
+    goodreads = load_goodreads_json()
+    enrich_incremental(goodreads, full=args.full)
+    print(f"[INFO] Caché de consultas: {QUERY_CACHE.stats} (acierto {QUERY_CACHE.hit_rate()}%)")
+    RUN.record("query_cache", dict(QUERY_CACHE.stats, hit_rate=QUERY_CACHE.hit_rate()))
+    RUN.write(RUN_METRICS_PATH)
+    RUN.print_summary()
@@ -1,11 +1,16 @@
+import argparse
+import hashlib
 import json
 import re
+from collections import Counter
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # -------------------------
 # IMPORTS EXTERNALIZADOS
@@ -17,11 +22,34 @@ from utils.utils_isbn import (
     normalize_author,
     get_first_author,
     iso_date,
-    canonical_id_from_data
+    canonical_id_from_data,
+    isbn13_key,
+    normalize_categories,
+    safe_decimal,
+    normalize_currency
 )
 
+from merge_columnar import match_columnar, merge_columnar
+
+from dedup_canonical import (
+    CanonicalDedup, DEFAULT_CRITERIA, DEFAULT_PREFERRED_SOURCE, SOURCES, completeness, parse_criteria
+)
+from utils.utils_fuzzy import FuzzyIndex, FUZZY_THRESHOLD
+from utils.utils_rawstore import RawStore
+from utils.utils_metrics import MetricsAccumulator
+from utils.utils_runmetrics import RunMetrics
+
 from utils.utils_quality import (
+    DEFAULT_FORMATS,
+    DETAIL_SCHEMA,
+    DIM_BOOK_SCHEMA,
+    DUPLICATES_SCHEMA,
+    PUB_YEAR_BUCKET,
+    conform_table,
+    parse_formats,
     save_dataframe_robust,
+    save_dataset_partitioned,
+    typed_frame,
     write_quality_metrics,
     write_schema_markdown
 )
@@ -45,8 +73,20 @@ GOOGLE_PARQUET = LANDING_DIR / "googlebooks_books.parquet"
 GOOGLE_CSV = LANDING_DIR / "googlebooks_books.csv"
 
 DIM_BOOK = STANDARD_DIR / "dim_book.parquet"
+DIM_BOOK_DATASET = STANDARD_DIR / "dim_book_dataset"   # opcional: particionado por año y idioma
+RAW_STORE = STANDARD_DIR / "raw_store.sqlite"           # registros crudos del detalle, por hash
+DUPLICATES = STANDARD_DIR / "dim_book_duplicates.parquet"  # filas descartadas en la deduplicación
 DETAIL = STANDARD_DIR / "book_source_detail.parquet"
 METRICS = DOCS_DIR / "quality_metrics.json"
+RUN_METRICS = DOCS_DIR / "run_metrics.json"      # tiempos por etapa de la última ejecución
+
+# Estado del modo incremental: huella y canonical_id por registro de Goodreads
+INCREMENTAL_STATE = STANDARD_DIR / "_incremental_state.json"
+STATE_VERSION = 3
+
+ENGINES = ("columnar", "records")
+
+RUN = RunMetrics("integrate_pipeline")
 
 
 # -------------------------
@@ -57,18 +97,23 @@ def now_ts() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
-def safe_read_goodreads(path: Path) -> pd.DataFrame:
+def read_goodreads_records(path: Path) -> List[Dict]:
+    """
+    Registros de Goodreads tal cual vienen en la landing (array JSON o NDJSON).
+    Son los que se guardan en el RawStore: el DataFrame ya tiene los enteros
+    pasados a float y las claves ausentes rellenas con NaN.
+    """
     if not path.exists():
         print(f"[WARN] No existe {path}")
-        return pd.DataFrame()
+        return []
 
     try:
         with open(path, "r", encoding="utf-8") as f:
             raw = json.load(f)
         if isinstance(raw, list):
-            return pd.DataFrame(raw)
+            return raw
         if isinstance(raw, dict):
-            return pd.DataFrame([raw])
+            return [raw]
     except:
         pass
 
@@ -80,7 +125,11 @@ def safe_read_goodreads(path: Path) -> pd.DataFrame:
                 rows.append(json.loads(line.strip()))
             except:
                 pass
-    return pd.DataFrame(rows)
+    return rows
+
+
+def safe_read_goodreads(path: Path) -> pd.DataFrame:
+    return pd.DataFrame(read_goodreads_records(path))
 
 
 def safe_read_google(parquet: Path, csv: Path) -> pd.DataFrame:
@@ -132,16 +181,6 @@ def merge_records(gr: Dict, gg: Dict) -> Dict:
     authors_str = " | ".join(merged_a) if merged_a else None
 
     # categorías
-    def normalize_categories(v):
-        if not v:
-            return []
-        if isinstance(v, list):
-            return [str(x).strip() for x in v if x]
-        s = str(v)
-        if "|" in s:
-            return [x.strip() for x in s.split("|") if x.strip()]
-        return [s.strip()]
-
     c_g = normalize_categories(gr.get("genres") or gr.get("categories"))
     c_gg = normalize_categories(gg.get("categories") if gg else None)
     categories_str = " | ".join(list(dict.fromkeys(c_g + c_gg))) if (c_g or c_gg) else None
@@ -156,21 +195,7 @@ def merge_records(gr: Dict, gg: Dict) -> Dict:
         pub_year = int(pub_date[:4])
 
     # precio
-    def safe_decimal(v):
-        try:
-            return float(str(v).replace(",", "."))
-        except:
-            return None
-
     price_amt = safe_decimal(gg.get("price_amount") if gg else None)
-
-    def normalize_currency(v):
-        if not v:
-            return None
-        s = str(v).strip().upper()
-        m = {"€": "EUR", "$": "USD", "£": "GBP"}
-        return m.get(s, s[:3])
-
     price_cur = normalize_currency(gg.get("price_currency") if gg else None)
 
     # ISBN
@@ -234,91 +259,640 @@ def merge_records(gr: Dict, gg: Dict) -> Dict:
 
 
 # -------------------------
-# PIPELINE PRINCIPAL
+# MATCHING Y DEDUPLICACIÓN
 # -------------------------
 
-def run_pipeline():
-    ts = now_ts()
-    print(f"[{ts}] INICIANDO MERGE...")
-
-    df_good = safe_read_goodreads(GOODREADS_FILE)
-    df_gg = safe_read_google(GOOGLE_PARQUET, GOOGLE_CSV)
-
-    print(f"[INFO] Goodreads: {len(df_good)} | Google: {len(df_gg)}")
-
+def build_google_index(df_gg: pd.DataFrame) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
     google_by_isbn = {}
     google_by_key = {}
 
     if not df_gg.empty:
         for r in df_gg.to_dict(orient="records"):
-            if r.get("isbn13"):
-                google_by_isbn[str(r["isbn13"])] = r
+            # un único índice por ISBN-13 normalizado, también desde el ISBN-10
+            for k in google_isbn_keys(r):
+                google_by_isbn[k] = r
 
             tnorm = normalize_title(r.get("title"))
             afirst = get_first_author(r.get("authors"))
             if tnorm and afirst:
                 google_by_key.setdefault(f"{tnorm}||{afirst}", r)
 
-    merged_rows = []
-    detail_rows = []
+    return google_by_isbn, google_by_key
 
-    for g in df_good.to_dict(orient="records"):
-        matched = None
-        method = "none"
 
-        isbn = normalize_str(g.get("isbn13") or g.get("isbn"))
-        if isbn and isbn in google_by_isbn:
-            matched = google_by_isbn[isbn]
-            method = "isbn13"
-        else:
-            tnorm = normalize_title(g.get("title"))
-            afirst = get_first_author(g.get("authors"))
-            if tnorm and afirst:
-                k = f"{tnorm}||{afirst}"
-                if k in google_by_key:
-                    matched = google_by_key[k]
-                    method = "heuristic"
+def google_isbn_keys(r: Dict) -> List[str]:
+    return list(dict.fromkeys(k for k in (isbn13_key(r.get("isbn13")), isbn13_key(r.get("isbn10"))) if k))
+
+
+def goodreads_isbn_keys(g: Dict) -> List[str]:
+    return list(dict.fromkeys(k for k in (isbn13_key(g.get("isbn13")), isbn13_key(g.get("isbn")),
+                                          isbn13_key(g.get("isbn10"))) if k))
+
+
+def match_google(g: Dict, google_by_isbn: Dict, google_by_key: Dict) -> Tuple[Optional[Dict], str]:
+    for isbn in goodreads_isbn_keys(g):
+        if isbn in google_by_isbn:
+            return google_by_isbn[isbn], "isbn13"
+
+    tnorm = normalize_title(g.get("title"))
+    afirst = get_first_author(g.get("authors"))
+    if tnorm and afirst:
+        k = f"{tnorm}||{afirst}"
+        if k in google_by_key:
+            return google_by_key[k], "heuristic"
+
+    return None, "none"
+
+
+# Columnas numéricas acotadas: histograma de ancho fijo (el resto, logarítmico)
+HISTOGRAM_BIN_WIDTHS = {"pub_year": PUB_YEAR_BUCKET, "rating_value": 0.5, "match_score": 0.1}
+
+
+def new_metric_accumulators() -> Tuple[MetricsAccumulator, MetricsAccumulator]:
+    # (dim_book, book_source_detail) con conteo exacto en las columnas categóricas
+    return (MetricsAccumulator(count_values=("source_preference",), bin_widths=HISTOGRAM_BIN_WIDTHS),
+            MetricsAccumulator(count_values=("merge_method",), bin_widths=HISTOGRAM_BIN_WIDTHS))
+
+
+def table_metrics(dim_acc: MetricsAccumulator, detail_acc: MetricsAccumulator) -> Dict:
+    """Métricas de quality_metrics.json a partir de los acumuladores, sin volver a leer las tablas."""
+    return {
+        "rows_output": dim_acc.rows,
+        "matched_with_google": detail_acc.value_counts("from_google").get(True, 0),
+        "merge_method_counts": detail_acc.value_counts("merge_method"),
+        "percent_with_isbn13": round(100 * (1 - dim_acc.null_rate("isbn13")), 2) if dim_acc.rows else 0.0,
+        "percent_with_pub_date": round(100 * (1 - dim_acc.null_rate("pub_date")), 2) if dim_acc.rows else 0.0,
+        "source_preference_counts": dim_acc.value_counts("source_preference"),
+    }
+
+
+def select_best_per_canonical(rows: List[Dict]) -> List[Dict]:
+    """
+    Una fila por canonical_id: la más completa y, a igualdad, la primera de
+    la entrada. Salida ordenada por completitud descendente (y posición).
+    """
+    return CanonicalDedup().select(rows)
+
+
+# -------------------------
+# MODO INCREMENTAL
+# -------------------------
+
+def record_fingerprint(rec: Optional[Dict]) -> str:
+    return hashlib.sha1(json.dumps(rec, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
 
-        merged = merge_records(g, matched or {})
-        merged_rows.append(merged)
 
-        detail_rows.append({
+def code_fingerprint() -> str:
+    # Si cambia la lógica de merge o de deduplicación, el estado guardado deja de ser válido
+    src = Path(__file__).resolve().parent
+    h = hashlib.sha1()
+    for p in (src / "integrate_pipeline.py", src / "merge_columnar.py", src / "dedup_canonical.py",
+              src / "utils" / "utils_isbn.py", src / "utils" / "utils_fuzzy.py"):
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def load_incremental_state(path: Path) -> Optional[Dict]:
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except ValueError:
+        print(f"[WARN] Estado incremental ilegible: {path}")
+        return None
+    if state.get("version") != STATE_VERSION or state.get("code") != code_fingerprint():
+        print("[INFO] El código de merge ha cambiado: reconstrucción completa")
+        return None
+    return state
+
+
+def save_incremental_state(path: Path, state: Dict):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+    tmp.replace(path)
+
+
+def incremental_state(gids: List[str], fps: List[str], merged: List[Dict], winners: set,
+                      dedup: CanonicalDedup) -> Dict:
+    """
+    Estado del modo incremental: por registro de Goodreads, en el orden de la
+    landing (el mismo que book_source_detail), su huella y su canonical_id.
+    Las filas que ganan la deduplicación llevan además su completitud, que
+    decide el orden de dim_book. Las filas mezcladas no se guardan: están
+    en las tablas de salida.
+    """
+    records = {}
+    for i, (gid, fp, row) in enumerate(zip(gids, fps, merged)):
+        rec = {"fp": fp, "canonical_id": row["canonical_id"]}
+        if i in winners:
+            rec["completeness"] = completeness(row)
+        records[gid] = rec
+    return {"version": STATE_VERSION, "code": code_fingerprint(),
+            "dedup": {"criteria": list(dedup.criteria), "preferred_source": dedup.preferred_source},
+            "records": records}
+
+
+def match_records(df_good: pd.DataFrame, df_gg: pd.DataFrame, goods: List[Dict],
+                  engine: str) -> Tuple[List[Tuple[Optional[Dict], str]], List[Optional[float]], Optional[np.ndarray]]:
+    """
+    Registro de Google con el que casa cada fila de df_good: (matches, scores,
+    pos), con matches = [(registro | None, merge_method)] y pos las filas de
+    df_gg (solo en el motor columnar).
+    """
+    gg_records = df_gg.to_dict(orient="records") if not df_gg.empty else []
+    pos = None
+    with RUN.stage("match", rows=len(goods)):
+        if engine == "columnar":
+            pos, methods = match_columnar(df_good, df_gg)
+            matches = [(gg_records[p] if p >= 0 else None, m) for p, m in zip(pos, methods)]
+        else:
+            google_by_isbn, google_by_key = build_google_index(df_gg)
+            matches = [match_google(g, google_by_isbn, google_by_key) for g in goods]
+        scores = [None if m == "none" else 1.0 for _, m in matches]
+
+        # matching aproximado para lo que no ha casado por ISBN ni por clave exacta
+        unmatched = [i for i, (_, m) in enumerate(matches) if m == "none"]
+        if unmatched and gg_records:
+            index = FuzzyIndex([r.get("title") for r in gg_records], [r.get("authors") for r in gg_records])
+            for i in unmatched:
+                p, score = index.best_match(goods[i].get("title"), goods[i].get("authors"), FUZZY_THRESHOLD)
+                if p >= 0:
+                    matches[i], scores[i] = (gg_records[p], "fuzzy"), score
+                    if engine == "columnar":
+                        pos[i] = p
+    return matches, scores, pos
+
+
+def record_identity(goods_raw: List[Dict], matches: List[Tuple[Optional[Dict], str]],
+                    scores: List[Optional[float]]) -> Tuple[List[str], List[str], List[Tuple[str, Optional[str]]]]:
+    # (gids, huellas, (raw_goodreads_ref, raw_google_ref)) de cada registro
+    gids, fps, raw_refs = [], [], []
+    for g, (matched, method), score in zip(goods_raw, matches, scores):
+        g_ref, m_ref = record_fingerprint(g), record_fingerprint(matched)
+        gids.append(str(g.get("id") or g.get("url") or g_ref))
+        fps.append(record_fingerprint([g_ref, m_ref, method, score]))
+        raw_refs.append((g_ref, m_ref if matched else None))
+    return gids, fps, raw_refs
+
+
+def merge_rows(indices: List[int], df_good: pd.DataFrame, df_gg: pd.DataFrame, goods: List[Dict],
+               matches: List[Tuple[Optional[Dict], str]], scores: List[Optional[float]],
+               pos: Optional[np.ndarray], raw_refs: List[Tuple[str, Optional[str]]], ts: str,
+               engine: str) -> List[Tuple[Dict, Dict]]:
+    """(fila de dim_book, fila de book_source_detail) de los registros `indices`."""
+    if not indices:
+        return []
+    with RUN.stage("normalize", rows=len(indices)):
+        if engine == "columnar":
+            merged_new = merge_columnar(df_good.iloc[indices], df_gg, pos[indices]).to_dict(orient="records")
+        else:
+            merged_new = [merge_records(goods[i], matches[i][0] or {}) for i in indices]
+
+    rows = []
+    for i, merged in zip(indices, merged_new):
+        matched, method = matches[i]
+        detail = {
             "canonical_id": merged["canonical_id"],
             "from_google": bool(matched),
             "merge_method": method,
+            "match_score": scores[i],
             "timestamp": ts,
-            "raw_goodreads": g,                   # ← datos crudos Goodreads
-            "raw_google": matched if matched else None   # ← datos crudos Google Books
-        })
+            "raw_goodreads_ref": raw_refs[i][0],   # ← datos crudos Goodreads (RawStore)
+            "raw_google_ref": raw_refs[i][1]       # ← datos crudos Google Books (RawStore)
+        }
+        rows.append((merged, detail))
+    return rows
+
+
+def store_raw(raw_store: Optional[RawStore], goods_raw: List[Dict],
+              matches: List[Tuple[Optional[Dict], str]], raw_refs: List[Tuple[str, Optional[str]]]):
+    # todos, también los reutilizados: el almacén puede venir de otra ejecución
+    if raw_store is not None:
+        raw_store.put_many([(g_ref, g) for (g_ref, _), g in zip(raw_refs, goods_raw)])
+        raw_store.put_many([(m_ref, m) for (_, m_ref), (m, _) in zip(raw_refs, matches) if m_ref])
+
+
+def build_tables(df_good: pd.DataFrame, df_gg: pd.DataFrame, ts: str,
+                 engine: str = "columnar",
+                 raw_store: Optional[RawStore] = None,
+                 dedup: Optional[CanonicalDedup] = None,
+                 goods_raw: Optional[List[Dict]] = None) -> Tuple[pd.DataFrame, pd.DataFrame, Dict, Dict]:
+    """
+    Reconstrucción completa de dim_book y book_source_detail. Devuelve
+    (df_final, df_detail, nuevo_estado, stats); el estado permite a
+    upsert_tables actualizar después solo lo que cambie.
+
+    `engine` elige cómo se hace el matching y el merge:
+      - columnar: por columnas completas (merge_columnar), el de por defecto
+      - records:  fila a fila con match_google / merge_records (referencia)
+
+    El detalle no lleva los registros crudos, sino su hash (raw_goodreads_ref,
+    raw_google_ref); con `raw_store` los registros se guardan ahí. `goods_raw`
+    son los registros de Goodreads tal cual se leyeron (read_goodreads_records),
+    en el orden de `df_good`: con ellos la referencia coincide con la del modo
+    por bloques. Sin ellos se usan las filas del DataFrame.
+
+    `dedup` decide qué fila se queda por canonical_id (por defecto la más
+    completa); las descartadas quedan en `dedup.losers`.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de merge no válido: {engine} (usar {', '.join(ENGINES)})")
+
+    goods = df_good.to_dict(orient="records")
+    goods_raw = goods if goods_raw is None else goods_raw
+    matches, scores, pos = match_records(df_good, df_gg, goods, engine)
+    gids, fps, raw_refs = record_identity(goods_raw, matches, scores)
+    rows = merge_rows(list(range(len(goods))), df_good, df_gg, goods, matches, scores, pos, raw_refs, ts, engine)
+    store_raw(raw_store, goods_raw, matches, raw_refs)
+
+    dedup = dedup or CanonicalDedup()
+    merged = [m for m, _ in rows]
+    with RUN.stage("dedup", rows=len(merged)):
+        df_final = pd.DataFrame(dedup.select(merged))
+    df_detail = pd.DataFrame([d for _, d in rows])
+
+    winners = {p for _, p in dedup.best.values()}
+    new_state = incremental_state(gids, fps, merged, winners, dedup)
+    stats = {"merged": len(rows), "reused": 0, "duplicates": dedup.duplicates}
+    return df_final, df_detail, new_state, stats
+
+
+def read_previous_tables() -> Optional[Tuple[pa.Table, pa.Table, pa.Table]]:
+    """(dim_book, dim_book_duplicates, book_source_detail) de la ejecución anterior, o None."""
+    try:
+        dim = pq.read_table(DIM_BOOK).cast(DIM_BOOK_SCHEMA)
+        detail = pq.read_table(DETAIL).cast(DETAIL_SCHEMA)
+        dup = pq.read_table(DUPLICATES).cast(DUPLICATES_SCHEMA) if DUPLICATES.exists() else None
+    except (OSError, pa.ArrowException) as e:
+        print(f"[WARN] No se pueden leer las tablas anteriores: {e}")
+        return None
+    return dim, dup, detail
+
+
+def upsert_tables(df_good: pd.DataFrame, df_gg: pd.DataFrame, ts: str, state: Dict,
+                  engine: str = "columnar",
+                  raw_store: Optional[RawStore] = None,
+                  dedup: Optional[CanonicalDedup] = None,
+                  goods_raw: Optional[List[Dict]] = None
+                  ) -> Optional[Tuple[pa.Table, pa.Table, pa.Table, Dict, Dict]]:
+    """
+    Modo incremental: actualiza las tablas ya escritas en lugar de rehacerlas.
+    Solo se mezclan los registros nuevos o cambiados (su huella cubre el
+    registro de Goodreads, el de Google con el que casa y el método) y los
+    demás registros de los canonical_id a los que afectan, para volver a
+    deduplicar esos grupos. El resto de filas de dim_book,
+    dim_book_duplicates y book_source_detail se copian tal cual del Parquet
+    anterior. El resultado es el mismo que el de build_tables, salvo el
+    timestamp del detalle, que se conserva en las filas no recalculadas.
+
+    Devuelve (dim_book, book_source_detail, dim_book_duplicates, nuevo_estado,
+    stats) como tablas Arrow, o None si el estado no corresponde a las tablas
+    guardadas y hay que reconstruir.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de merge no válido: {engine} (usar {', '.join(ENGINES)})")
+    dedup = dedup or CanonicalDedup()
+    if state.get("dedup") != {"criteria": list(dedup.criteria), "preferred_source": dedup.preferred_source}:
+        print("[INFO] Han cambiado los criterios de deduplicación")
+        return None
+    previous = state["records"]
+    with RUN.stage("read"):
+        old = read_previous_tables()
+    if old is None:
+        return None
+    old_dim, old_dup, old_detail = old
+
+    # las tablas tienen que ser las que describe el estado
+    prev_gids = list(previous)
+    n_winners = sum(1 for rec in previous.values() if "completeness" in rec)
+    if n_winners == len(previous):
+        old_dup = DUPLICATES_SCHEMA.empty_table()      # un fichero de otra ejecución no cuenta
+    if (old_detail.num_rows != len(previous) or old_dim.num_rows != n_winners
+            or old_dup is None or old_dup.num_rows != len(previous) - n_winners
+            or old_detail.column("canonical_id").to_pylist() != [previous[g]["canonical_id"] for g in prev_gids]):
+        print("[INFO] Las tablas guardadas no corresponden al estado incremental")
+        return None
+
+    goods = df_good.to_dict(orient="records")
+    goods_raw = goods if goods_raw is None else goods_raw
+    matches, scores, pos = match_records(df_good, df_gg, goods, engine)
+    gids, fps, raw_refs = record_identity(goods_raw, matches, scores)
+    if len(set(gids)) != len(gids):
+        print("[INFO] Hay registros de Goodreads con el mismo id")
+        return None
+
+    # los que no cambian deben seguir en el mismo orden relativo y con el mismo registro crudo
+    prev_index = {g: k for k, g in enumerate(prev_gids)}
+    old_refs = old_detail.column("raw_goodreads_ref").to_pylist()
+    changed = [i for i, (gid, fp) in enumerate(zip(gids, fps)) if previous.get(gid, {}).get("fp") != fp]
+    changed_set = set(changed)
+    kept = [prev_index[g] for i, g in enumerate(gids) if i not in changed_set]
+    if any(b <= a for a, b in zip(kept, kept[1:])):
+        print("[INFO] Ha cambiado el orden de los registros de Goodreads")
+        return None
+    if any(old_refs[prev_index[gids[i]]] != raw_refs[i][0] for i in range(len(gids)) if i not in changed_set):
+        print("[INFO] Las tablas guardadas no corresponden al estado incremental")
+        return None
+
+    # canonical_id afectados: los de los registros que cambian o desaparecen, antes y después
+    current = set(gids)
+    affected = {previous[g]["canonical_id"] for g in prev_gids if g not in current}
+    affected |= {previous[gids[i]]["canonical_id"] for i in changed if gids[i] in previous}
+    new_rows = dict(zip(changed, merge_rows(changed, df_good, df_gg, goods, matches, scores, pos,
+                                            raw_refs, ts, engine)))
+    affected |= {m["canonical_id"] for m, _ in new_rows.values()}
+    # los demás miembros de esos grupos se vuelven a mezclar para deduplicarlos juntos
+    regroup = [i for i, g in enumerate(gids) if i not in changed_set and previous[g]["canonical_id"] in affected]
+    new_rows.update(zip(regroup, merge_rows(regroup, df_good, df_gg, goods, matches, scores, pos,
+                                            raw_refs, ts, engine)))
+    store_raw(raw_store, goods_raw, matches, raw_refs)
+
+    with RUN.stage("dedup", rows=len(new_rows)):
+        for i in sorted(new_rows):
+            dedup.add(new_rows[i][0], i)
+
+        # filas de la ejecución anterior por canonical_id
+        old_dim_row = {cid: k for k, cid in enumerate(old_dim.column("canonical_id").to_pylist())}
+        old_dup_rows: Dict[str, List[int]] = {}
+        for k, cid in enumerate(old_dup.column("canonical_id").to_pylist()):
+            old_dup_rows.setdefault(cid, []).append(k)
+
+        # (tabla, fila) de cada fila de salida: 0 = Parquet anterior, 1 = recalculada
+        dim_order, dup_order, detail_take = [], [], []
+        new_dim, new_dup, new_detail = [], [], []
+        records = {}
+        for i, gid in enumerate(gids):
+            if i in new_rows:
+                merged, detail = new_rows[i]
+                rec = {"fp": fps[i], "canonical_id": merged["canonical_id"]}
+                if dedup.is_loser(i):
+                    dup_order.append((i, 1, len(new_dup)))
+                    new_dup.append(dict(merged, dedup_reason=dedup.reason(i)))
+                else:
+                    rec["completeness"] = completeness(merged)
+                    dim_order.append((-rec["completeness"], i, 1, len(new_dim)))
+                    new_dim.append(merged)
+            else:
+                rec = previous[gid]
+                if "completeness" in rec:
+                    dim_order.append((-rec["completeness"], i, 0, old_dim_row[rec["canonical_id"]]))
+                else:
+                    dup_order.append((i, 0, old_dup_rows[rec["canonical_id"]].pop(0)))
+            if i in changed_set:
+                detail_take.append((1, len(new_detail)))
+                new_detail.append(new_rows[i][1])
+            else:
+                detail_take.append((0, prev_index[gid]))
+            records[gid] = rec
+        dim_order.sort()
+
+    dim_table = _take_rows(old_dim, new_dim, DIM_BOOK_SCHEMA, [t[2:] for t in dim_order])
+    dup_table = _take_rows(old_dup, new_dup, DUPLICATES_SCHEMA, [t[1:] for t in dup_order])
+    detail_table = _take_rows(old_detail, new_detail, DETAIL_SCHEMA, detail_take)
+
+    new_state = {"version": STATE_VERSION, "code": code_fingerprint(), "dedup": state["dedup"], "records": records}
+    stats = {"merged": len(new_rows), "reused": len(gids) - len(new_rows), "duplicates": dup_table.num_rows}
+    return dim_table, detail_table, dup_table, new_state, stats
+
+
+def rebuild_tables(df_good: pd.DataFrame, df_gg: pd.DataFrame, ts: str,
+                   engine: str = "columnar",
+                   raw_store: Optional[RawStore] = None,
+                   dedup: Optional[CanonicalDedup] = None,
+                   goods_raw: Optional[List[Dict]] = None) -> Tuple[pa.Table, pa.Table, pa.Table, Dict, Dict]:
+    """build_tables con las tablas ya ajustadas a su esquema, en la misma forma que upsert_tables."""
+    dedup = dedup or CanonicalDedup()
+    df_final, df_detail, new_state, stats = build_tables(df_good, df_gg, ts, engine=engine, raw_store=raw_store,
+                                                         dedup=dedup, goods_raw=goods_raw)
+    # tipos declarados (utils_quality): los mismos en todos los formatos y en el modo por bloques
+    with RUN.stage("write"):
+        return (conform_table(df_final, DIM_BOOK_SCHEMA), conform_table(df_detail, DETAIL_SCHEMA),
+                conform_table(dedup.losers, DUPLICATES_SCHEMA), new_state, stats)
+
+
+def _take_rows(old: pa.Table, new_rows: List[Dict], schema: pa.Schema, order: List[Tuple[int, int]]) -> pa.Table:
+    # filas de `old` (0, k) y de `new_rows` (1, k) en el orden pedido
+    table = pa.concat_tables([old, conform_table(new_rows, schema)]).combine_chunks()
+    offset = old.num_rows
+    return table.take(pa.array([k + offset * src for src, k in order], type=pa.int64()))
+
+
+def _comparable(df: pd.DataFrame, drop=()) -> List[str]:
+    return [json.dumps(r, sort_keys=True, ensure_ascii=False, default=str)
+            for r in df.drop(columns=list(drop), errors="ignore").to_dict(orient="records")]
+
+
+def check_incremental_consistency() -> bool:
+    """
+    Compara el modo incremental (con el estado guardado) con una reconstrucción
+    completa en memoria. El timestamp del detalle se ignora: en incremental
+    se conserva el de la ejecución en que se hizo el merge.
+    """
+    ts = now_ts()
+    goods_raw = read_goodreads_records(GOODREADS_FILE)
+    df_good = pd.DataFrame(goods_raw)
+    df_gg = safe_read_google(GOOGLE_PARQUET, GOOGLE_CSV)
+    state = load_incremental_state(INCREMENTAL_STATE)
+    if state is None:
+        print("[WARN] No hay estado incremental válido que comprobar")
+        return False
+
+    saved = state.get("dedup", {})
+    criteria = (saved.get("criteria", DEFAULT_CRITERIA), saved.get("preferred_source", DEFAULT_PREFERRED_SOURCE))
+    full = rebuild_tables(df_good, df_gg, ts, dedup=CanonicalDedup(*criteria), goods_raw=goods_raw)
+    inc = upsert_tables(df_good, df_gg, ts, state, dedup=CanonicalDedup(*criteria), goods_raw=goods_raw)
+    if inc is None:
+        print("[ERROR] El estado incremental no corresponde a las tablas guardadas")
+        return False
+    stats = inc[4]
+
+    ok = True
+    for name, k, drop in (("dim_book", 0, []), ("book_source_detail", 1, ["timestamp"]),
+                          ("dim_book_duplicates", 2, [])):
+        try:
+            # los diccionarios de las categóricas pueden salir en otro orden
+            pd.testing.assert_frame_equal(typed_frame(full[k]).drop(columns=drop),
+                                          typed_frame(inc[k]).drop(columns=drop), check_categorical=False)
+        except AssertionError as e:
+            print(f"[ERROR] {name} difiere entre modos: {e}")
+            ok = False
+    if full[3]["records"] != inc[3]["records"]:
+        print("[ERROR] El estado incremental difiere entre modos")
+        ok = False
+
+    print(f"[{'OK' if ok else 'ERROR'}] Consistencia incremental/completo "
+          f"({stats['reused']} reutilizados, {stats['merged']} recalculados)")
+    return ok
+
+
+def check_columnar_parity(df_good: Optional[pd.DataFrame] = None,
+                          df_gg: Optional[pd.DataFrame] = None) -> bool:
+    """
+    Compara el motor columnar con el de referencia (merge_records fila a fila)
+    sobre los datos de landing, o sobre los DataFrames que se le pasen.
+    """
+    ts = now_ts()
+    if df_good is None:
+        df_good = safe_read_goodreads(GOODREADS_FILE)
+    if df_gg is None:
+        df_gg = safe_read_google(GOOGLE_PARQUET, GOOGLE_CSV)
+
+    ref_final, ref_detail, _, _ = build_tables(df_good, df_gg, ts, engine="records")
+    col_final, col_detail, _, _ = build_tables(df_good, df_gg, ts, engine="columnar")
+
+    ok = True
+    try:
+        pd.testing.assert_frame_equal(ref_final, col_final)
+    except AssertionError as e:
+        print(f"[ERROR] dim_book difiere entre motores: {e}")
+        ok = False
+    if _comparable(ref_detail) != _comparable(col_detail):
+        print("[ERROR] book_source_detail difiere entre motores")
+        ok = False
+
+    print(f"[{'OK' if ok else 'ERROR'}] Paridad columnar/records ({len(df_good)} registros)")
+    return ok
 
 
-    df_final = pd.DataFrame(merged_rows)
-    df_detail = pd.DataFrame(detail_rows)
+# -------------------------
+# PIPELINE PRINCIPAL
+# -------------------------
 
-    if not df_final.empty:
-        df_final["_score"] = df_final.notnull().sum(axis=1)
-        df_final = df_final.sort_values("_score", ascending=False)
-        df_final = df_final.drop_duplicates(subset=["canonical_id"], keep="first")
-        df_final.drop(columns=["_score"], inplace=True)
+def run_pipeline(full_rebuild: bool = False, engine: str = "columnar", partitioned: bool = False,
+                 formats: Sequence[str] = DEFAULT_FORMATS, dedup_by: Sequence[str] = DEFAULT_CRITERIA,
+                 preferred_source: str = DEFAULT_PREFERRED_SOURCE, profile_stage: Optional[str] = None):
+    ts = now_ts()
+    RUN.reset()
+    RUN.profile_stage = profile_stage or RUN.profile_stage
+    RUN.record("mode", "in-memory")
+    print(f"[{ts}] INICIANDO MERGE...")
 
-    save_dataframe_robust(df_final, DIM_BOOK)
-    save_dataframe_robust(df_detail, DETAIL)
+    with RUN.stage("read"):
+        goods_raw = read_goodreads_records(GOODREADS_FILE)
+        df_good = pd.DataFrame(goods_raw)
+        df_gg = safe_read_google(GOOGLE_PARQUET, GOOGLE_CSV)
+    RUN.add_rows("read", len(df_good) + len(df_gg))
+
+    print(f"[INFO] Goodreads: {len(df_good)} | Google: {len(df_gg)}")
+
+    state = None if full_rebuild else load_incremental_state(INCREMENTAL_STATE)
+    if state and "parquet" not in formats:
+        print("[INFO] El modo incremental parte del Parquet anterior y --formats no lo incluye")
+        state = None
+
+    raw_store = RawStore(RAW_STORE)
+    dedup = CanonicalDedup(dedup_by, preferred_source)
+    tables = upsert_tables(df_good, df_gg, ts, state, engine=engine, raw_store=raw_store, dedup=dedup,
+                           goods_raw=goods_raw) if state else None
+    print(f"[INFO] Modo: {'incremental' if tables else 'reconstrucción completa'}")
+    if tables is None:
+        tables = rebuild_tables(df_good, df_gg, ts, engine=engine, raw_store=raw_store, dedup=dedup,
+                                goods_raw=goods_raw)
+    dim_table, detail_table, losers_table, new_state, stats = tables
+    print(f"[INFO] Registros recalculados: {stats['merged']} | reutilizados: {stats['reused']}")
+    print(f"[INFO] Duplicados descartados: {stats['duplicates']} (criterios: {', '.join(dedup.criteria)})")
+
+    # métricas y schema.md del mismo DataFrame tipado con el que se escribe el
+    # CSV: una sola conversión por tabla, sin volver a recorrerlas después
+    with RUN.stage("metrics", rows=dim_table.num_rows + detail_table.num_rows):
+        dim_acc, detail_acc = new_metric_accumulators()
+        dim_frame, detail_frame = typed_frame(dim_table), typed_frame(detail_table)
+        dim_acc.update(dim_frame, schema=DIM_BOOK_SCHEMA)
+        detail_acc.update(detail_frame, schema=DETAIL_SCHEMA)
+        profile = dim_acc.summary()["columns"]
+
+    with RUN.stage("write", rows=dim_table.num_rows + detail_table.num_rows):
+        outputs = {
+            "dim_book": save_dataframe_robust(dim_table, DIM_BOOK, formats, DIM_BOOK_SCHEMA, frame=dim_frame),
+            "book_source_detail": save_dataframe_robust(detail_table, DETAIL, formats, DETAIL_SCHEMA,
+                                                        frame=detail_frame),
+        }
+        del dim_frame, detail_frame
+        if losers_table.num_rows:
+            outputs["dim_book_duplicates"] = save_dataframe_robust(losers_table, DUPLICATES, formats,
+                                                                   DUPLICATES_SCHEMA)
+        # los blobs que ya no referencia el detalle nuevo sobran
+        pruned = raw_store.prune(detail_table.column("raw_goodreads_ref").to_pylist()
+                                 + detail_table.column("raw_google_ref").to_pylist())
+        raw_stats = dict(raw_store.stats, records=len(raw_store), pruned=pruned)
+        raw_store.close()
+        if partitioned:
+            save_dataset_partitioned(dim_table, DIM_BOOK_DATASET)
+        # la próxima ejecución incremental parte de estos Parquet: si falta alguno, el estado no sirve
+        if all("parquet" in outputs.get(name, {}) for name in outputs):
+            save_incremental_state(INCREMENTAL_STATE, new_state)
+        else:
+            INCREMENTAL_STATE.unlink(missing_ok=True)
+    print(f"[INFO] Registros crudos: {raw_stats['records']} en {RAW_STORE.name} "
+          f"(nuevos {raw_stats['stored']}, repetidos {raw_stats['deduplicated']}, borrados {pruned})")
 
     metrics = {
         "generated_at": ts,
         "rows_input_goodreads": len(df_good),
-        "rows_output": len(df_final),
-        "matched_with_google": int(df_detail["from_google"].sum()),
-        "percent_with_isbn13": round(100 * df_final["isbn13"].notnull().mean(), 2),
-        "percent_with_pub_date": round(100 * df_final["pub_date"].notnull().mean(), 2),
-        "source_preference_counts": df_final["source_preference"].value_counts().to_dict(),
+        **table_metrics(dim_acc, detail_acc),
+        "dedup_criteria": list(dedup.criteria),
+        "duplicates_discarded": losers_table.num_rows,
+        "dedup_reason_counts": dict(Counter(losers_table.column("dedup_reason").to_pylist()).most_common()),
+        "outputs": outputs,
+        "raw_store": raw_stats,
+        "profile": {"dim_book": profile, "book_source_detail": detail_acc.summary()["columns"]},
     }
 
-    write_quality_metrics(METRICS, metrics)
-    schema_path = DOCS_DIR / "schema.md"
-    write_schema_markdown(schema_path, df_final)
-    print(f"[FIN] Filas finales: {len(df_final)}")
+    with RUN.stage("metrics"):
+        write_quality_metrics(METRICS, metrics)
+        schema_path = DOCS_DIR / "schema.md"
+        write_schema_markdown(schema_path, profile=profile, schema=DIM_BOOK_SCHEMA)
+    RUN.count("records_merged", stats["merged"])
+    RUN.count("records_reused", stats["reused"])
+    RUN.record("raw_store", raw_stats)
+    RUN.write(RUN_METRICS)
+    RUN.print_summary()
+    print(f"[FIN] Filas finales: {dim_table.num_rows}")
 
 
 if __name__ == "__main__":
-    run_pipeline()
+    ap = argparse.ArgumentParser(description="Integración Goodreads + Google Books")
+    ap.add_argument("--full-rebuild", action="store_true",
+                    help="ignorar el estado incremental y recalcular todos los registros")
+    ap.add_argument("--check-consistency", action="store_true",
+                    help="comprobar que el modo incremental produce lo mismo que una reconstrucción completa")
+    ap.add_argument("--engine", choices=ENGINES, default="columnar",
+                    help="motor de merge: columnar (por defecto) o records (fila a fila, referencia)")
+    ap.add_argument("--check-columnar", action="store_true",
+                    help="comprobar que el motor columnar produce lo mismo que el de referencia")
+    ap.add_argument("--partitioned", action="store_true",
+                    help="escribir también dim_book como dataset Parquet particionado (standard/dim_book_dataset/)")
+    ap.add_argument("--formats", type=parse_formats, default=DEFAULT_FORMATS,
+                    help="formatos de salida separados por comas: parquet, csv, feather (por defecto parquet,csv)")
+    ap.add_argument("--dedup-by", type=parse_criteria, default=DEFAULT_CRITERIA,
+                    help="criterios para quedarse con una fila por canonical_id, en orden: "
+                         "completeness, freshest, source (por defecto completeness)")
+    ap.add_argument("--preferred-source", choices=SOURCES, default=DEFAULT_PREFERRED_SOURCE,
+                    help="fuente preferida para el criterio source")
+    ap.add_argument("--streaming", action="store_true",
+                    help="reconstrucción completa por bloques con memoria acotada (landings muy grandes)")
+    ap.add_argument("--chunk-rows", type=int, default=5000,
+                    help="registros de Goodreads por bloque en modo --streaming")
+    ap.add_argument("--max-memory-mb", type=float, default=1024,
+                    help="techo de memoria en modo --streaming; el bloque se reduce al acercarse")
+    ap.add_argument("--profile-stage",
+                    help="perfilar con cProfile una etapa (read, match, normalize, dedup, write, metrics); "
+                         "el .prof queda en docs/")
+    args = ap.parse_args()
+
+    if args.streaming:
+        from integrate_streaming import run_streaming
+        run_streaming(chunk_rows=args.chunk_rows, max_memory_mb=args.max_memory_mb,
+                      partitioned=args.partitioned, formats=args.formats,
+                      dedup_by=args.dedup_by, preferred_source=args.preferred_source,
+                      profile_stage=args.profile_stage)
+        raise SystemExit(0)
+    if args.check_consistency:
+        raise SystemExit(0 if check_incremental_consistency() else 1)
+    if args.check_columnar:
+        raise SystemExit(0 if check_columnar_parity() else 1)
+    run_pipeline(full_rebuild=args.full_rebuild, engine=args.engine, partitioned=args.partitioned,
+                 formats=args.formats, dedup_by=args.dedup_by, preferred_source=args.preferred_source,
+                 profile_stage=args.profile_stage)
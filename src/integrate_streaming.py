@@ -0,0 +1,514 @@
+# integrate_streaming.py
+# ------------------------------------------
+# Integración por bloques con memoria acotada
+# para landings muy grandes: Goodreads (NDJSON)
+# y Google se leen en bloques, en memoria solo
+# queda el índice de cruce (clave → fila) y
+# dim_book se escribe por row groups.
+# ------------------------------------------
+
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from integrate_pipeline import (
+    GOODREADS_FILE, GOOGLE_PARQUET, GOOGLE_CSV, DIM_BOOK, DIM_BOOK_DATASET, DETAIL, METRICS, DOCS_DIR, RAW_STORE,
+    DUPLICATES, INCREMENTAL_STATE, RUN, RUN_METRICS, now_ts, google_isbn_keys, match_google,
+    new_metric_accumulators, table_metrics
+)
+from dedup_canonical import (
+    CanonicalDedup, DEFAULT_CRITERIA, DEFAULT_PREFERRED_SOURCE, completeness, _isnull
+)
+from merge_columnar import merge_columnar
+from utils.utils_fuzzy import FuzzyIndex, FUZZY_THRESHOLD
+from utils.utils_isbn import normalize_title, get_first_author
+from utils.utils_rawstore import RawStore
+from utils.utils_quality import (
+    DEFAULT_FORMATS, DETAIL_SCHEMA, DIM_BOOK_SCHEMA, DUPLICATES_SCHEMA, FORMAT_LABEL, FORMAT_SUFFIX,
+    conform_table, save_dataset_partitioned, typed_frame, write_quality_metrics, write_schema_markdown
+)
+
+
+# -------------------------
+# CONFIG
+# -------------------------
+
+CHUNK_ROWS = 5000             # registros de Goodreads por bloque (punto de partida)
+MIN_CHUNK_ROWS = 500
+GOOGLE_CHUNK_ROWS = 5000      # filas de Google por bloque al construir el índice
+MAX_MEMORY_MB = 1024          # techo de memoria residente del proceso
+ROW_GROUP_ROWS = 50000        # filas por row group en dim_book.parquet
+
+
+# -------------------------
+# MEMORIA
+# -------------------------
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Memoria residente actual en MB, o None si no se puede medir en esta
+    plataforma (en ese caso no se aplica el techo de memoria).
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso en MB, o None si no se puede medir."""
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", None)  # solo en Windows
+        if peak is not None:
+            return peak / 2**20
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def format_rss(mb: Optional[float]) -> str:
+    return "n/d" if mb is None else f"{mb:.0f} MB"
+
+
+class ChunkSizer:
+    """
+    Ajusta el tamaño de bloque al techo de memoria: se reduce a la mitad si la
+    memoria residente pasa del 80% del techo y crece si queda por debajo del 50%.
+    """
+
+    def __init__(self, rows: int, max_memory_mb: float):
+        self.rows = rows
+        self.max_rows = rows
+        self.max_memory_mb = max_memory_mb
+        self.peak_mb = 0.0
+        self._warned = False
+
+    def update(self) -> int:
+        rss = current_rss_mb()
+        if rss is None:
+            # Sin medida de la memoria actual: bloque fijo
+            return self.rows
+        self.peak_mb = max(self.peak_mb, rss)
+        if rss > 0.8 * self.max_memory_mb:
+            if self.rows == MIN_CHUNK_ROWS and not self._warned:
+                self._warned = True
+                print(f"[WARN] Memoria {rss:.0f} MB por encima del techo ({self.max_memory_mb} MB) con el bloque mínimo")
+            self.rows = max(MIN_CHUNK_ROWS, self.rows // 2)
+        elif rss < 0.5 * self.max_memory_mb:
+            self.rows = min(self.max_rows, self.rows * 2)
+        return self.rows
+
+
+# -------------------------
+# LECTURA POR BLOQUES
+# -------------------------
+
+def iter_goodreads(path: Path, sizer: ChunkSizer) -> Iterator[List[Dict]]:
+    """Bloques de registros de Goodreads; el tamaño lo decide `sizer` en cada bloque."""
+    if not path.exists():
+        print(f"[WARN] No existe {path}")
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+
+        if head == "[":
+            # JSON clásico (array): no se puede leer por partes
+            print(f"[WARN] {path} es un array JSON, no NDJSON: se carga entero")
+            raw = json.load(f)
+            for i in range(0, len(raw), sizer.rows):
+                yield raw[i:i + sizer.rows]
+            return
+
+        chunk = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(chunk) >= sizer.rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_google(parquet: Path, csv: Path, rows: int) -> Iterator[pd.DataFrame]:
+    if parquet.exists():
+        for batch in pq.ParquetFile(parquet).iter_batches(batch_size=rows):
+            yield batch.to_pandas()
+    elif csv.exists():
+        yield from pd.read_csv(csv, sep=";", chunksize=rows)
+
+
+# -------------------------
+# ÍNDICE DE CRUCE + FILAS DE GOOGLE EN DISCO
+# -------------------------
+
+class GoogleSpill:
+    """
+    Índice compacto de Google en memoria (ISBN-13 / título||autor → número de
+    fila, y el índice de bloqueo del matching aproximado) y las filas completas
+    en un SQLite temporal, para recuperarlas solo cuando un registro casa.
+    """
+
+    def __init__(self, workdir: Path):
+        self.by_isbn: Dict[str, int] = {}
+        self.by_key: Dict[str, int] = {}
+        self.fuzzy = FuzzyIndex()
+        self.rows = 0
+        self._db = sqlite3.connect(str(workdir / "google_rows.sqlite"))
+        self._db.execute("CREATE TABLE rows (pos INTEGER PRIMARY KEY, record BLOB NOT NULL)")
+
+    def add_chunk(self, df: pd.DataFrame):
+        # Mismas claves y prioridades que build_google_index. NaN → None registro
+        # a registro: df.replace copia el bloque entero a object
+        batch = []
+        for r in df.to_dict(orient="records"):
+            r = {k: None if _isnull(v) else v for k, v in r.items()}
+            pos = self.rows
+            for k in google_isbn_keys(r):
+                self.by_isbn[k] = pos
+            tnorm = normalize_title(r.get("title"))
+            afirst = get_first_author(r.get("authors"))
+            if tnorm and afirst:
+                self.by_key.setdefault(f"{tnorm}||{afirst}", pos)
+            self.fuzzy.add(r.get("title"), r.get("authors"))
+            batch.append((pos, pickle.dumps(r, protocol=pickle.HIGHEST_PROTOCOL)))
+            self.rows += 1
+        self._db.executemany("INSERT INTO rows VALUES (?, ?)", batch)
+        self._db.commit()
+
+    def fetch(self, positions: List[int]) -> Dict[int, Dict]:
+        out = {}
+        for i in range(0, len(positions), 900):
+            part = positions[i:i + 900]
+            q = f"SELECT pos, record FROM rows WHERE pos IN ({','.join('?' * len(part))})"
+            for pos, blob in self._db.execute(q, part):
+                out[pos] = pickle.loads(blob)
+        return out
+
+    def close(self):
+        self._db.close()
+
+
+# -------------------------
+# ESCRITURA
+# -------------------------
+
+class TableSink:
+    """
+    Row groups en cada formato pedido (Parquet, CSV por anexado, Feather), a
+    ficheros temporales hasta `commit`, que los publica con rename atómico.
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, row_group_rows: int = ROW_GROUP_ROWS,
+                 formats: Sequence[str] = DEFAULT_FORMATS):
+        self.path = path
+        self.paths = {f: path.with_suffix(FORMAT_SUFFIX[f]) for f in formats}
+        self._tmps = {f: p.with_name(p.name + ".tmp") for f, p in self.paths.items()}
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.rows = 0
+        self.seconds = dict.fromkeys(formats, 0.0)
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+        self._writers = {}
+        if "parquet" in formats:
+            self._writers["parquet"] = pq.ParquetWriter(self._tmps["parquet"], schema)
+        if "feather" in formats:
+            # un fichero IPC no admite cambiar de diccionario entre lotes, solo ampliarlo
+            self._writers["feather"] = pa.ipc.new_file(
+                self._tmps["feather"], schema,
+                options=pa.ipc.IpcWriteOptions(compression="lz4", emit_dictionary_deltas=True))
+        self._dictionaries: Dict[str, Dict[str, int]] = {
+            f.name: {} for f in schema if pa.types.is_dictionary(f.type)}
+        self._csv_header = True
+        self._pool = ThreadPoolExecutor(max_workers=len(formats))
+
+    def write(self, table: pa.Table):
+        if table.num_rows == 0:
+            return
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.row_group_rows:
+            self._flush()
+
+    def _write_format(self, fmt: str, table: pa.Table) -> float:
+        t0 = time.perf_counter()
+        if fmt == "parquet":
+            self._writers[fmt].write_table(table, row_group_size=self.row_group_rows)
+        elif fmt == "feather":
+            self._writers[fmt].write_table(self._grow_dictionaries(table))
+        else:
+            typed_frame(table).to_csv(self._tmps[fmt], index=False, sep=";", encoding="utf-8",
+                                     mode="w" if self._csv_header else "a", header=self._csv_header)
+        return time.perf_counter() - t0
+
+    def _grow_dictionaries(self, table: pa.Table) -> pa.Table:
+        # categóricas recodificadas contra un diccionario común que solo crece:
+        # cada lote lleva el anterior más sus valores nuevos (delta IPC)
+        for name, known in self._dictionaries.items():
+            i = table.schema.get_field_index(name)
+            field = table.schema.field(i)
+            values = table.column(i).cast(field.type.value_type).combine_chunks()
+            for v in pc.unique(values).to_pylist():
+                if v is not None and v not in known:
+                    known[v] = len(known)
+            dictionary = pa.array(list(known), type=field.type.value_type)
+            indices = pc.index_in(values, value_set=dictionary).cast(field.type.index_type)
+            table = table.set_column(i, field, pa.DictionaryArray.from_arrays(indices, dictionary))
+        return table
+
+    def _flush(self):
+        if not self._pending:
+            return
+        table = pa.concat_tables(self._pending)
+        futures = {f: self._pool.submit(self._write_format, f, table) for f in self.seconds}
+        for fmt, fut in futures.items():
+            self.seconds[fmt] += fut.result()
+        self._csv_header = False
+        self.rows += table.num_rows
+        self._pending, self._pending_rows = [], 0
+
+    def commit(self) -> Dict:
+        self._flush()
+        self._pool.shutdown()
+        for w in self._writers.values():
+            w.close()
+        report = {}
+        for fmt, path in self.paths.items():
+            if not self._tmps[fmt].exists():
+                continue    # CSV sin filas: no se llega a crear
+            os.replace(self._tmps[fmt], path)
+            report[fmt] = {"file": path.name, "bytes": path.stat().st_size, "seconds": round(self.seconds[fmt], 3)}
+            print(f"[OK] {FORMAT_LABEL[fmt]}: {path} ({self.rows} filas, "
+                  f"{report[fmt]['bytes'] / 2**20:.1f} MB, {report[fmt]['seconds']:.2f} s)")
+        return report
+
+
+# -------------------------
+# PIPELINE POR BLOQUES
+# -------------------------
+
+def merge_chunk(goods: List[Dict], spill: GoogleSpill, ts: str,
+                raw_store: RawStore) -> Tuple[List[Dict], List[Dict]]:
+    """Matching con el índice compacto y merge columnar de un bloque de Goodreads."""
+    with RUN.stage("match", rows=len(goods)):
+        matches = [match_google(g, spill.by_isbn, spill.by_key) for g in goods]
+        scores = [None if m == "none" else 1.0 for _, m in matches]
+        for i, (p, m) in enumerate(matches):
+            if m == "none" and spill.rows:
+                p, score = spill.fuzzy.best_match(goods[i].get("title"), goods[i].get("authors"), FUZZY_THRESHOLD)
+                if p >= 0:
+                    matches[i], scores[i] = (p, "fuzzy"), score
+
+    with RUN.stage("normalize", rows=len(goods)):
+        wanted = sorted({p for p, _ in matches if p is not None})
+        fetched = spill.fetch(wanted)
+        local = {p: i for i, p in enumerate(wanted)}
+        df_gg = pd.DataFrame([fetched[p] for p in wanted], dtype=object)
+        pos = np.array([local[p] if p is not None else -1 for p, _ in matches], dtype=np.int64)
+        merged = merge_columnar(pd.DataFrame(goods), df_gg, pos).to_dict(orient="records")
+
+    with RUN.stage("write"):
+        g_refs = raw_store.put_many((None, g) for g in goods)
+        m_refs = raw_store.put_many((None, fetched[p] if p is not None else None) for p, _ in matches)
+    details = [{
+        "canonical_id": row["canonical_id"],
+        "from_google": p is not None,
+        "merge_method": method,
+        "match_score": score,
+        "timestamp": ts,
+        "raw_goodreads_ref": g_ref,
+        "raw_google_ref": m_ref,
+    } for row, (p, method), score, g_ref, m_ref in zip(merged, matches, scores, g_refs, m_refs)]
+    return merged, details
+
+
+def run_streaming(chunk_rows: int = CHUNK_ROWS, max_memory_mb: float = MAX_MEMORY_MB,
+                  row_group_rows: int = ROW_GROUP_ROWS, partitioned: bool = False,
+                  formats: Sequence[str] = DEFAULT_FORMATS, dedup_by: Sequence[str] = DEFAULT_CRITERIA,
+                  preferred_source: str = DEFAULT_PREFERRED_SOURCE, profile_stage: Optional[str] = None) -> Dict:
+    """
+    Reconstrucción completa por bloques. Produce dim_book y book_source_detail
+    con las mismas reglas que run_pipeline (una fila por canonical_id según
+    `dedup_by`, a igualdad la primera; orden por completitud descendente) sin
+    tener nunca más de un bloque de registros en memoria:
+
+      1. Google por bloques → índice compacto + filas en SQLite temporal.
+      2. Goodreads por bloques → merge, detalle directo a disco y las filas de
+         dim_book a ficheros temporales por completitud; en memoria solo el
+         (rango, posición) de la mejor fila de cada canonical_id (CanonicalDedup).
+      3. Ficheros por completitud de mayor a menor, quedándose con la mejor
+         fila de cada canonical_id → dim_book por row groups; el resto a
+         dim_book_duplicates.
+    """
+    ts = now_ts()
+    RUN.reset()
+    RUN.profile_stage = profile_stage or RUN.profile_stage
+    RUN.record("mode", "streaming")
+    sizer = ChunkSizer(chunk_rows, max_memory_mb)
+    print(f"[{ts}] INICIANDO MERGE POR BLOQUES (bloque {chunk_rows}, techo {max_memory_mb} MB)...")
+
+    with tempfile.TemporaryDirectory(prefix="integrate_", dir=DIM_BOOK.parent) as tmp:
+        workdir = Path(tmp)
+
+        # 1. índice de Google
+        spill = GoogleSpill(workdir)
+        # almacén nuevo: sustituye al anterior al terminar, sin blobs huérfanos
+        raw_store = RawStore(workdir / RAW_STORE.name)
+        with RUN.stage("read"):
+            for df in iter_google(GOOGLE_PARQUET, GOOGLE_CSV, GOOGLE_CHUNK_ROWS):
+                spill.add_chunk(df)
+        RUN.add_rows("read", spill.rows)
+        print(f"[INFO] Google indexado: {spill.rows} filas | RSS {format_rss(current_rss_mb())}")
+
+        # 2. merge de Goodreads por bloques
+        detail_sink = TableSink(DETAIL, DETAIL_SCHEMA, row_group_rows, formats)
+        spill_schema = DIM_BOOK_SCHEMA.append(pa.field("_pos", pa.int64()))
+        buckets: Dict[int, pq.ParquetWriter] = {}
+        dedup = CanonicalDedup(dedup_by, preferred_source)
+        counts = {"rows_input": 0}
+        dim_acc, detail_acc = new_metric_accumulators()
+
+        chunks = iter_goodreads(GOODREADS_FILE, sizer)
+        while True:
+            with RUN.stage("read"):
+                goods = next(chunks, None)
+            if goods is None:
+                break
+            RUN.add_rows("read", len(goods))
+            merged, details = merge_chunk(goods, spill, ts, raw_store)
+            by_score: Dict[int, List[Dict]] = {}
+            with RUN.stage("dedup", rows=len(merged)):
+                for row in merged:
+                    pos = counts["rows_input"]
+                    counts["rows_input"] += 1
+                    score = completeness(row)
+                    dedup.add(row, pos)
+                    by_score.setdefault(score, []).append(dict(row, _pos=pos))
+            with RUN.stage("write", rows=len(merged)):
+                for score, rows in by_score.items():
+                    if score not in buckets:
+                        buckets[score] = pq.ParquetWriter(workdir / f"score_{score:03d}.parquet", spill_schema)
+                    buckets[score].write_table(conform_table(rows, spill_schema))
+
+                detail_table = conform_table(details, DETAIL_SCHEMA)
+                detail_sink.write(detail_table)
+            with RUN.stage("metrics", rows=detail_table.num_rows):
+                detail_acc.update(detail_table)
+            print(f"[INFO] {counts['rows_input']} registros | bloque {len(goods)} | RSS {format_rss(current_rss_mb())}")
+            sizer.update()
+
+        spill.close()
+        raw_stats = dict(raw_store.stats, records=len(raw_store))
+        raw_store.close()
+        for w in buckets.values():
+            w.close()
+        outputs = {"book_source_detail": detail_sink.commit()}
+        os.replace(workdir / RAW_STORE.name, RAW_STORE)
+
+        # 3. dim_book: mejor fila por canonical_id, de mayor a menor completitud;
+        #    las descartadas van a la tabla de auditoría
+        winners = np.sort(np.fromiter((pos for _, pos in dedup.best.values()), dtype=np.int64,
+                                      count=len(dedup.best)))
+        dim_sink = TableSink(DIM_BOOK, DIM_BOOK_SCHEMA, row_group_rows, formats)
+        loser_sink = None
+        if dedup.duplicates:
+            loser_sink = TableSink(DUPLICATES, DUPLICATES_SCHEMA, row_group_rows, formats)
+        reasons = Counter()
+        reason_field = DUPLICATES_SCHEMA.field("dedup_reason")
+        for score in sorted(buckets, reverse=True):
+            for batch in pq.ParquetFile(workdir / f"score_{score:03d}.parquet").iter_batches(batch_size=row_group_rows):
+                with RUN.stage("write", rows=batch.num_rows):
+                    positions = batch.column("_pos").to_numpy()
+                    keep = np.isin(positions, winners, assume_unique=True)
+                    table = pa.Table.from_batches([batch])
+                    if loser_sink is not None and not keep.all():
+                        lost = [dedup.reason(p) for p in positions[~keep]]
+                        reasons.update(lost)
+                        loser_sink.write(table.filter(pa.array(~keep)).drop(["_pos"])
+                                         .append_column(reason_field, pa.array(lost, type=reason_field.type)))
+                    table = table.filter(pa.array(keep)).drop(["_pos"])
+                    dim_sink.write(table)
+                with RUN.stage("metrics", rows=table.num_rows):
+                    dim_acc.update(table)
+        outputs["dim_book"] = dim_sink.commit()
+        if loser_sink is not None:
+            outputs["dim_book_duplicates"] = loser_sink.commit()
+        # las tablas ya no son las que describe el estado incremental: el
+        # siguiente run_pipeline reconstruye
+        INCREMENTAL_STATE.unlink(missing_ok=True)
+
+    if partitioned:
+        # Se lee por lotes del dim_book ya escrito: no hace falta tenerlo en memoria
+        written = [f for f in ("parquet", "feather") if f in outputs["dim_book"]]
+        if written:
+            save_dataset_partitioned(DIM_BOOK.with_suffix(FORMAT_SUFFIX[written[0]]), DIM_BOOK_DATASET)
+        else:
+            print("[WARN] --partitioned necesita dim_book en Parquet o Feather: dataset no generado")
+
+    rows_output = dim_acc.rows
+    profile = dim_acc.summary()["columns"]
+    peak_mb = round(max(sizer.peak_mb, peak_rss_mb() or 0.0), 1)
+    metrics = {
+        "generated_at": ts,
+        "mode": "streaming",
+        "rows_input_goodreads": counts["rows_input"],
+        **table_metrics(dim_acc, detail_acc),
+        "dedup_criteria": list(dedup.criteria),
+        "duplicates_discarded": dedup.duplicates,
+        "dedup_reason_counts": dict(reasons.most_common()),
+        "peak_rss_mb": peak_mb,
+        "outputs": outputs,
+        "raw_store": raw_stats,
+        "profile": {"dim_book": profile, "book_source_detail": detail_acc.summary()["columns"]},
+    }
+    with RUN.stage("metrics"):
+        write_quality_metrics(METRICS, metrics)
+        if rows_output:
+            write_schema_markdown(DOCS_DIR / "schema.md", profile=profile, schema=DIM_BOOK_SCHEMA)
+    RUN.record("raw_store", raw_stats)
+    RUN.record("peak_rss_mb", peak_mb)
+    RUN.write(RUN_METRICS)
+    RUN.print_summary()
+    print(f"[FIN] Filas finales: {rows_output} | pico RSS {peak_mb:.0f} MB")
+    return metrics
@@ -0,0 +1,375 @@
+# merge_columnar.py
+# ------------------------------------------
+# Motor de merge columnar: las mismas reglas
+# que merge_records / match_google, pero
+# aplicadas a columnas completas de pandas
+# (normalización por columna, joins por hash
+# y coalesce / scoring como expresiones).
+# ------------------------------------------
+
+import sys
+import unicodedata
+from typing import Any, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.utils_isbn import (
+    map_distinct,
+    isbn13_key_batch,
+    iso_date,
+    stable_hash,
+    safe_decimal,
+    normalize_currency
+)
+
+
+OUTPUT_COLUMNS = [
+    "canonical_id", "isbn13", "isbn10", "title", "authors", "first_author",
+    "publisher", "pub_date", "pub_year", "language", "categories", "num_pages",
+    "format", "description", "rating_value", "rating_count", "price_amount",
+    "price_currency", "source_preference", "most_complete_url",
+    "ingestion_date_goodreads", "ingestion_date_google",
+]
+
+# Marcas diacríticas (categoría Mn) como tabla de str.translate: quitar acentos
+# tras NFD sin recorrer los caracteres uno a uno en Python
+_MN_TABLE = dict.fromkeys(c for c in range(sys.maxunicode + 1) if unicodedata.category(chr(c)) == "Mn")
+
+_is_none_u = np.frompyfunc(lambda v: v is None, 1, 1)
+_truthy_u = np.frompyfunc(bool, 1, 1)
+_is_str_u = np.frompyfunc(lambda v: isinstance(v, str), 1, 1)
+_is_list_u = np.frompyfunc(lambda v: isinstance(v, list), 1, 1)
+
+
+# -------------------------
+# Primitivas sobre columnas (dtype object, misma semántica que Python)
+# -------------------------
+
+def _arr(s: pd.Series) -> np.ndarray:
+    return s.to_numpy(dtype=object)
+
+
+def _mask(ufunc, s: pd.Series) -> np.ndarray:
+    return ufunc(_arr(s)).astype(bool) if len(s) else np.zeros(0, dtype=bool)
+
+
+def _col(df: pd.DataFrame, name: str) -> pd.Series:
+    # Equivalente a rec.get(name) sobre to_dict(orient="records")
+    if name in df.columns:
+        return pd.Series(df[name].astype(object).to_numpy(), dtype=object)
+    return pd.Series([None] * len(df), dtype=object)
+
+
+def _aligned(gg_col: pd.Series, pos: np.ndarray) -> pd.Series:
+    # Valor del registro de Google casado con cada fila, o None si no hay match
+    vals = _arr(gg_col)
+    out = np.full(len(pos), None, dtype=object)
+    hit = pos >= 0
+    out[hit] = vals[pos[hit]]
+    return pd.Series(out, dtype=object)
+
+
+def _or(a: pd.Series, b: pd.Series) -> pd.Series:
+    # a or b
+    return pd.Series(np.where(_mask(_truthy_u, a), _arr(a), _arr(b)), dtype=object)
+
+
+def _choose(a: pd.Series, b: pd.Series) -> pd.Series:
+    # choose(a, b): a salvo que sea None
+    return pd.Series(np.where(_mask(_is_none_u, a), _arr(b), _arr(a)), dtype=object)
+
+
+def _map_memo(s: pd.Series, fn: Callable[[Any], Any]) -> pd.Series:
+    # fn por valor distinto (fechas, precios, monedas tienen poca cardinalidad)
+    return pd.Series(map_distinct(fn, _arr(s)), dtype=object)
+
+
+def _put(n: int, idx: np.ndarray, values) -> pd.Series:
+    out = np.full(n, None, dtype=object)
+    out[idx] = np.asarray(values, dtype=object)
+    return pd.Series(out, dtype=object)
+
+
+def normalize_str_col(s: pd.Series) -> pd.Series:
+    """normalize_str aplicado a una columna entera."""
+    vals = _arr(s)
+    present = ~_mask(_is_none_u, s)
+    # dtype object en todo el cálculo: con el dtype str de pandas las regex van
+    # por pyarrow, bastante más lento que `re` para estas cadenas cortas
+    st = pd.Series([str(v) for v in vals[present]], dtype=object).str.strip()
+    keep = ((st != "") & (st.str.lower() != "nan")).to_numpy(dtype=bool)
+    # re.sub(r"\s+", " ") sobre texto ya sin bordes == split/join (ambos usan
+    # str.isspace), y split/join es varias veces más rápido en descripciones
+    st = pd.Series([" ".join(v.split()) for v in _arr(st[keep])], dtype=object)
+    dot0 = (st.str.endswith(".0") & st.str[:-2].str.isdigit()).to_numpy(dtype=bool)
+    st = st.where(~dot0, st.str[:-2])
+    return _put(len(vals), np.flatnonzero(present)[keep], st.to_numpy(dtype=object))
+
+
+def normalize_title_col(s: pd.Series) -> pd.Series:
+    """normalize_title aplicado a una columna entera."""
+    t = normalize_str_col(s)
+    present = ~_mask(_is_none_u, t)
+    tt = pd.Series(_arr(t)[present], dtype=object).str.lower()
+    accented = ~tt.str.isascii().to_numpy(dtype=bool)
+    tt[accented] = tt[accented].str.normalize("NFD").str.translate(_MN_TABLE)
+    tt = tt.str.replace(r"[^\w\s]", "", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    return _put(len(t), np.flatnonzero(present), tt.to_numpy(dtype=object))
+
+
+def _long(rows, items) -> pd.DataFrame:
+    # dtype object explícito: pandas convertiría None en NaN al inferir str
+    return pd.DataFrame({"row": np.asarray(rows, dtype=np.int64),
+                         "item": pd.Series(np.asarray(items, dtype=object), dtype=object)})
+
+
+def _explode(parts: pd.Series) -> pd.DataFrame:
+    # Series de listas (índice = fila) → DataFrame largo (row, item) en orden
+    parts = parts[parts.map(len) > 0]
+    items = parts.explode()
+    return _long(items.index, _arr(items))
+
+
+def _author_items(s: pd.Series) -> pd.DataFrame:
+    """normalize_author por columna: (row, autor) en orden, sin vacíos."""
+    truthy = _mask(_truthy_u, s)
+    is_str = truthy & _mask(_is_str_u, s)
+    is_list = truthy & _mask(_is_list_u, s)
+    parts = pd.concat([
+        s[is_str].str.split(r"[|,;]", regex=True),
+        s[is_list],
+    ]).sort_index(kind="stable")
+    long = _explode(parts)
+    items = normalize_str_col(long["item"])
+    keep = ~_mask(_is_none_u, items)
+    return _long(long["row"].to_numpy()[keep], _arr(items)[keep])
+
+
+def _category_items(s: pd.Series) -> pd.DataFrame:
+    """normalize_categories por columna: (row, categoría) en orden."""
+    truthy = _mask(_truthy_u, s)
+    is_list = truthy & _mask(_is_list_u, s)
+
+    from_lists = _explode(s[is_list])
+    from_lists = from_lists[_mask(_truthy_u, from_lists["item"])]
+    from_lists = _long(from_lists["row"], _arr(from_lists["item"].map(str).str.strip()))
+
+    scalars = s[truthy & ~is_list].map(str)
+    piped = scalars.str.contains("|", regex=False).to_numpy(dtype=bool)
+    from_pipes = _explode(scalars[piped].str.split("|", regex=False))
+    from_pipes = _long(from_pipes["row"], _arr(from_pipes["item"].str.strip()))
+    from_pipes = from_pipes[from_pipes["item"] != ""]
+    single = scalars[~piped].str.strip()
+    from_single = _long(single.index, _arr(single))
+
+    out = pd.concat([from_lists, from_pipes, from_single], ignore_index=True)
+    return out.sort_values("row", kind="stable")
+
+
+def _merge_lists(left: pd.DataFrame, right: pd.DataFrame, n: int) -> Tuple[pd.Series, pd.Series]:
+    """dict.fromkeys(left + right) por fila → (' | '.join, primer elemento)."""
+    both = pd.concat([left, right], ignore_index=True).sort_values("row", kind="stable")
+    both = both.drop_duplicates(subset=["row", "item"], keep="first")
+    rows, items = both["row"].to_numpy(), _arr(both["item"])
+
+    # la mayoría de filas tienen un solo elemento: solo se une el resto
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(rows)]
+    joined = items[starts].copy()
+    for k in np.flatnonzero(ends - starts > 1):
+        joined[k] = " | ".join(items[starts[k]:ends[k]])
+    return _put(n, rows[starts], joined), _put(n, rows[starts], items[starts])
+
+
+def _has_rows(items: pd.DataFrame, n: int) -> np.ndarray:
+    out = np.zeros(n, dtype=bool)
+    out[items["row"].to_numpy()] = True
+    return out
+
+
+# -------------------------
+# Matching vectorizado
+# -------------------------
+
+def _first_author_col(s: pd.Series) -> pd.Series:
+    # get_first_author por columna ("" si no hay autores)
+    items = _author_items(s)
+    first = items.drop_duplicates("row", keep="first")
+    out = _put(len(s), first["row"].to_numpy(), first["item"].to_numpy(dtype=object))
+    return out.where(~_mask(_is_none_u, out), "")
+
+
+def _title_author_key(df: pd.DataFrame) -> pd.Series:
+    tnorm = normalize_title_col(_col(df, "title"))
+    afirst = _first_author_col(_col(df, "authors"))
+    ok = _mask(_truthy_u, tnorm) & _mask(_truthy_u, afirst)
+    key = pd.Series([None] * len(df), dtype=object)
+    key[ok] = (tnorm[ok] + "||" + afirst[ok]).to_numpy(dtype=object)
+    return key
+
+
+def match_columnar(df_good: pd.DataFrame, df_gg: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Equivalente a match_google para todas las filas: join por ISBN-13 normalizado
+    y, para las que no casan, join por título normalizado + primer autor. Devuelve la
+    posición del registro de Google (-1 sin match) y el merge_method.
+    """
+    n = len(df_good)
+    pos = np.full(n, -1, dtype=np.int64)
+    method = np.full(n, "none", dtype=object)
+    if df_gg.empty or n == 0:
+        return pos, method
+
+    # índice por ISBN-13 normalizado (también desde el ISBN-10): mismas claves
+    # y mismo orden de asignación que el dict de build_google_index, así que
+    # ante repetidos gana el último
+    k13 = np.asarray(isbn13_key_batch(_arr(_col(df_gg, "isbn13"))), dtype=object)
+    k10 = np.asarray(isbn13_key_batch(_arr(_col(df_gg, "isbn10"))), dtype=object)
+    k10[k10 == k13] = None
+    keys = np.column_stack([k13, k10]).ravel()
+    owner = np.repeat(np.arange(len(df_gg)), 2)
+    has = keys != None  # noqa: E711
+    by_isbn = pd.Series(owner[has], index=keys[has])
+    by_isbn = by_isbn[~by_isbn.index.duplicated(keep="last")]
+
+    # Goodreads: primera clave que case entre isbn13, isbn e isbn10
+    ok = np.zeros(n, dtype=bool)
+    for name in ("isbn13", "isbn", "isbn10"):
+        rest = np.flatnonzero(~ok)
+        if not len(rest):
+            break
+        gr_key = pd.Series(isbn13_key_batch(_arr(_col(df_good, name))[rest]), dtype=object)
+        hit = gr_key.map(by_isbn).to_numpy(dtype=float)
+        found = ~np.isnan(hit)
+        pos[rest[found]] = hit[found].astype(np.int64)
+        method[rest[found]] = "isbn13"
+        ok[rest[found]] = True
+
+    # índice título||autor de Google (gana el primero, como setdefault)
+    gg_key = _title_author_key(df_gg)
+    has = ~_mask(_is_none_u, gg_key)
+    by_key = pd.Series(np.flatnonzero(has), index=gg_key[has].to_numpy(dtype=object))
+    by_key = by_key[~by_key.index.duplicated(keep="first")]
+
+    rest = np.flatnonzero(~ok)
+    gr_key = _title_author_key(df_good.iloc[rest])
+    hit = gr_key.map(by_key).to_numpy(dtype=float)
+    ok2 = ~np.isnan(hit) & ~_mask(_is_none_u, gr_key)
+    pos[rest[ok2]] = hit[ok2].astype(np.int64)
+    method[rest[ok2]] = "heuristic"
+
+    return pos, method
+
+
+# -------------------------
+# Merge columnar
+# -------------------------
+
+def merge_columnar(df_good: pd.DataFrame, df_gg: pd.DataFrame, pos: np.ndarray) -> pd.DataFrame:
+    """
+    merge_records para todas las filas de `df_good` a la vez. `pos[i]` es la
+    posición en `df_gg` del registro casado con la fila i (-1 si ninguno).
+    Devuelve un DataFrame (dtype object) con las columnas de dim_book.
+    """
+    df_good = df_good.reset_index(drop=True)
+    n = len(df_good)
+    pos = np.asarray(pos, dtype=np.int64)
+    matched = pos >= 0
+
+    def gr(name):
+        return _col(df_good, name)
+
+    def gg(name):
+        if df_gg.empty:
+            return pd.Series([None] * n, dtype=object)
+        return _aligned(_col(df_gg, name), pos)
+
+    # título
+    t_g = normalize_str_col(gr("title"))
+    t_gg = normalize_str_col(gg("title"))
+    title = _choose(t_g, t_gg)
+
+    # autores
+    a_g = _author_items(gr("authors"))
+    a_gg = _author_items(gg("authors"))
+    authors, first_author = _merge_lists(a_g, a_gg, n)
+
+    # categorías
+    c_g = _category_items(_or(gr("genres"), gr("categories")))
+    c_gg = _category_items(gg("categories"))
+    categories, _ = _merge_lists(c_g, c_gg, n)
+
+    # fechas
+    pub_g = _map_memo(_or(gr("publication_date"), gr("pub_date")), iso_date)
+    pub_gg = _map_memo(gg("pub_date"), iso_date)
+    pub_date = _choose(pub_g, pub_gg)
+
+    present = ~_mask(_is_none_u, pub_date)
+    dates = pd.Series(_arr(pub_date)[present], dtype=object)
+    has_year = dates.str.match(r"^\d{4}").to_numpy(dtype=bool)
+    idx = np.flatnonzero(present)[has_year]
+    pub_year = _put(n, idx, dates[has_year].str[:4].map(int).to_numpy(dtype=object))
+
+    # precio
+    price_amt = _map_memo(gg("price_amount"), safe_decimal)
+    price_cur = _map_memo(gg("price_currency"), normalize_currency)
+
+    # ISBN
+    isbn13 = _or(normalize_str_col(gr("isbn13")), normalize_str_col(gg("isbn13")))
+    isbn10 = _or(normalize_str_col(_or(gr("isbn"), gr("isbn10"))), normalize_str_col(gg("isbn10")))
+
+    # publisher y descripción
+    publisher = _choose(normalize_str_col(gr("publisher")), normalize_str_col(gg("publisher")))
+    description = _choose(normalize_str_col(_or(gr("description"), gr("desc"))),
+                          normalize_str_col(gg("description")))
+
+    # canonical_id: ISBN13 → ISBN10 → hash estable de título+autor+editor+año
+    cid = _or(isbn13, isbn10)
+    need = np.flatnonzero(~_mask(_truthy_u, cid))
+    if len(need):
+        tnorm = normalize_title_col(title[need])
+        years = pub_year[need].map(lambda y: str(y or ""))
+        hashes = [stable_hash([t or "", a or "", p or "", y or ""])
+                  for t, a, p, y in zip(_arr(tnorm), _arr(first_author[need]), _arr(publisher[need]), _arr(years))]
+        cid[need] = np.asarray(hashes, dtype=object)
+
+    # páginas
+    num_pages = _choose(gr("num_pages"), gg("pageCount"))
+
+    # preferencia
+    score_g = (_mask(_truthy_u, t_g).astype(int) + _has_rows(a_g, n) + _mask(_truthy_u, pub_g)
+               + _mask(_truthy_u, gr("num_pages")))
+    score_gg = (_mask(_truthy_u, t_gg).astype(int) + _has_rows(a_gg, n) + _mask(_truthy_u, pub_gg)
+                + _mask(_truthy_u, price_amt) + _mask(_truthy_u, gg("isbn13")))
+    prefer_google = score_g < score_gg
+    prefer = pd.Series(np.where(prefer_google, "google", "goodreads"), dtype=object)
+
+    url_pref = gr("url")
+    use_gg = matched & prefer_google
+    url_pref[use_gg] = _arr(_or(gg("gb_url"), gr("url")))[use_gg]
+
+    return pd.DataFrame({
+        "canonical_id": cid,
+        "isbn13": isbn13,
+        "isbn10": isbn10,
+        "title": title,
+        "authors": authors,
+        "first_author": first_author,
+        "publisher": publisher,
+        "pub_date": pub_date,
+        "pub_year": pub_year,
+        "language": _or(gr("language"), gg("language")),
+        "categories": categories,
+        "num_pages": num_pages,
+        "format": _choose(gr("format"), gg("format")),
+        "description": description,
+        "rating_value": gr("rating_value"),
+        "rating_count": gr("rating_count"),
+        "price_amount": price_amt,
+        "price_currency": price_cur,
+        "source_preference": prefer,
+        "most_complete_url": url_pref,
+        "ingestion_date_goodreads": gr("ingestion_date"),
+        "ingestion_date_google": gg("ingestion_date_google"),
+    }, columns=OUTPUT_COLUMNS)
@@ -0,0 +1,325 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.utils_runmetrics import RunMetrics
+
+
+# -------------------------
+# CONFIG
+# -------------------------
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = PROJECT_ROOT / "src"
+
+# Huella de cada etapa en la última ejecución correcta
+STATE_PATH = PROJECT_ROOT / "standard" / "_orchestrator_state.json"
+STATE_VERSION = 1
+RUN_METRICS = PROJECT_ROOT / "docs" / "run_metrics.json"
+
+# El scraper no tiene entradas locales: por defecto se salta por su huella y
+# solo se repite por antigüedad si se pide (horas) para recoger libros nuevos
+RESCRAPE_AFTER_HOURS: Optional[float] = None
+# Cada cuánto mira el enriquecimiento si el scraper ha escrito libros nuevos
+FOLLOW_POLL_SECONDS = 5.0
+
+RUN = RunMetrics("orchestrator")
+
+
+# -------------------------
+# DAG
+# -------------------------
+
+@dataclass
+class Stage:
+    """
+    Una etapa del DAG: un script de src/ con sus dependencias, los ficheros
+    que lee (inputs) y que deja (outputs, patrones glob). `follows` es una
+    dependencia que se puede ir consumiendo mientras aún corre (p. ej. el
+    enriquecimiento sobre lo que el scraper ya ha guardado).
+    """
+    name: str
+    script: str
+    deps: Tuple[str, ...] = ()
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    args: List[str] = field(default_factory=list)
+    env_params: Tuple[str, ...] = ()
+    follows: Optional[str] = None
+    max_age_hours: Optional[float] = None
+
+
+def build_dag(integrate_args: Sequence[str] = (), rescrape_after_hours: Optional[float] = RESCRAPE_AFTER_HOURS) -> List[Stage]:
+    return [
+        Stage("scrape", "scrape_goodreads.py",
+              outputs=("landing/goodreads_books.json",),
+              env_params=("GOODREADS_BASE_URL",),
+              max_age_hours=rescrape_after_hours),
+        Stage("enrich", "enrich_googlebooks.py", deps=("scrape",),
+              inputs=("landing/goodreads_books.json",),
+              outputs=("landing/googlebooks_books.csv",),
+              env_params=("GOOGLE_API_URL",),
+              follows="scrape"),
+        Stage("integrate", "integrate_pipeline.py", deps=("scrape", "enrich"),
+              inputs=("landing/goodreads_books.json", "landing/googlebooks_books.csv",
+                      "landing/googlebooks_books.parquet"),
+              outputs=("standard/dim_book.*", "docs/quality_metrics.json"),
+              args=list(integrate_args)),
+    ]
+
+
+def topological(stages: List[Stage]) -> List[Stage]:
+    by_name = {s.name: s for s in stages}
+    order, seen = [], set()
+
+    def visit(s: Stage, path: Tuple[str, ...] = ()):
+        if s.name in path:
+            raise ValueError(f"Ciclo en el DAG: {' → '.join(path + (s.name,))}")
+        if s.name in seen:
+            return
+        for d in s.deps:
+            if d not in by_name:
+                raise ValueError(f"La etapa {s.name} depende de una etapa desconocida: {d}")
+            visit(by_name[d], path + (s.name,))
+        seen.add(s.name)
+        order.append(s)
+
+    for s in stages:
+        visit(s)
+    return order
+
+
+# -------------------------
+# HUELLAS
+# -------------------------
+
+_IMPORT_RE = re.compile(r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))", re.M)
+
+
+def code_files(script: str) -> List[Path]:
+    """El script y todos los módulos de src/ que importa, directa o indirectamente."""
+    todo, found = [SRC_DIR / script], []
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found.append(path)
+        for m in _IMPORT_RE.finditer(path.read_text(encoding="utf-8")):
+            mod = SRC_DIR.joinpath(*(m.group(1) or m.group(2)).split(".")).with_suffix(".py")
+            if mod.exists() and mod not in found:
+                todo.append(mod)
+    return sorted(found)
+
+
+def file_digest(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_fingerprint(stage: Stage) -> Dict[str, str]:
+    """Huella por componente: código, entradas y parámetros."""
+    def digest(obj) -> str:
+        return hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+    code = {str(p.relative_to(SRC_DIR)): file_digest(p) for p in code_files(stage.script)}
+    inputs = {rel: file_digest(PROJECT_ROOT / rel) for rel in stage.inputs}
+    params = {"args": stage.args, "env": {k: os.environ.get(k) for k in stage.env_params}}
+    return {"code": digest(code), "inputs": digest(inputs), "params": digest(params)}
+
+
+def outputs_exist(stage: Stage) -> bool:
+    return all(any(PROJECT_ROOT.glob(pattern)) for pattern in stage.outputs)
+
+
+def load_state(path: Path) -> Dict:
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return state.get("stages", {}) if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(path: Path, stages: Dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, "stages": stages}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def why_run(stage: Stage, fp: Dict[str, str], prev: Optional[Dict], forced: bool) -> Optional[str]:
+    """Motivo para ejecutar la etapa, o None si se puede saltar."""
+    if forced:
+        return "forzada"
+    if not prev:
+        return "sin ejecuciones previas"
+    changed = [k for k in ("code", "inputs", "params") if prev.get("fingerprint", {}).get(k) != fp[k]]
+    if changed:
+        names = {"code": "código", "inputs": "entradas", "params": "parámetros"}
+        return "cambian " + ", ".join(names[k] for k in changed)
+    if not outputs_exist(stage):
+        return "faltan salidas"
+    if stage.max_age_hours is not None and time.time() - prev.get("finished_ts", 0) > stage.max_age_hours * 3600:
+        return f"más de {stage.max_age_hours:g} h desde la última ejecución"
+    return None
+
+
+# -------------------------
+# EJECUCIÓN
+# -------------------------
+
+class Orchestrator:
+    """
+    Ejecuta el DAG con un hilo por etapa: cada una espera a sus dependencias,
+    calcula su huella y se salta si no ha cambiado nada. Las etapas sin
+    dependencia entre sí corren en paralelo; una etapa con `follows` se lanza
+    en rondas mientras su dependencia escribe y una última vez al acabar.
+    """
+
+    def __init__(self, stages: List[Stage], force: Sequence[str] = (), only: Optional[Sequence[str]] = None,
+                 dry_run: bool = False, poll_seconds: float = FOLLOW_POLL_SECONDS, state_path: Path = STATE_PATH):
+        self.stages = topological(stages)
+        self.force = set(force)
+        self.only = set(only) if only else None
+        self.dry_run = dry_run
+        self.poll_seconds = poll_seconds
+        self.state_path = state_path
+        self.state = load_state(state_path)
+        self.results: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._running: Dict[str, threading.Event] = {s.name: threading.Event() for s in self.stages}
+
+    def _command(self, stage: Stage) -> List[str]:
+        return [sys.executable, str(SRC_DIR / stage.script), *stage.args]
+
+    def _exec(self, stage: Stage, label: str) -> bool:
+        print(f"[INFO] ▶ {label}: {' '.join(self._command(stage)[1:])}", flush=True)
+        with RUN.stage(stage.name):
+            proc = subprocess.run(self._command(stage), cwd=PROJECT_ROOT)
+        if proc.returncode != 0:
+            print(f"[ERROR] {label} terminó con código {proc.returncode}")
+        return proc.returncode == 0
+
+    def _follow(self, stage: Stage, leader: Future):
+        # Rondas sobre lo que la dependencia ya ha escrito, mientras sigue corriendo
+        watched = [PROJECT_ROOT / rel for rel in stage.inputs]
+        last = None
+        rounds = 0
+        while not leader.done():
+            if not self._running[stage.follows].wait(timeout=self.poll_seconds):
+                continue
+            size = tuple(p.stat().st_size if p.exists() else -1 for p in watched)
+            if size != last and all(s > 0 for s in size):
+                last = size
+                rounds += 1
+                self._exec(stage, f"{stage.name} (ronda {rounds}, {stage.follows} en curso)")
+            else:
+                time.sleep(self.poll_seconds)
+        return rounds
+
+    def _run_stage(self, stage: Stage, futures: Dict[str, Future]) -> Dict:
+        selected = self.only is None or stage.name in self.only
+        rounds = 0
+        if selected and stage.follows and stage.follows in futures and not self.dry_run:
+            rounds = self._follow(stage, futures[stage.follows])
+        failed = [d for d in stage.deps if d in futures and futures[d].result()["status"] == "failed"]
+        if failed:
+            print(f"[WARN] {stage.name}: no se ejecuta porque falló {', '.join(failed)}")
+            return {"status": "failed", "reason": f"falló {', '.join(failed)}", "seconds": 0.0}
+
+        if not selected:
+            return {"status": "skipped", "reason": "fuera de --only", "seconds": 0.0}
+
+        fp = stage_fingerprint(stage)
+        reason = why_run(stage, fp, self.state.get(stage.name), stage.name in self.force)
+        if reason is None:
+            print(f"[INFO] ⏭ {stage.name}: sin cambios, se salta")
+            return {"status": "skipped", "reason": "sin cambios", "seconds": 0.0}
+        if self.dry_run:
+            print(f"[INFO] {stage.name}: se ejecutaría ({reason})")
+            return {"status": "pending", "reason": reason, "seconds": 0.0}
+
+        t0 = time.perf_counter()
+        self._running[stage.name].set()
+        ok = self._exec(stage, f"{stage.name} ({reason})")
+        seconds = round(time.perf_counter() - t0, 3)
+        if not ok:
+            return {"status": "failed", "reason": reason, "seconds": seconds, "rounds": rounds}
+
+        # La huella se toma al terminar: las entradas son las que realmente se procesaron
+        with self._lock:
+            self.state[stage.name] = {
+                "fingerprint": stage_fingerprint(stage),
+                "finished_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "finished_ts": time.time(),
+                "seconds": seconds,
+            }
+            save_state(self.state_path, self.state)
+        return {"status": "ran", "reason": reason, "seconds": seconds, "rounds": rounds}
+
+    def run(self) -> bool:
+        futures: Dict[str, Future] = {}
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as pool:
+            for stage in self.stages:
+                futures[stage.name] = pool.submit(self._run_stage, stage, futures)
+            for name, fut in futures.items():
+                self.results[name] = fut.result()
+
+        print("\n[INFO] Resumen del orquestador:")
+        for name, r in self.results.items():
+            extra = f", {r['rounds']} rondas en paralelo" if r.get("rounds") else ""
+            print(f"[INFO]   {name:<10} {r['status']:<8} {r['seconds']:>8.1f} s  ({r['reason']}{extra})")
+        if not self.dry_run:
+            RUN.record("stages", self.results)
+            RUN.write(RUN_METRICS)
+        return all(r["status"] != "failed" for r in self.results.values())
+
+
+# -------------------------
+# CLI
+# -------------------------
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(
+        description="Orquestador scrape → enrich → integrate: salta las etapas cuya huella "
+                    "(código, entradas y parámetros) no ha cambiado. Las opciones que no reconoce "
+                    "se pasan a integrate_pipeline.py (p. ej. --streaming, --formats parquet)")
+    ap.add_argument("--force", default="",
+                    help="etapas a ejecutar aunque no hayan cambiado, separadas por comas (scrape, enrich, integrate)")
+    ap.add_argument("--only", default="",
+                    help="ejecutar solo estas etapas, separadas por comas (el resto se salta)")
+    ap.add_argument("--dry-run", action="store_true", help="mostrar qué etapas se ejecutarían y por qué")
+    ap.add_argument("--rescrape-after-hours", type=float, default=RESCRAPE_AFTER_HOURS,
+                    help="repetir el scraping pasadas estas horas aunque no cambie su huella "
+                         "(por defecto solo se repite si cambia la huella)")
+    ap.add_argument("--poll-seconds", type=float, default=FOLLOW_POLL_SECONDS,
+                    help="cada cuánto busca el enriquecimiento libros nuevos mientras corre el scraper")
+    args, integrate_args = ap.parse_known_args()
+
+    stages = build_dag(integrate_args, args.rescrape_after_hours)
+    names = {s.name for s in stages}
+    force = [s.strip() for s in args.force.split(",") if s.strip()]
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = [s for s in force + only if s not in names]
+    if unknown:
+        ap.error(f"etapas desconocidas: {', '.join(unknown)} (usar {', '.join(sorted(names))})")
+
+    orch = Orchestrator(stages, force=force, only=only or None, dry_run=args.dry_run,
+                        poll_seconds=args.poll_seconds)
+    raise SystemExit(0 if orch.run() else 1)
@@ -2,15 +2,27 @@
 # 📦 Imports y configuración base
 # ===============================================
 from bs4 import BeautifulSoup
-import requests, re, json, time, os
+import requests, re, json, time, os, queue, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict, field
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
+
+import lxml.html
+
+from utils.utils_http import HostRateLimiter, mount_pool, retry_after_seconds
+from utils.utils_cache import HtmlCache
+from utils.utils_runmetrics import RunMetrics, get_logger
 
 # ===============================================
 # 🌍 Constantes y sesión HTTP
 # ===============================================
-BASE_URL = "https://www.goodreads.com/book/show/"
+# Se puede apuntar a otro host (p. ej. el servidor local de
+# benchmarks/fake_http_server.py) con GOODREADS_BASE_URL
+GOODREADS_URL = os.environ.get("GOODREADS_BASE_URL", "https://www.goodreads.com").rstrip("/")
+BASE_URL = f"{GOODREADS_URL}/book/show/"
+SEARCH_URL = f"{GOODREADS_URL}/search?q=data+science"
 
 SESSION = requests.Session()
 SESSION.headers.update({
@@ -20,6 +32,35 @@ SESSION.headers.update({
     )
 })
 
+# Concurrencia y cortesía: nº de hilos de descarga y
+# presupuesto máximo de peticiones por segundo y host
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 1.5
+MAX_RETRIES = 2
+ID_QUEUE_SIZE = 50   # IDs descubiertos pendientes de descarga (backpressure)
+
+RATE_LIMITER = HostRateLimiter(REQUESTS_PER_SECOND)
+mount_pool(SESSION, MAX_WORKERS)
+
+# Caché de HTML en disco. Modos: normal | refresh | offline | off
+# (offline = solo caché, útil para re-parsear sin tocar la red)
+CACHE_DIR = "cache/goodreads_html"
+CACHE_MODE = os.environ.get("GOODREADS_CACHE_MODE", "normal")
+BOOK_PAGE_TTL = 7 * 24 * 3600
+SEARCH_PAGE_TTL = 24 * 3600
+
+HTML_CACHE = HtmlCache(CACHE_DIR, mode=CACHE_MODE)
+
+# Salida: una línea JSON por libro, sincronizada a disco cada FSYNC_EVERY libros
+OUTPUT_PATH = "landing/goodreads_books.json"
+FSYNC_EVERY = 25
+
+# Tiempos por etapa, latencias y contadores (docs/run_metrics.json). Los mensajes
+# por libro salen a nivel DEBUG (PIPELINE_LOG_LEVEL=DEBUG para verlos)
+RUN_METRICS_PATH = "docs/run_metrics.json"
+RUN = RunMetrics("scrape_goodreads")
+LOG = get_logger("scrape_goodreads")
+
 # ===============================================
 # 🧱 Dataclass BookData
 # ===============================================
@@ -185,59 +226,270 @@ def parse_details_from_embedded_json(html: str, bd: BookData) -> BookData:
 
 
 # ===============================================
-# 🌐 Obtener HTML del libro
+# 🚄 Parser de una sola pasada (__NEXT_DATA__)
 # ===============================================
-def fetch_book_html(book_id: str) -> Optional[str]:
+NEXT_DATA_TAG = '<script id="__NEXT_DATA__"'
+
+
+def load_next_data(html: str) -> Optional[Dict]:
+    # Localiza el estado embebido con str.find (sin regex) y lo decodifica una vez
+    start = html.find(NEXT_DATA_TAG)
+    if start < 0:
+        return None
+    start = html.find(">", start) + 1
+    end = html.find("</script>", start)
+    if start <= 0 or end < 0:
+        return None
     try:
-        r = SESSION.get(f"{BASE_URL}{book_id}", timeout=30)
-        if r.status_code == 200:
-            return r.text
-    except:
-        pass
+        return json.loads(html[start:end])
+    except ValueError:
+        return None
+
+
+def _deref(state: Dict, obj: Any) -> Dict:
+    if isinstance(obj, dict) and "__ref" in obj:
+        return state.get(obj["__ref"]) or {}
+    return obj if isinstance(obj, dict) else {}
+
+
+def _find_book_state(state: Dict, book_id: str) -> Optional[Dict]:
+    books = [v for k, v in state.items() if k.startswith("Book:") and isinstance(v, dict)]
+    for b in books:
+        if str(b.get("legacyId")) == str(book_id):
+            return b
+    for b in books:
+        if b.get("details"):
+            return b
+    return books[0] if books else None
+
+
+def _fill_from_state(bd: BookData, state: Dict, book: Dict):
+    bd.title = book.get("title")
+
+    edges = [book.get("primaryContributorEdge")] + list(book.get("secondaryContributorEdges") or [])
+    names = [_deref(state, (e or {}).get("node")).get("name") for e in edges]
+    bd.authors = list(dict.fromkeys(n.strip() for n in names if n))
+
+    stats = _deref(state, book.get("work")).get("stats") or {}
+    if stats.get("averageRating") is not None:
+        bd.rating_value = float(stats["averageRating"])
+    if stats.get("ratingsCount") is not None:
+        bd.rating_count = int(stats["ratingsCount"])
+
+    details = book.get("details") or {}
+    bd.format = details.get("format")
+    bd.num_pages = details.get("numPages")
+    bd.publisher = details.get("publisher")
+    bd.isbn = details.get("isbn")
+    bd.isbn13 = details.get("isbn13")
+
+    ts = details.get("publicationTime")
+    bd.publication_timestamp = ts
+    if ts:
+        bd.publication_date = datetime.fromtimestamp(ts / 1000).strftime("%Y-%m-%d")
+
+    lang = details.get("language")
+    if isinstance(lang, dict):
+        bd.language = lang.get("name", "").lower().strip()
+
+    bd.genres = [g["genre"]["name"] for g in book.get("bookGenres") or []
+                 if isinstance(g, dict) and g.get("genre")]
+
+    desc = book.get("description")
+    if not (isinstance(desc, str) and desc.strip()):
+        desc = next((v for k, v in book.items()
+                     if k.startswith("description") and isinstance(v, str) and v.strip()), None)
+    bd.description = desc.strip() if desc else None
+
+
+def _fill_from_dom(bd: BookData, html: str):
+    # Solo se llega aquí si el estado embebido no trae algún campo básico
+    doc = lxml.html.fromstring(html)
+
+    if not bd.title:
+        el = doc.find_class("Text__title1")
+        bd.title = el[0].text_content().strip() if el else None
+
+    if not bd.authors:
+        names = [a.text_content().strip() for a in doc.find_class("ContributorLink__name")]
+        bd.authors = list(dict.fromkeys(n for n in names if n))
+
+    if bd.rating_value is None:
+        el = doc.find_class("RatingStatistics__rating")
+        try:
+            bd.rating_value = float(el[0].text_content().strip()) if el else None
+        except ValueError:
+            pass
+
+    for script in doc.xpath('//script[@type="application/ld+json"]'):
+        try:
+            d = json.loads(script.text or "")
+        except ValueError:
+            continue
+        if not isinstance(d, dict):
+            continue
+        if not bd.description and isinstance(d.get("description"), str) and d["description"].strip():
+            bd.description = d["description"].strip()
+        if bd.rating_count is None:
+            count = (d.get("aggregateRating") or {}).get("ratingCount")
+            if count is not None:
+                bd.rating_count = int(re.sub(r"[^\d]", "", str(count)) or 0)
+        if not bd.isbn13 and isinstance(d.get("isbn"), str) and len(d["isbn"]) == 13:
+            bd.isbn13 = d["isbn"]
+
+
+def parse_book_page(html: str, book_id: str) -> BookData:
+    """
+    Extrae todos los campos de BookData decodificando __NEXT_DATA__ una sola vez.
+    Si faltan título, autores, valoración o descripción se completa con una
+    pasada DOM (lxml) sobre el HTML.
+    """
+    bd = BookData(id=book_id, url=f"{BASE_URL}{book_id}")
+
+    data = load_next_data(html)
+    state = (((data or {}).get("props") or {}).get("pageProps") or {}).get("apolloState") or {}
+    book = _find_book_state(state, book_id)
+    if book:
+        _fill_from_state(bd, state, book)
+
+    if not bd.title or not bd.authors or bd.rating_value is None or bd.rating_count is None or not bd.description:
+        _fill_from_dom(bd, html)
+
+    return bd
+
+
+# ===============================================
+# 🌐 Obtener HTML del libro
+# ===============================================
+def _http_get(url: str, headers: Dict[str, str]) -> Optional[requests.Response]:
+    # Petición real: respeta el presupuesto por host y reintenta los 429
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            RUN.count("http_retries")
+        try:
+            RATE_LIMITER.wait(url)
+            t0 = time.perf_counter()
+            r = SESSION.get(url, headers=headers, timeout=30)
+        except:
+            RUN.count("http_errors")
+            return None
+        RUN.observe("goodreads", time.perf_counter() - t0)
+        RUN.count(f"http_{r.status_code}")
+        if r.status_code != 429:
+            return r
+        RATE_LIMITER.backoff(url, retry_after_seconds(r))
     return None
 
 
+def fetch_book_html(book_id: str) -> Optional[str]:
+    with RUN.stage("fetch", rows=1):
+        return HTML_CACHE.fetch(f"{BASE_URL}{book_id}", BOOK_PAGE_TTL, _http_get)
+
+
 # ===============================================
 # 📘 Obtener datos del libro
 # ===============================================
-def get_book(book_id: str) -> BookData:
-    html = fetch_book_html(book_id)
-    if html is None:
-        return BookData(id=book_id, url=f"{BASE_URL}{book_id}")
-
+def parse_book_legacy(html: str, book_id: str) -> BookData:
+    # Parser anterior (varias pasadas sobre el HTML); se conserva para el benchmark
     bd = parse_basic(html, book_id)
     bd = parse_details_from_embedded_json(html, bd)
     bd.genres = extract_genres(html)
     bd.description = extract_description(html)
+    return bd
+
+
+def parse_book(html: str, book_id: str) -> BookData:
+    with RUN.stage("parse", rows=1):
+        bd = parse_book_page(html, book_id)
     bd.ingestion_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     return bd
 
 
+def get_book(book_id: str) -> BookData:
+    html = fetch_book_html(book_id)
+    if html is None:
+        return BookData(id=book_id, url=f"{BASE_URL}{book_id}")
+    return parse_book(html, book_id)
+
+
+# ===============================================
+# ⚡ Descarga concurrente de libros
+# ===============================================
+def _scrape_one(book_id: str) -> Optional[BookData]:
+    LOG.debug("Scrapeando: %s", book_id)
+    html = fetch_book_html(book_id)
+    if html is None:
+        return None
+    try:
+        return parse_book(html, book_id)
+    except Exception as e:
+        LOG.warning("Error parseando %s: %s", book_id, e)
+        return None
+
+
+def iter_books_concurrent(ids: Iterable[str], workers: int = MAX_WORKERS) -> Iterator[Tuple[str, Optional[BookData]]]:
+    """
+    Descarga libros con un pool de `workers` hilos sobre la SESSION compartida
+    y devuelve (id, BookData | None) en el mismo orden que `ids`.
+    Como mucho hay 2 * workers descargas en vuelo; el ritmo real lo marca
+    RATE_LIMITER, así que más hilos no significa más carga sobre Goodreads.
+    """
+    pending = deque()
+    it = iter(ids)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for bid in it:
+            pending.append((bid, pool.submit(_scrape_one, bid)))
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            bid, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(_scrape_one, nxt)))
+            yield bid, fut.result()
+
+
+def get_books_concurrent(ids: Iterable[str], workers: int = MAX_WORKERS) -> Tuple[List[BookData], List[str]]:
+    books, failed = [], []
+    for bid, bd in iter_books_concurrent(ids, workers):
+        if bd is None:
+            failed.append(bid)
+        else:
+            books.append(bd)
+    return books, failed
+
+
 # ===============================================
 # 🔎 Obtener IDs de libro de la búsqueda
 # ===============================================
-def get_book_ids_from_search(search_url: str, limit: int = 20) -> List[str]:
-    ids = []
+def iter_book_ids_from_search(search_url: str, limit: int = 20, skip_ids: Iterable[str] = ()) -> Iterator[str]:
+    # Generador: entrega cada ID nuevo en cuanto aparece en una página de resultados.
+    # Los de `skip_ids` (ya guardados) no se entregan ni cuentan para `limit`.
+    skip = set(skip_ids)
     seen = set()
+    pending = 0
     page = 1
 
     print("📚 Buscando libros...")
 
-    while len(ids) < limit:
+    while pending < limit:
         paged = f"{search_url}&page={page}"
-        print(f"[INFO] Página {page}: {paged}")
+        LOG.debug("Página %d: %s", page, paged)
 
-        r = SESSION.get(paged, timeout=30)
-        if r.status_code != 200:
+        with RUN.stage("search"):
+            html = HTML_CACHE.fetch(paged, SEARCH_PAGE_TTL, _http_get)
+        if html is None:
             break
 
-        soup = BeautifulSoup(r.text, "html.parser")
+        soup = BeautifulSoup(html, "html.parser")
 
         # Capturar MUCHOS más enlaces
         links = soup.select('a[href*="/book/show/"]')
         if not links:
             break
 
+        before = len(seen)
         for l in links:
             href = l.get("href", "")
             m = re.search(r'/book/show/(\d+)', href)
@@ -245,37 +497,184 @@ def get_book_ids_from_search(search_url: str, limit: int = 20) -> List[str]:
                 bid = m.group(1)
                 if bid not in seen:
                     seen.add(bid)
-                    ids.append(bid)
-                    print(" ➕ Nuevo ID:", bid)
-                    if len(ids) >= limit:
+                    if bid in skip:
+                        continue
+                    LOG.debug("Nuevo ID: %s", bid)
+                    pending += 1
+                    yield bid
+                    if pending >= limit:
                         break
+        # una página sin IDs nuevos: la búsqueda ya no da más resultados
+        if len(seen) == before:
+            break
 
         page += 1
-        time.sleep(0.7)
 
+
+def get_book_ids_from_search(search_url: str, limit: int = 20, skip_ids: Iterable[str] = ()) -> List[str]:
+    ids = list(iter_book_ids_from_search(search_url, limit, skip_ids))
     print("📌 IDs finales:", ids)
-    return ids[:limit]
+    return ids
 
 
 # ===============================================
-# 🚀 MAIN
+# 🔀 Búsqueda y descarga solapadas (productor/consumidor)
 # ===============================================
-if __name__ == "__main__":
-    search_url = "https://www.goodreads.com/search?q=data+science"
+_END = object()
+
+
+def crawl_pipelined(search_url: str, limit: int = 20, workers: int = MAX_WORKERS,
+                    queue_size: int = ID_QUEUE_SIZE, skip_ids: Iterable[str] = ()) -> Iterator[Tuple[str, Optional[BookData]]]:
+    """
+    Un hilo recorre la búsqueda y mete los IDs en una cola acotada; `workers`
+    hilos los descargan según llegan. Si la descarga va por detrás, put()
+    bloquea al productor (backpressure) y la memoria no crece.
+    Devuelve (id, BookData | None) en orden de finalización.
+    """
+    ids_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    results_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+
+    def producer():
+        try:
+            # `limit` cuenta solo los pendientes: los ya guardados no ocupan hueco
+            for bid in iter_book_ids_from_search(search_url, limit, skip_ids):
+                ids_q.put(bid)
+        except Exception as e:
+            print(f"[ERROR] Búsqueda interrumpida: {e}")
+        finally:
+            for _ in range(workers):
+                ids_q.put(_END)
+
+    def consumer():
+        # Un libro que falla (p. ej. OSError al guardar en la caché) no puede
+        # matar al hilo sin dejar su _END: el bucle de abajo esperaría para siempre
+        try:
+            while True:
+                bid = ids_q.get()
+                if bid is _END:
+                    return
+                try:
+                    bd = _scrape_one(bid)
+                except Exception as e:
+                    LOG.warning("Error descargando %s: %s", bid, e)
+                    bd = None
+                results_q.put((bid, bd))
+        finally:
+            results_q.put(_END)
+
+    threads = [threading.Thread(target=producer, daemon=True)]
+    threads += [threading.Thread(target=consumer, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    finished = 0
+    while finished < workers:
+        item = results_q.get()
+        if item is _END:
+            finished += 1
+            continue
+        yield item
 
-    ids = get_book_ids_from_search(search_url, limit=20)
 
-    books = []
-    for bid in ids:
-        print("⛏️  Scrapeando:", bid)
-        bd = get_book(bid)
-        books.append(bd)
-        time.sleep(0.8)
+# ===============================================
+# 💾 Salida NDJSON en streaming y reanudación
+# ===============================================
+def load_scraped_ids(path: str) -> set:
+    """
+    IDs ya presentes en la salida. Si el fichero está en el formato antiguo
+    (array JSON) se migra a NDJSON; si la última línea quedó a medias por un
+    corte, se descarta para que las nuevas líneas no se peguen a ella.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(64).lstrip()
+
+    if head.startswith("["):
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(tmp, path)
+        print(f"[INFO] {path} migrado a NDJSON ({len(records)} libros)")
+        return {str(r.get("id")) for r in records}
+
+    ids, valid_bytes = set(), 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                ids.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                pass
+            valid_bytes += len(line)
+
+    if valid_bytes < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+        print(f"[WARN] Línea incompleta descartada al final de {path}")
+
+    return ids
+
+
+class NdjsonBookWriter:
+    """Añade un libro por línea y hace fsync por lotes."""
+
+    def __init__(self, path: str, fsync_every: int = FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.written = 0
+        self._pending = 0
+        self._f = None
 
-    os.makedirs("landing", exist_ok=True)
-    out = "landing/goodreads_books.json"
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._f = open(self.path, "a", encoding="utf-8")
+        return self
 
-    with open(out, "w", encoding="utf-8") as f:
-        json.dump([asdict(b) for b in books], f, indent=4, ensure_ascii=False)
+    def write(self, bd: BookData):
+        with RUN.stage("write", rows=1):
+            self._f.write(json.dumps(asdict(bd), ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.written += 1
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self.sync()
 
-    print(f"✅ Archivo generado: {out}")
+    def sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+
+    def __exit__(self, *exc):
+        self.sync()
+        self._f.close()
+
+
+# ===============================================
+# 🚀 MAIN
+# ===============================================
+if __name__ == "__main__":
+    done = load_scraped_ids(OUTPUT_PATH)
+    if done:
+        print(f"[INFO] Reanudando: {len(done)} libros ya guardados en {OUTPUT_PATH}")
+
+    failed = []
+    with NdjsonBookWriter(OUTPUT_PATH) as out:
+        for bid, bd in crawl_pipelined(SEARCH_URL, limit=20, workers=MAX_WORKERS, skip_ids=done):
+            if bd is None:
+                failed.append(bid)
+            else:
+                out.write(bd)
+
+    if failed:
+        print(f"[WARN] {len(failed)} libros sin descargar (se reintentarán en la próxima ejecución): {failed}")
+
+    print(f"[INFO] Caché HTML ({CACHE_MODE}): {HTML_CACHE.stats}")
+    RUN.record("html_cache", HTML_CACHE.stats)
+    RUN.write(RUN_METRICS_PATH)
+    RUN.print_summary()
+    print(f"✅ {out.written} libros añadidos a {OUTPUT_PATH}")
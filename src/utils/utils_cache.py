@@ -0,0 +1,215 @@
+# utils_cache.py
+# ------------------------------------------
+# Cachés persistentes de la ingesta: HTML de
+# Goodreads guardado en disco y revalidado
+# con ETag / If-Modified-Since, y respuestas
+# de Google Books en SQLite.
+# ------------------------------------------
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+
+
+CACHE_MODES = ("normal", "refresh", "offline", "off")
+
+
+def _sha256(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# -------------------------
+# Caché de HTML
+# -------------------------
+
+class HtmlCache:
+    """
+    Caché de páginas en disco:
+      - index/<sha(url)>.json   → url, hash del contenido, ETag, Last-Modified, fecha
+      - blobs/<sha(html)>.html.gz → HTML comprimido, guardado una sola vez por contenido
+
+    Modos:
+      - normal:  sirve lo que esté dentro del TTL y revalida lo caducado
+      - refresh: revalida siempre (petición condicional)
+      - offline: solo caché, nunca sale a la red
+      - off:     sin caché
+    """
+
+    def __init__(self, root: Path, mode: str = "normal"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Modo de caché no válido: {mode} (usar {', '.join(CACHE_MODES)})")
+        self.root = Path(root)
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _index_path(self, url: str) -> Path:
+        h = _sha256(url)
+        return self.root / "index" / h[:2] / f"{h}.json"
+
+    def _blob_path(self, content_sha: str) -> Path:
+        return self.root / "blobs" / content_sha[:2] / f"{content_sha}.html.gz"
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        try:
+            meta = json.loads(self._index_path(url).read_text(encoding="utf-8"))
+            with gzip.open(self._blob_path(meta["content_sha"]), "rt", encoding="utf-8") as f:
+                meta["html"] = f.read()
+            return meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, url: str, html: str, headers=None) -> Dict:
+        headers = headers or {}
+        content_sha = _sha256(html)
+        blob = self._blob_path(content_sha)
+        if not blob.exists():
+            _atomic_write(blob, gzip.compress(html.encode("utf-8")))
+        meta = {
+            "url": url,
+            "content_sha": content_sha,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        _atomic_write(self._index_path(url), json.dumps(meta).encode("utf-8"))
+        self._count("stored")
+        return meta
+
+    def _touch(self, meta: Dict):
+        meta = {k: v for k, v in meta.items() if k != "html"}
+        meta["fetched_at"] = time.time()
+        _atomic_write(self._index_path(meta["url"]), json.dumps(meta).encode("utf-8"))
+
+    def fetch(self, url: str, ttl: float,
+              get: Callable[[str, Dict], Optional[requests.Response]]) -> Optional[str]:
+        """
+        Devuelve el HTML de `url` usando la caché. `get(url, headers)` hace la
+        petición real (con los límites de cortesía del llamante) y devuelve la
+        respuesta o None si falló.
+        """
+        if self.mode == "off":
+            r = get(url, {})
+            return r.text if r is not None and r.status_code == 200 else None
+
+        entry = self.lookup(url)
+        if entry and (self.mode == "offline" or
+                      (self.mode == "normal" and time.time() - entry["fetched_at"] < ttl)):
+            self._count("hits")
+            return entry["html"]
+
+        if self.mode == "offline":
+            self._count("misses")
+            return None
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = get(url, headers)
+        if r is not None and r.status_code == 304 and entry:
+            self._touch(entry)
+            self._count("revalidated")
+            return entry["html"]
+
+        self._count("misses")
+        if r is not None and r.status_code == 200:
+            self.store(url, r.text, r.headers)
+            return r.text
+
+        # Si la red falla se sirve la copia caducada antes que nada
+        return entry["html"] if entry else None
+
+
+# -------------------------
+# Caché de consultas (Google Books)
+# -------------------------
+
+class QueryCache:
+    """
+    Respuestas crudas de /volumes en SQLite, por consulta normalizada.
+    Las consultas sin resultados se guardan también (caché negativa) con un
+    TTL más corto, para no repetirlas en cada ejecución.
+    """
+
+    def __init__(self, path: Path, ttl: float, negative_ttl: float):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0, "stored": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " query TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " has_items INTEGER NOT NULL,"
+            " fetched_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, query: str) -> Tuple[bool, Optional[Dict]]:
+        """(True, respuesta) si hay una entrada vigente; (False, None) si no."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload, has_items, fetched_at FROM responses WHERE query = ?",
+                (self.normalize(query),),
+            ).fetchone()
+        if row is not None:
+            payload, has_items, fetched_at = row
+            ttl = self.ttl if has_items else self.negative_ttl
+            if time.time() - fetched_at < ttl:
+                self.count("hits" if has_items else "negative_hits")
+                return True, json.loads(payload)
+        self.count("misses")
+        return False, None
+
+    def put(self, query: str, data: Dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (query, payload, has_items, fetched_at) VALUES (?, ?, ?, ?)",
+                (self.normalize(query), json.dumps(data, ensure_ascii=False),
+                 int(bool(data.get("items"))), time.time()),
+            )
+            self._db.commit()
+        self.count("stored")
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return round(100 * (self.stats["hits"] + self.stats["negative_hits"]) / total, 2) if total else 0.0
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,163 @@
+# utils_fuzzy.py
+# ------------------------------------------
+# Matching aproximado título + autor entre
+# fuentes: índice de bloqueo por tokens del
+# título y apellidos, y puntuación de los
+# candidatos con SequenceMatcher.
+# ------------------------------------------
+
+import re
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.utils_isbn import normalize_title, normalize_author
+
+
+FUZZY_THRESHOLD = 0.85       # puntuación mínima (0.7 título + 0.3 autor)
+FUZZY_MIN_AUTHOR = 0.8       # similitud mínima de apellidos, además del umbral
+FUZZY_MAX_BLOCK = 200        # claves con más registros se ignoran (demasiado comunes)
+FUZZY_MAX_CANDIDATES = 20    # candidatos puntuados por registro
+
+TITLE_WEIGHT = 0.7
+AUTHOR_WEIGHT = 0.3
+
+# El título principal termina en el subtítulo o en la serie: "Data Smart: Using…",
+# "The Hobbit (The Lord of the Rings, #0)"
+_SUBTITLE_RE = re.compile(r"[:(\[]")
+
+
+def title_variants(title: Any) -> Tuple[str, str]:
+    """(título completo, título principal) normalizados; "" si no hay título."""
+    full = normalize_title(title) or ""
+    if not full or not isinstance(title, str):
+        return full, full
+    main = normalize_title(_SUBTITLE_RE.split(title, 1)[0]) or full
+    return full, main
+
+
+def author_surnames(authors: Any) -> Set[str]:
+    # último token de cada autor normalizado: "J.R.R. Tolkien" → "tolkien"
+    out = set()
+    for a in normalize_author(authors):
+        tokens = (normalize_title(a) or "").split()
+        if tokens:
+            out.add(tokens[-1])
+    return out
+
+
+@lru_cache(maxsize=65536)
+def _surname_ratio(a: str, b: str) -> float:
+    # los pares de apellidos se repiten mucho entre consultas; por debajo de
+    # FUZZY_MIN_AUTHOR el valor exacto no importa y se devuelve la cota
+    if a == b:
+        return 1.0
+    sm = SequenceMatcher(None, a, b)
+    bound = sm.quick_ratio()
+    return sm.ratio() if bound >= FUZZY_MIN_AUTHOR else bound
+
+
+class _Similar:
+    """
+    SequenceMatcher con la cadena de la consulta fija (difflib indexa `b` una
+    sola vez) y cotas baratas antes de calcular el ratio exacto.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self._sm = SequenceMatcher(None, "", query)
+
+    def at_least(self, other: str, floor: float) -> float:
+        # ratio si es >= floor; si no, 0.0 sin llegar a calcularlo
+        if other == self.query:
+            return 1.0
+        self._sm.set_seq1(other)
+        if self._sm.real_quick_ratio() < floor or self._sm.quick_ratio() < floor:
+            return 0.0
+        r = self._sm.ratio()
+        return r if r >= floor else 0.0
+
+
+def _blocking_keys(main: str, surnames: Set[str]) -> Set[str]:
+    keys = {f"t:{tok}" for tok in main.split() if len(tok) >= 3 or tok.isdigit()}
+    keys.update(f"a:{s}" for s in surnames if len(s) >= 2)
+    return keys
+
+
+class FuzzyIndex:
+    """
+    Índice de bloqueo sobre los registros de una fuente. Cada registro entra
+    en los bloques de los tokens de su título principal y de los apellidos de
+    sus autores; una consulta solo puntúa los registros con los que comparte
+    más bloques, así que el coste es casi lineal y no n·m.
+    """
+
+    def __init__(self, titles: Iterable[Any] = (), authors: Iterable[Any] = (),
+                 max_block: int = FUZZY_MAX_BLOCK, max_candidates: int = FUZZY_MAX_CANDIDATES):
+        self.max_block = max_block
+        self.max_candidates = max_candidates
+        self._titles: List[Tuple[str, str]] = []
+        self._surnames: List[Set[str]] = []
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+        for title, auth in zip(titles, authors):
+            self.add(title, auth)
+
+    def add(self, title: Any, authors: Any) -> int:
+        """Añade un registro al final (posición = orden de llegada) y la devuelve."""
+        pos = len(self._titles)
+        variants, surnames = title_variants(title), author_surnames(authors)
+        self._titles.append(variants)
+        self._surnames.append(surnames)
+        if variants[1] and surnames:
+            for key in _blocking_keys(variants[1], surnames):
+                self._blocks[key].append(pos)
+        return pos
+
+    def candidates(self, main: str, surnames: Set[str]) -> List[int]:
+        shared = Counter()
+        for key in _blocking_keys(main, surnames):
+            block = self._blocks.get(key)
+            if block and len(block) <= self.max_block:
+                shared.update(block)
+        if not shared:
+            return []
+        # más bloques compartidos primero; a igualdad, el primero de la fuente.
+        # Los que comparten menos de la mitad que el mejor no pueden puntuar alto
+        ranked = sorted(shared.items(), key=lambda kv: (-kv[1], kv[0]))
+        keep = (ranked[0][1] + 1) // 2
+        return [pos for pos, n in ranked[:self.max_candidates] if n >= keep]
+
+    def _score(self, pos: int, full: _Similar, main: _Similar, surnames: Set[str],
+               threshold: float) -> Tuple[float, float]:
+        # (puntuación combinada, similitud de autor); el título no se llega a
+        # comparar del todo si ya no puede alcanzar el umbral
+        author_sim = max((_surname_ratio(a, b) for a in surnames for b in self._surnames[pos]), default=0.0)
+        if threshold and author_sim < FUZZY_MIN_AUTHOR:
+            return 0.0, author_sim
+
+        # similitud de título que haría falta para llegar al umbral
+        floor = max(0.0, (threshold - AUTHOR_WEIGHT * author_sim) / TITLE_WEIGHT - 1e-9)
+        c_full, c_main = self._titles[pos]
+        title_sim = main.at_least(c_main, floor)
+        if title_sim < 1.0:
+            title_sim = max(title_sim, full.at_least(c_full, max(floor, title_sim)))
+        return TITLE_WEIGHT * title_sim + AUTHOR_WEIGHT * author_sim, author_sim
+
+    def best_match(self, title: Any, authors: Any,
+                   threshold: float = FUZZY_THRESHOLD) -> Tuple[int, Optional[float]]:
+        """Posición del mejor candidato por encima del umbral y su puntuación, o (-1, None)."""
+        full, main = title_variants(title)
+        surnames = author_surnames(authors)
+        if not main or not surnames:
+            return -1, None
+
+        best, best_score = -1, None
+        q_full, q_main = _Similar(full), _Similar(main)
+        for pos in self.candidates(main, surnames):
+            score, author_sim = self._score(pos, q_full, q_main, surnames, threshold)
+            if author_sim < FUZZY_MIN_AUTHOR or score < threshold:
+                continue
+            if best_score is None or score > best_score or (score == best_score and pos < best):
+                best, best_score = pos, score
+        return best, (round(best_score, 4) if best_score is not None else None)
@@ -0,0 +1,101 @@
+# utils_http.py
+# ------------------------------------------
+# Utilidades HTTP compartidas por los scripts
+# de ingesta: límites de cortesía por host y
+# pool de conexiones de la sesión.
+# ------------------------------------------
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# -------------------------
+# Presupuesto de peticiones por host
+# -------------------------
+
+class HostRateLimiter:
+    """
+    Reparte huecos de tiempo por host para no superar `max_per_second`
+    peticiones por segundo, aunque haya varios hilos pidiendo a la vez.
+    """
+
+    def __init__(self, max_per_second: float):
+        self.min_interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def wait(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, url: str, seconds: float):
+        # Tras un 429 se retrasa el siguiente hueco de ese host
+        host = urlsplit(url).netloc
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_slot[host] = max(self._next_slot.get(host, 0.0), until)
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket global para corrutinas: `rate` peticiones por segundo con
+    ráfagas de hasta `capacity`. Todas las tareas comparten el mismo cubo.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def backoff(self, seconds: float):
+        # Tras un 429 se deja el cubo en negativo: nadie sale hasta recuperarlo
+        if self.rate > 0:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+def retry_after_seconds(r, default: float = 5.0) -> float:
+    try:
+        return float(r.headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+# -------------------------
+# Pool de conexiones
+# -------------------------
+
+def mount_pool(session: requests.Session, pool_size: int, retries: Optional[int] = None):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retries or 0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
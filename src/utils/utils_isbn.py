@@ -5,56 +5,84 @@
 # ------------------------------------------
 
 import re
+import calendar
 import hashlib
 import unicodedata
-from typing import Any, Optional, List
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Optional, List, Tuple
 from dateutil import parser as date_parser
 from datetime import datetime
 
+import numpy as np
+
+
+# Tamaño de las cachés LRU de las normalizaciones: autores, editoriales y
+# títulos se repiten mucho entre registros y entre las dos fuentes
+NORMALIZE_CACHE_SIZE = 65536
+
+_WS_RE = re.compile(r"\s+")
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_AUTHOR_SPLIT_RE = re.compile(r"[|,;]")
+
 
 # -------------------------
 # Normalización de strings
 # -------------------------
 
-def normalize_str(val: Any) -> Optional[str]:
-    if val is None:
-        return None
-    s = str(val).strip()
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_text(s: str) -> Optional[str]:
+    s = s.strip()
     if not s or s.lower() == "nan":
         return None
-    s = re.sub(r"\s+", " ", s)
+    s = _WS_RE.sub(" ", s)
     if s.endswith(".0") and s[:-2].isdigit():
         s = s[:-2]
     return s
 
 
+def normalize_str(val: Any) -> Optional[str]:
+    if val is None:
+        return None
+    return _normalize_text(val if type(val) is str else str(val))
+
+
 def _strip_accents(s: str) -> str:
+    if s.isascii():
+        return s
     return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _title_key(t: str) -> str:
+    t = _strip_accents(t.lower())
+    t = _NON_WORD_RE.sub("", t)
+    return _WS_RE.sub(" ", t).strip()
+
+
 def normalize_title(title: Any) -> Optional[str]:
     t = normalize_str(title)
     if not t:
         return None
-    t = _strip_accents(t.lower())
-    t = re.sub(r"[^\w\s]", "", t)
-    return re.sub(r"\s+", " ", t).strip()
+    return _title_key(t)
 
 
 # -------------------------
 # Autores
 # -------------------------
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _split_authors(auth: str) -> Tuple[str, ...]:
+    return tuple(n for n in map(normalize_str, _AUTHOR_SPLIT_RE.split(auth)) if n)
+
+
 def normalize_author(auth: Any) -> List[str]:
     if not auth:
         return []
     if isinstance(auth, str):
-        parts = re.split(r"[|,;]", auth)
-    elif isinstance(auth, list):
-        parts = auth
-    else:
-        return []
-    return [normalize_str(p) for p in parts if normalize_str(p)]
+        return list(_split_authors(auth))
+    if isinstance(auth, list):
+        return [n for n in map(normalize_str, auth) if n]
+    return []
 
 
 def get_first_author(auth: Any) -> str:
@@ -62,6 +90,158 @@ def get_first_author(auth: Any) -> str:
     return a[0] if a else ""
 
 
+# -------------------------
+# Categorías, precios y monedas
+# -------------------------
+
+def normalize_categories(v: Any) -> List[str]:
+    if not v:
+        return []
+    if isinstance(v, list):
+        return [str(x).strip() for x in v if x]
+    s = str(v)
+    if "|" in s:
+        return [x.strip() for x in s.split("|") if x.strip()]
+    return [s.strip()]
+
+
+def safe_decimal(v: Any) -> Optional[float]:
+    try:
+        return float(str(v).replace(",", "."))
+    except:
+        return None
+
+
+CURRENCY_SYMBOLS = {"€": "EUR", "$": "USD", "£": "GBP"}
+
+
+def normalize_currency(v: Any) -> Optional[str]:
+    if not v:
+        return None
+    s = str(v).strip().upper()
+    return CURRENCY_SYMBOLS.get(s, s[:3])
+
+
+# -------------------------
+# ISBN: limpieza, checksums y conversión
+# -------------------------
+
+_ISBN_PREFIX_RE = re.compile(r"^ISBN(?:-1[03])?:?", re.IGNORECASE)
+_ISBN_SEP_RE = re.compile(r"[\s\-\u2010-\u2015]")
+_ISBN10_RE = re.compile(r"^\d{9}[\dX]$")
+_ISBN13_RE = re.compile(r"^97[89]\d{10}$")
+
+_W10 = np.arange(10, 0, -1)
+_W13 = np.tile([1, 3], 7)[:13]
+
+
+def clean_isbn(v: Any) -> Optional[str]:
+    """Sin prefijo 'ISBN', guiones ni espacios, y con la X final en mayúscula."""
+    s = normalize_str(v)
+    if not s:
+        return None
+    s = _ISBN_SEP_RE.sub("", _ISBN_PREFIX_RE.sub("", s.strip())).upper()
+    return s or None
+
+
+def _isbn10_check(first9: str) -> str:
+    c = (11 - sum((10 - i) * int(d) for i, d in enumerate(first9)) % 11) % 11
+    return "X" if c == 10 else str(c)
+
+
+def _isbn13_check(first12: str) -> str:
+    return str((10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(first12)) % 10) % 10)
+
+
+def is_valid_isbn10(v: Any) -> bool:
+    s = clean_isbn(v)
+    return bool(s and _ISBN10_RE.match(s) and _isbn10_check(s[:9]) == s[9])
+
+
+def is_valid_isbn13(v: Any) -> bool:
+    s = clean_isbn(v)
+    return bool(s and _ISBN13_RE.match(s) and _isbn13_check(s[:12]) == s[12])
+
+
+def isbn10_to_isbn13(v: Any) -> Optional[str]:
+    s = clean_isbn(v)
+    if not (s and is_valid_isbn10(s)):
+        return None
+    core = "978" + s[:9]
+    return core + _isbn13_check(core)
+
+
+def isbn13_to_isbn10(v: Any) -> Optional[str]:
+    # Solo los 978 tienen equivalente ISBN-10
+    s = clean_isbn(v)
+    if not (s and s.startswith("978") and is_valid_isbn13(s)):
+        return None
+    return s[3:12] + _isbn10_check(s[3:12])
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _isbn13_of_clean(s: str) -> Optional[str]:
+    if len(s) == 13:
+        return s if is_valid_isbn13(s) else None
+    if len(s) == 10:
+        return isbn10_to_isbn13(s)
+    return None
+
+
+def to_isbn13(v: Any) -> Optional[str]:
+    """ISBN-13 válido a partir de un ISBN-10 o ISBN-13 (con o sin guiones), o None."""
+    s = clean_isbn(v)
+    return _isbn13_of_clean(s) if s else None
+
+
+def isbn13_key(v: Any) -> Optional[str]:
+    """
+    Clave de cruce por ISBN: el ISBN-13 normalizado si el valor es un ISBN
+    válido (10 o 13), y si no el valor limpio tal cual, para que dos fuentes
+    con el mismo identificador no estándar sigan casando.
+    """
+    s = clean_isbn(v)
+    return (_isbn13_of_clean(s) or s) if s else None
+
+
+def to_isbn13_batch(values: Iterable) -> List[Optional[str]]:
+    """
+    to_isbn13 para una columna entera: la limpieza se hace una vez por valor
+    distinto y los checksums de todos los candidatos se calculan con numpy.
+    """
+    cleaned = map_distinct(clean_isbn, values)
+    out: List[Optional[str]] = [None] * len(cleaned)
+
+    idx13 = [i for i, s in enumerate(cleaned) if s and _ISBN13_RE.match(s)]
+    if idx13:
+        d = np.frombuffer("".join(cleaned[i] for i in idx13).encode("ascii"), dtype=np.uint8)
+        d = d.reshape(-1, 13).astype(np.int64) - 48
+        ok = (d @ _W13) % 10 == 0
+        for i, valid in zip(idx13, ok):
+            if valid:
+                out[i] = cleaned[i]
+
+    idx10 = [i for i, s in enumerate(cleaned) if s and _ISBN10_RE.match(s)]
+    if idx10:
+        raw = np.frombuffer("".join(cleaned[i] for i in idx10).encode("ascii"), dtype=np.uint8)
+        raw = raw.reshape(-1, 10)
+        d = raw.astype(np.int64) - 48
+        d[raw == ord("X")] = 10
+        ok = (d @ _W10) % 11 == 0
+        # ISBN-13: 978 + 9 dígitos + control (978 aporta 9·1 + 7·3 + 8·1 = 38)
+        check13 = (10 - (38 + d[:, :9] @ _W13[3:12]) % 10) % 10
+        for i, valid, c in zip(idx10, ok, check13):
+            if valid:
+                out[i] = f"978{cleaned[i][:9]}{c}"
+
+    return out
+
+
+def isbn13_key_batch(values: Iterable) -> List[Optional[str]]:
+    values = list(values)
+    return [k or clean_isbn(v) for v, k in zip(values, to_isbn13_batch(values))]
+
+
 # -------------------------
 # ISBN / Identificador canonico
 # -------------------------
@@ -83,30 +263,119 @@ def canonical_id_from_data(title: str, first_author: str, publisher: str, pub_ye
 # Fechas
 # -------------------------
 
-def iso_date(v: Any) -> Optional[str]:
-    if not v:
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+_YEAR_RE = re.compile(r"^\d{4}$")
+
+# Formas ISO que se resuelven sin dateutil: AAAA, AAAA-MM, AAAA-MM-DD y
+# AAAA-MM-DD[T ]hh:mm[:ss[.ffffff]][Z|±hh:mm]
+_ISO_FAST_RE = re.compile(
+    r"^(\d{4})(?:-(\d{2})(?:-(\d{2})"
+    r"(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}:\d{2})?)?)?)?$"
+)
+# Timestamps epoch (segundos o milisegundos): dateutil los toma como un año
+# fuera de rango y el resultado es None
+_EPOCH_RE = re.compile(r"^[1-9](?:\d{8,10}|\d{12})$")
+
+
+def _date_granularity(y: int, m: int, d: int) -> str:
+    # El día 1 y el mes 1 coinciden con el `default` de dateutil y se tratan
+    # como "sin día" / "sin mes"
+    if d != 1:
+        return f"{y:04d}-{m:02d}-{d:02d}"
+    if m != 1:
+        return f"{y:04d}-{m:02d}"
+    return f"{y:04d}"
+
+
+def _iso_fast(s: str) -> Optional[str]:
+    """Resultado de las formas ISO válidas, o None si hay que usar dateutil."""
+    mt = _ISO_FAST_RE.match(s)
+    if not mt:
         return None
-    s = str(v).strip()
-    if not s:
+    y = int(mt.group(1))
+    m = int(mt.group(2) or 1)
+    d = int(mt.group(3) or 1)
+    if y < 1000 or not 1 <= m <= 12 or not 1 <= d <= calendar.monthrange(y, m)[1]:
+        return None
+    if len(s) > 10:
+        # con hora: solo si Python también la da por buena
+        try:
+            datetime.fromisoformat(s)
+        except ValueError:
+            return None
+    return _date_granularity(y, m, d)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _iso_date_text(s: str) -> Optional[str]:
+    fast = _iso_fast(s)
+    if fast is not None:
+        return fast
+    if _EPOCH_RE.match(s):
         return None
 
     try:
         dt = date_parser.parse(s, default=datetime(1, 1, 1))
-        y, m, d = dt.year, dt.month, dt.day
-        if d != 1:
-            return dt.date().isoformat()
-        if m != 1:
-            return f"{y:04d}-{m:02d}"
-        return f"{y:04d}"
+        return _date_granularity(dt.year, dt.month, dt.day)
     except:
         pass
 
     # patrones directos
-    if re.match(r"^\d{4}-\d{2}-\d{2}$", s):
+    if _DATE_RE.match(s):
         return s
-    if re.match(r"^\d{4}-\d{2}$", s):
+    if _MONTH_RE.match(s):
         return s
-    if re.match(r"^\d{4}$", s):
+    if _YEAR_RE.match(s):
         return s
 
     return None
+
+
+def iso_date(v: Any) -> Optional[str]:
+    if not v:
+        return None
+    s = str(v).strip()
+    if not s:
+        return None
+    return _iso_date_text(s)
+
+
+# -------------------------
+# Variantes por lotes (columnas completas)
+# -------------------------
+
+def map_distinct(fn: Callable[[Any], Any], values: Iterable) -> List:
+    """
+    Aplica `fn` una sola vez por valor distinto de `values` y devuelve la lista
+    de resultados en el mismo orden. La clave incluye el tipo: 1, 1.0 y True
+    son iguales como claves de dict pero no dan el mismo str().
+    """
+    seen = {}
+    out = []
+    for v in values:
+        try:
+            key = (type(v), v)
+            r = seen[key]
+        except KeyError:
+            r = seen[key] = fn(v)
+        except TypeError:
+            r = fn(v)
+        out.append(r)
+    return out
+
+
+def normalize_str_batch(values: Iterable) -> List[Optional[str]]:
+    return map_distinct(normalize_str, values)
+
+
+def normalize_title_batch(values: Iterable) -> List[Optional[str]]:
+    return map_distinct(normalize_title, values)
+
+
+def first_author_batch(values: Iterable) -> List[str]:
+    return map_distinct(get_first_author, values)
+
+
+def iso_date_batch(values: Iterable) -> List[Optional[str]]:
+    return map_distinct(iso_date, values)
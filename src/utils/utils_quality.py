@@ -5,29 +5,336 @@
 # ------------------------------------------
 
 import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+# Layout particionado de dim_book (dataset Hive: pub_year_bucket=2010/language=en/…)
+PUB_YEAR_BUCKET = 10                           # años por partición de pub_year
+PARTITION_COLS = ("pub_year_bucket", "language")
+DATASET_ROW_GROUP_ROWS = 64 * 1024             # filas máx. por row group
+DATASET_MIN_ROW_GROUP_ROWS = 8 * 1024          # se acumulan filas hasta aquí antes de escribir
+DICTIONARY_COLS = ("language", "source_preference", "price_currency", "format", "publisher")
+
+
+# -------------------------
+# ESCRITURA DE TABLAS
+# -------------------------
 
+OUTPUT_FORMATS = ("parquet", "csv", "feather")
+DEFAULT_FORMATS = ("parquet", "csv")
+FORMAT_SUFFIX = {"parquet": ".parquet", "csv": ".csv", "feather": ".feather"}
+FORMAT_LABEL = {"parquet": "Parquet", "csv": "CSV", "feather": "Feather"}
 
-def save_dataframe_robust(df: pd.DataFrame, path: Path):
-    if df is None or df.empty:
+
+def parse_formats(text: str) -> Tuple[str, ...]:
+    """"parquet,feather" → ("parquet", "feather"); ValueError si hay formatos desconocidos."""
+    formats = tuple(dict.fromkeys(f.strip().lower() for f in text.split(",") if f.strip()))
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"formatos no válidos: {', '.join(unknown) or '(ninguno)'}; "
+                         f"disponibles: {', '.join(OUTPUT_FORMATS)}")
+    return formats
+
+
+def _write_atomic(path: Path, write):
+    # se escribe al lado del destino y se publica con un rename: quien lea
+    # el fichero ve la versión anterior completa o la nueva completa
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _encode(fmt: str, df: pd.DataFrame, table: Optional[pa.Table], path: Path) -> dict:
+    t0 = time.perf_counter()
+    if fmt == "csv":
+        _write_atomic(path, lambda tmp: df.to_csv(tmp, index=False, sep=";", encoding="utf-8"))
+    elif table is None:
+        raise ValueError("la tabla no se puede convertir a Arrow")
+    elif fmt == "parquet":
+        _write_atomic(path, lambda tmp: pq.write_table(table, tmp))
+    else:
+        _write_atomic(path, lambda tmp: feather.write_feather(table, tmp))
+    return {"file": path.name, "bytes": path.stat().st_size, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def save_dataframe_robust(df: Union[pd.DataFrame, pa.Table], path: Path,
+                          formats: Sequence[str] = DEFAULT_FORMATS,
+                          schema: Optional[pa.Schema] = None,
+                          frame: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Escribe `df` en los formatos pedidos (misma ruta, cambiando la extensión),
+    en paralelo y cada uno a un temporal publicado con rename atómico. Un
+    formato que falla no impide los demás. Con `schema` la tabla se ajusta
+    antes a ese esquema (conform_table) y todos los formatos salen de ella;
+    `df` puede ser entonces una tabla Arrow ya ajustada, y `frame` su
+    typed_frame si ya se calculó (el CSV sale de él). Devuelve {formato:
+    {path, bytes, seconds}} de los que se han escrito.
+    """
+    rows = df.num_rows if isinstance(df, pa.Table) else (0 if df is None else len(df))
+    if not rows:
         print(f"[WARN] DF vacío, no guardado: {path}")
-        return
+        return {}
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    csv_path = path.with_suffix(".csv")
 
-    try:
-        df.to_parquet(path, index=False)
-        print(f"[OK] Parquet: {path}")
-    except Exception as e:
-        print(f"[WARN] No se pudo escribir Parquet ({e}).")
+    # Parquet y Feather comparten la conversión a Arrow
+    table = None
+    if schema is not None:
+        table = conform_table(df, schema)
+        if "csv" in formats:
+            df = typed_frame(table) if frame is None else frame
+    elif any(f != "csv" for f in formats):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except Exception as e:
+            print(f"[WARN] No se pudo convertir a Arrow ({e}).")
+
+    report = {}
+    # pyarrow suelta el GIL al codificar, así que los formatos avanzan a la vez
+    with ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        targets = {f: path.with_suffix(FORMAT_SUFFIX[f]) for f in formats}
+        futures = {f: pool.submit(_encode, f, df, table, targets[f]) for f in formats}
+        for fmt, fut in futures.items():
+            label = FORMAT_LABEL[fmt]
+            try:
+                report[fmt] = fut.result()
+            except Exception as e:
+                tag = "ERROR" if fmt == "csv" else "WARN"
+                print(f"[{tag}] No se pudo escribir {label} ({e}).")
+                continue
+            r = report[fmt]
+            print(f"[OK] {label}: {targets[fmt]} ({r['bytes'] / 2**20:.1f} MB, {r['seconds']:.2f} s)")
+    return report
+
+
+def save_dataset_partitioned(source: Union[pd.DataFrame, pa.Table, Path], path: Path,
+                             partition_cols: Sequence[str] = PARTITION_COLS,
+                             year_bucket: int = PUB_YEAR_BUCKET,
+                             row_group_rows: int = DATASET_ROW_GROUP_ROWS) -> dict:
+    """
+    Escribe una tabla como dataset Parquet con particiones Hive, pensado para
+    lecturas filtradas (poda de particiones + estadísticas por row group):
+    zstd, diccionario en las columnas de baja cardinalidad y estadísticas de
+    columna. `pub_year_bucket` es pub_year redondeado a `year_bucket` años.
+    `source` puede ser un DataFrame o una tabla Arrow (se ordena por pub_year
+    para que las estadísticas de cada row group sean estrechas) o la ruta de
+    un Parquet o Feather, que se lee por lotes. El directorio se sustituye
+    entero al terminar.
+    """
+    if isinstance(source, (pd.DataFrame, pa.Table)):
+        if not len(source):
+            print(f"[WARN] DF vacío, dataset no guardado: {path}")
+            return {}
+        if isinstance(source, pd.DataFrame):
+            df = source.sort_values("pub_year", kind="stable") if "pub_year" in source else source
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        else:
+            table = source.sort_by("pub_year") if "pub_year" in source.column_names else source
+        data = ds.dataset(table)
+    else:
+        data = ds.dataset(str(source), format="ipc" if source.suffix == ".feather" else "parquet")
+
+    columns = {name: ds.field(name) for name in data.schema.names}
+    for c in partition_cols:
+        # el valor va en el nombre del directorio: las categóricas, como texto
+        if c in columns and pa.types.is_dictionary(data.schema.field(c).type):
+            columns[c] = ds.field(c).cast(data.schema.field(c).type.value_type)
+    if "pub_year_bucket" in partition_cols:
+        year = ds.field("pub_year").cast(pa.int64())
+        columns["pub_year_bucket"] = (year / year_bucket) * year_bucket
+    scanner = data.scanner(columns=columns)
+
+    part_schema = pa.schema([(c, scanner.projected_schema.field(c).type) for c in partition_cols])
+    file_cols = [c for c in scanner.projected_schema.names if c not in partition_cols]
+    options = ds.ParquetFileFormat().make_write_options(
+        compression="zstd",
+        use_dictionary=[c for c in DICTIONARY_COLS if c in file_cols],
+        write_statistics=True,
+    )
+
+    tmp = path.with_name(path.name + ".tmp")
+    old = path.with_name(path.name + ".old")
+    for d in (tmp, old):
+        shutil.rmtree(d, ignore_errors=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    files = []
+    ds.write_dataset(
+        scanner, str(tmp), format="parquet", file_options=options,
+        partitioning=ds.partitioning(part_schema, flavor="hive"),
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=row_group_rows,
+        min_rows_per_group=min(DATASET_MIN_ROW_GROUP_ROWS, row_group_rows),
+        max_partitions=4096,
+        file_visitor=lambda f: files.append(f.size),
+    )
+
+    # Sustitución del dataset anterior: rename + borrado, nunca a medio escribir
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+
+    stats = {"files": len(files), "bytes": sum(s or 0 for s in files)}
+    print(f"[OK] Dataset Parquet: {path} ({stats['files']} ficheros, {stats['bytes'] / 2**20:.1f} MB)")
+    return stats
+
+
+def _year_bucket_filters(filters: List[Tuple], year_bucket: int) -> List[Tuple]:
+    # pub_year >= 2003 → pub_year_bucket >= 2000: poda de particiones sin
+    # que quien consulta tenga que conocer los buckets
+    out = []
+    for col, op, val in filters:
+        if col != "pub_year":
+            continue
+        if op in ("in", "not in"):
+            if op == "in":
+                out.append(("pub_year_bucket", "in", sorted({int(v) // year_bucket * year_bucket for v in val})))
+            continue
+        bucket = int(val) // year_bucket * year_bucket
+        if op in (">", ">="):
+            out.append(("pub_year_bucket", ">=", bucket))
+        elif op in ("<", "<="):
+            out.append(("pub_year_bucket", "<=", bucket))
+        elif op in ("=", "=="):
+            out.append(("pub_year_bucket", "=", bucket))
+    return out
+
+
+def read_dataset_partitioned(path: Path, filters: Optional[List[Tuple]] = None,
+                             columns: Optional[List[str]] = None,
+                             year_bucket: int = PUB_YEAR_BUCKET) -> pd.DataFrame:
+    """
+    Lee el dataset de save_dataset_partitioned con filtros estilo pandas
+    ([("language", "=", "es"), ("pub_year", ">=", 2000)]). Los filtros sobre
+    pub_year se traducen también a pub_year_bucket para podar particiones, y
+    las columnas de partición se leen como texto/entero: pd.read_parquet las
+    infiere como diccionario y falla con particiones nulas (idioma vacío).
+    """
+    data = ds.dataset(str(path), format="parquet", partitioning=ds.HivePartitioning.discover())
+    expr = None
+    if filters:
+        if "pub_year_bucket" in data.schema.names:
+            filters = list(filters) + _year_bucket_filters(filters, year_bucket)
+        expr = pq.filters_to_expression(filters)
+    return data.to_table(filter=expr, columns=columns).to_pandas()
+
+
+# -------------------------
+# ESQUEMA TIPADO
+# -------------------------
+
+# Categóricas (pocos valores distintos): diccionario, un entero por fila
+CATEGORY = pa.dictionary(pa.int16(), pa.string())
+
+DIM_BOOK_SCHEMA = pa.schema([
+    pa.field("canonical_id", pa.string(), nullable=False),
+    ("isbn13", pa.string()),
+    ("isbn10", pa.string()),
+    ("title", pa.string()),
+    ("authors", pa.string()),
+    ("first_author", pa.string()),
+    ("publisher", pa.string()),
+    ("pub_date", pa.string()),             # YYYY, YYYY-MM o YYYY-MM-DD: no siempre es una fecha completa
+    ("pub_year", pa.int16()),
+    ("language", CATEGORY),
+    ("categories", pa.string()),
+    ("num_pages", pa.int32()),
+    ("format", CATEGORY),
+    ("description", pa.string()),
+    ("rating_value", pa.float32()),
+    ("rating_count", pa.int32()),
+    ("price_amount", pa.float64()),        # importes: float32 no guarda bien los céntimos
+    ("price_currency", CATEGORY),
+    pa.field("source_preference", CATEGORY, nullable=False),
+    ("most_complete_url", pa.string()),
+    ("ingestion_date_goodreads", pa.timestamp("ms")),  # hora local del scraper; Parquet no tiene segundos
+    ("ingestion_date_google", pa.timestamp("ms")),
+])
+
+DETAIL_SCHEMA = pa.schema([
+    pa.field("canonical_id", pa.string(), nullable=False),
+    pa.field("from_google", pa.bool_(), nullable=False),
+    pa.field("merge_method", CATEGORY, nullable=False),
+    ("match_score", pa.float32()),
+    pa.field("timestamp", pa.timestamp("us", tz="UTC"), nullable=False),
+    ("raw_goodreads_ref", pa.string()),    # hash del registro crudo en el RawStore
+    ("raw_google_ref", pa.string()),
+])
+
+DUPLICATES_SCHEMA = DIM_BOOK_SCHEMA.append(pa.field("dedup_reason", CATEGORY, nullable=False))
+
+# Enteros con nulos como enteros de pandas (por defecto serían float64)
+_PANDAS_TYPES = {
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+
+def _typed_column(values: pd.Series, type_: pa.DataType) -> pa.Array:
+    if pa.types.is_integer(type_):
+        num = pd.to_numeric(values, errors="coerce")
+        return pa.array(num.where(num == num.round()).astype("Int64"), type=type_)
+    if pa.types.is_floating(type_):
+        return pa.array(pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64"),
+                        type=type_, from_pandas=True)
+    if pa.types.is_boolean(type_):
+        return pa.array(values.astype(bool), type=type_)
+    if pa.types.is_timestamp(type_):
+        ts = pd.to_datetime(values, errors="coerce", format="ISO8601", utc=type_.tz is not None)
+        return pa.array(ts, from_pandas=True).cast(type_, safe=False)
+    text = [None if v is None or v != v else str(v) for v in values]
+    return pa.array(text, type=type_)
+
+
+def conform_table(data: Union[pd.DataFrame, pa.Table, List[Dict]], schema: pa.Schema) -> pa.Table:
+    """
+    Tabla Arrow con exactamente `schema`: columnas en su orden (las que faltan,
+    nulas; las que sobran, fuera) y cada valor convertido a su tipo (lo que
+    no se puede convertir queda nulo). ValueError si una columna no nullable
+    tiene nulos.
+    """
+    if isinstance(data, pa.Table):
+        if data.schema.equals(schema):
+            return data
+        data = data.to_pandas()
+    df = pd.DataFrame(data, columns=schema.names)
+    cols = {field.name: _typed_column(df[field.name], field.type) for field in schema}
+    bad = [f"{f.name} ({cols[f.name].null_count})" for f in schema if not f.nullable and cols[f.name].null_count]
+    if bad:
+        raise ValueError(f"Nulos en columnas no nullable: {', '.join(bad)}")
+    return pa.table(cols, schema=schema)
+
+
+def typed_frame(table: pa.Table) -> pd.DataFrame:
+    """DataFrame de una tabla tipada: enteros con nulos, categóricas y fechas reales."""
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get)
 
-    try:
-        df.to_csv(csv_path, index=False, sep=";", encoding="utf-8")
-        print(f"[OK] CSV: {csv_path}")
-    except Exception as e:
-        print(f"[ERROR] No se pudo escribir CSV ({e}).")
+
+def arrow_type_name(type_: pa.DataType) -> str:
+    # dictionary<values=string, indices=int16, ordered=0> → dictionary<string>;
+    # float/double → float32/float64
+    if pa.types.is_dictionary(type_):
+        return f"dictionary<{arrow_type_name(type_.value_type)}>"
+    if pa.types.is_floating(type_):
+        return f"float{type_.bit_width}"
+    return str(type_)
 
 
 def write_quality_metrics(path: Path, metrics: dict):
@@ -35,29 +342,51 @@ def write_quality_metrics(path: Path, metrics: dict):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(metrics, f, indent=2, ensure_ascii=False)
 
-def write_schema_markdown(path: Path, df: pd.DataFrame):
+def _schema_columns_from_df(df: pd.DataFrame):
+    for col in df.columns:
+        series = df[col]
+        nulls = series.isnull()
+        present = series[~nulls]
+        yield col, str(series.dtype), bool(nulls.any()), present.iloc[0] if len(present) else ""
+
+
+def _schema_columns_from_profile(profile: Dict):
+    # perfil de MetricsAccumulator.summary()["columns"]: sin volver a recorrer datos
+    for col, p in profile.items():
+        example = p.get("example")
+        yield col, p["dtype"], p["nulls"] > 0, "" if example is None else example
+
+
+def _schema_columns_from_schema(schema: pa.Schema, profile: Optional[Dict]):
+    # tipo y nullable declarados; el ejemplo, del perfil si lo hay
+    profile = profile or {}
+    for field in schema:
+        example = profile.get(field.name, {}).get("example")
+        yield field.name, arrow_type_name(field.type), field.nullable, "" if example is None else example
+
+
+def write_schema_markdown(path: Path, df: Optional[pd.DataFrame] = None, profile: Optional[Dict] = None,
+                          schema: Optional[pa.Schema] = None):
     """
     Genera schema.md con:
     Campo | Tipo | Nullable | Formato | Ejemplo | Reglas
-    donde se generan reglas automáticas según nombre, tipo y patrón.
+    donde se generan reglas automáticas según nombre, tipo y patrón. Con
+    `schema` (p. ej. DIM_BOOK_SCHEMA) tipo y nullable son los declarados; si
+    no, tipo, nulos y ejemplo salen del perfil por columnas del acumulador
+    de métricas (`profile`) o del DataFrame.
     """
     lines = []
     lines.append("| Campo | Tipo | Nullable | Formato | Ejemplo | Reglas |")
     lines.append("|-------|------|----------|----------|---------|---------|")
 
-    for col in df.columns:
-        series = df[col]
-        tipo = str(series.dtype)
-        nullable = "Sí" if series.isnull().any() else "No"
-
-        # Ejemplo real
-        ejemplo = None
-        for v in series:
-            if v is not None:
-                ejemplo = v
-                break
-        if ejemplo is None:
-            ejemplo = ""
+    if schema is not None:
+        columns = _schema_columns_from_schema(schema, profile)
+    elif profile is not None:
+        columns = _schema_columns_from_profile(profile)
+    else:
+        columns = _schema_columns_from_df(df)
+    for col, tipo, has_nulls, ejemplo in columns:
+        nullable = "Sí" if has_nulls else "No"
 
         # Formato y reglas automáticas
         formato = "string"
@@ -70,6 +399,11 @@ def write_schema_markdown(path: Path, df: pd.DataFrame):
         if "int" in tipo or "float" in tipo:
             formato = "numérico"
             reglas.append("Debe ser un número válido")
+        if tipo.startswith("dictionary"):
+            formato = "categórica"
+            reglas.append("Codificada como diccionario (pocos valores distintos)")
+        if tipo.startswith("timestamp"):
+            formato = "fecha y hora"
 
         # ISBN13
         if cname == "isbn13":
@@ -115,9 +449,13 @@ def write_schema_markdown(path: Path, df: pd.DataFrame):
             reglas.append("Valores únicos")
         
         # dates
-        if cname in ("pub_date", "ingestion_date_google", "ingestion_date_goodreads"):
+        if cname in ("pub_date", "ingestion_date_google", "ingestion_date_goodreads") and not tipo.startswith("timestamp"):
             reglas.append("Formato ISO-8601")
             reglas.append("Admite YYYY, YYYY-MM o YYYY-MM-DD")
+        if cname in ("ingestion_date_google", "ingestion_date_goodreads") and tipo.startswith("timestamp"):
+            reglas.append("Hora local del scraper (sin zona horaria)")
+        if cname == "timestamp":
+            reglas.append("Momento de la integración (UTC)")
 
         if cname == "pub_year":
             reglas.append("Debe ser año entre 1000 y 2100")
@@ -162,12 +500,21 @@ def write_schema_markdown(path: Path, df: pd.DataFrame):
 
         # merge_method
         if cname == "merge_method":
-            reglas.append("Valores válidos: isbn13, heuristic, none")
+            reglas.append("Valores válidos: isbn13, heuristic, fuzzy, none")
+
+        # match_score
+        if cname == "match_score":
+            reglas.append("1.0 en cruces exactos; puntuación del matching aproximado en fuzzy")
+            reglas.append("Vacío si merge_method es none")
 
         # raw sources
         if cname in ("raw_goodreads", "raw_google"):
             formato = "JSON"
             reglas.append("Registro original sin modificar de la fuente")
+        if cname in ("raw_goodreads_ref", "raw_google_ref"):
+            formato = "SHA-1 (hex)"
+            reglas.append("Clave del registro original en raw_store.sqlite (rehydrate_detail)")
+            reglas.append("Vacío si no hay registro de esa fuente")
 
         # Unir reglas
         reglas_texto = "<br>".join(reglas) if reglas else ""
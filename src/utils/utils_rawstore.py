@@ -0,0 +1,122 @@
+# utils_rawstore.py
+# ------------------------------------------
+# Almacén de registros crudos direccionado por
+# contenido: cada registro de Goodreads o de
+# Google se guarda una sola vez, como JSON
+# comprimido bajo el hash de su contenido, y
+# book_source_detail solo lleva esa referencia.
+# ------------------------------------------
+
+import hashlib
+import json
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+REF_COLUMNS = {"raw_goodreads_ref": "raw_goodreads", "raw_google_ref": "raw_google"}
+
+
+def payload_key(rec: Any) -> str:
+    # sha1 del JSON canónico (claves ordenadas): el mismo registro da la misma
+    # clave aunque llegue con otro orden de campos. Coincide con record_fingerprint
+    return hashlib.sha1(json.dumps(rec, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class RawStore:
+    """
+    Blobs zlib(JSON) en SQLite, por hash de contenido. Escribir un registro
+    que ya está no cuesta más que mirar un set en memoria; `prune` borra los
+    que ya no referencia ningún detalle.
+    """
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.stats = {"stored": 0, "deduplicated": 0, "bytes_stored": 0}
+        self._db = sqlite3.connect(str(path))
+        self._db.execute("CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self._db.commit()
+        self._known = {k for (k,) in self._db.execute("SELECT key FROM blobs")}
+
+    def put_many(self, items: Iterable[Tuple[Optional[str], Any]]) -> List[Optional[str]]:
+        """
+        Guarda los registros (clave o None para calcularla, registro) y devuelve
+        sus claves; None para los registros vacíos (sin cruce con Google).
+        """
+        keys, rows = [], []
+        for key, rec in items:
+            if not rec:
+                keys.append(None)
+                continue
+            key = key or payload_key(rec)
+            keys.append(key)
+            if key in self._known:
+                self.stats["deduplicated"] += 1
+                continue
+            data = zlib.compress(json.dumps(rec, ensure_ascii=False, default=str).encode("utf-8"))
+            rows.append((key, data))
+            self._known.add(key)
+            self.stats["bytes_stored"] += len(data)
+        if rows:
+            self._db.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?)", rows)
+            self._db.commit()
+            self.stats["stored"] += len(rows)
+        return keys
+
+    def put(self, rec: Any, key: Optional[str] = None) -> Optional[str]:
+        return self.put_many([(key, rec)])[0]
+
+    def get_many(self, keys: Iterable[Optional[str]]) -> Dict[str, Any]:
+        """{clave: registro} de las claves que existen; las None se ignoran."""
+        wanted = list({k for k in keys if k})
+        out = {}
+        for i in range(0, len(wanted), 900):
+            part = wanted[i:i + 900]
+            q = f"SELECT key, data FROM blobs WHERE key IN ({','.join('?' * len(part))})"
+            for key, data in self._db.execute(q, part):
+                out[key] = json.loads(zlib.decompress(data))
+        return out
+
+    def get(self, key: Optional[str]) -> Optional[Any]:
+        return self.get_many([key]).get(key) if key else None
+
+    def prune(self, referenced: Iterable[Optional[str]]) -> int:
+        """Borra los blobs que no están en `referenced`; devuelve cuántos."""
+        keep = {k for k in referenced if k}
+        stale = [(k,) for k in self._known - keep]
+        if stale:
+            self._db.executemany("DELETE FROM blobs WHERE key = ?", stale)
+            self._db.commit()
+            self._known &= keep
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def close(self):
+        self._db.close()
+
+
+def rehydrate_detail(df_detail: pd.DataFrame, store_path: Path) -> pd.DataFrame:
+    """
+    book_source_detail con los registros crudos de vuelta (columnas
+    raw_goodreads / raw_google como dicts) a partir de las referencias.
+    """
+    store = RawStore(store_path)
+    try:
+        out = df_detail.copy()
+        for ref_col, raw_col in REF_COLUMNS.items():
+            if ref_col not in out:
+                continue
+            refs = out[ref_col].tolist()
+            found = store.get_many(refs)
+            out[raw_col] = pd.Series([found.get(r) if isinstance(r, str) else None for r in refs],
+                                     index=out.index, dtype=object)
+        return out
+    finally:
+        store.close()
@@ -0,0 +1,336 @@
+# utils_runmetrics.py
+# ------------------------------------------
+# Instrumentación común a los tres scripts:
+# tiempos por etapa (fetch, parse, query,
+# normalize, match, dedup, write...), filas/s,
+# histogramas de latencia HTTP, contadores de
+# reintentos y de caché, un hook opcional de
+# cProfile para una etapa y logging por niveles
+# para los mensajes por registro.
+# ------------------------------------------
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Bloqueo de ficheros: flock en POSIX, msvcrt.locking en Windows
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# Variables de entorno: nivel de log (DEBUG muestra los mensajes por registro)
+# y etapa que se perfila con cProfile
+LOG_LEVEL_ENV = "PIPELINE_LOG_LEVEL"
+PROFILE_STAGE_ENV = "PIPELINE_PROFILE_STAGE"
+
+# Cotas superiores (ms) de los cubos del histograma de latencia
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 750,
+                      1000, 1500, 2000, 3000, 5000, 10000, 30000)
+
+
+# -------------------------
+# Logging
+# -------------------------
+
+class _TagFormatter(logging.Formatter):
+    # Mismo formato que los print del proyecto: [INFO] ..., [WARN] ...
+    TAGS = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        return f"[{self.TAGS.get(record.levelname, record.levelname)}] {record.getMessage()}"
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # Escribe en el sys.stdout del momento (respeta redirect_stdout)
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _):
+        pass
+
+
+def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
+    """
+    Logger `books_pipeline.<name>` hacia stdout. Los mensajes por registro van
+    a DEBUG con formato diferido (log.debug("... %s", x)): con el nivel por
+    defecto (INFO, o PIPELINE_LOG_LEVEL) ni siquiera se formatean.
+    """
+    root = logging.getLogger("books_pipeline")
+    if not root.handlers:
+        handler = _StdoutHandler()
+        handler.setFormatter(_TagFormatter())
+        root.addHandler(handler)
+        root.propagate = False
+        root.setLevel(os.environ.get(LOG_LEVEL_ENV, "INFO").upper())
+    if level:
+        root.setLevel(level.upper())
+    return root.getChild(name)
+
+
+# -------------------------
+# Bloqueo entre procesos
+# -------------------------
+
+@contextmanager
+def _file_lock(path: Path):
+    """Bloqueo exclusivo sobre `path` (se crea si no existe), también entre procesos."""
+    with open(path, "a+b") as f:
+        if sys.platform == "win32":
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK reintenta durante ~10 s y luego lanza OSError
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# -------------------------
+# Histograma de latencia
+# -------------------------
+
+class LatencyHistogram:
+    """Cubos fijos en ms: memoria constante, percentiles aproximados por interpolación."""
+
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds_ms)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.n += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.n:
+            return None
+        target = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= target:
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.max
+                return round(min(lo + (hi - lo) * (target - seen) / c, self.max), 1)
+            seen += c
+        return round(self.max, 1)
+
+    def summary(self) -> Dict:
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.n,
+            "mean_ms": round(self.total / self.n, 1) if self.n else None,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 1),
+            "buckets_ms": {k: c for k, c in zip(labels, self.counts) if c},
+        }
+
+
+# -------------------------
+# Métricas de ejecución
+# -------------------------
+
+class RunMetrics:
+    """
+    Acumula, para un script, el tiempo de cada etapa (suma de todas sus
+    llamadas: en etapas concurrentes puede superar al tiempo real), las filas
+    que procesa, latencias por destino HTTP y contadores. Es seguro usarla
+    desde varios hilos y desde corrutinas.
+
+    Con `profile_stage` (o PIPELINE_PROFILE_STAGE) esa etapa se ejecuta bajo
+    cProfile; al escribir el informe se guarda el .prof junto a él.
+    """
+
+    def __init__(self, entry_point: str, profile_stage: Optional[str] = None):
+        self.entry_point = entry_point
+        self.profile_stage = profile_stage or os.environ.get(PROFILE_STAGE_ENV) or None
+        self.reset()
+
+    def reset(self):
+        # Vuelve a empezar (p. ej. varias ejecuciones en el mismo proceso)
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict] = {}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.counters: Counter = Counter()
+        self.extra: Dict[str, Any] = {}
+        self._profiles: List[cProfile.Profile] = []
+        self._local = threading.local()
+
+    # --- etapas ---
+
+    def _stage(self, name: str) -> Dict:
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = {"seconds": 0.0, "calls": 0, "rows": 0}
+        return st
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        profiling = name == self.profile_stage and self._profile_enter()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            if profiling:
+                self._profile_exit()
+            with self._lock:
+                st = self._stage(name)
+                st["seconds"] += dt
+                st["calls"] += 1
+                st["rows"] += rows
+
+    def add_rows(self, name: str, rows: int):
+        # Para cuando las filas se conocen al salir de la etapa
+        with self._lock:
+            self._stage(name)["rows"] += rows
+
+    # --- HTTP y contadores ---
+
+    def observe(self, target: str, seconds: float):
+        with self._lock:
+            hist = self.latency.get(target)
+            if hist is None:
+                hist = self.latency[target] = LatencyHistogram()
+            hist.add(seconds)
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def record(self, key: str, value):
+        # Estadísticas que ya lleva otro objeto (p. ej. HtmlCache.stats) o datos de la ejecución
+        with self._lock:
+            self.extra[key] = dict(value) if isinstance(value, dict) else value
+
+    # --- cProfile ---
+
+    def _profile_enter(self) -> bool:
+        # Un perfilador por hilo; en corrutinas la etapa puede anidarse
+        # consigo misma, así que solo se activa en el primer nivel
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        if depth == 0:
+            prof = getattr(self._local, "profile", None)
+            if prof is None:
+                prof = self._local.profile = cProfile.Profile()
+                with self._lock:
+                    self._profiles.append(prof)
+            prof.enable()
+        return True
+
+    def _profile_exit(self):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._local.profile.disable()
+
+    def _dump_profile(self, path: Path, top: int = 15) -> Optional[str]:
+        if not self._profiles:
+            return None
+        stats = pstats.Stats(self._profiles[0])
+        for prof in self._profiles[1:]:
+            stats.add(prof)
+        stats.dump_stats(str(path))
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats("cumulative").print_stats(top)
+        print(f"[INFO] Perfil de la etapa '{self.profile_stage}' ({path}):")
+        print("\n".join(line for line in out.getvalue().splitlines()[6:] if line.strip()))
+        return str(path)
+
+    # --- informe ---
+
+    def summary(self) -> Dict:
+        wall = time.perf_counter() - self._t0
+        with self._lock:
+            stages = {
+                name: {
+                    "seconds": round(st["seconds"], 4),
+                    "calls": st["calls"],
+                    "rows": st["rows"],
+                    "rows_per_s": round(st["rows"] / st["seconds"], 1) if st["rows"] and st["seconds"] else None,
+                    "share_of_wall": round(st["seconds"] / wall, 3) if wall else None,
+                }
+                for name, st in self.stages.items()
+            }
+            return {
+                "started_at": self.started_at.isoformat().replace("+00:00", "Z"),
+                "finished_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "wall_seconds": round(wall, 3),
+                "stages": stages,
+                "http_latency": {t: h.summary() for t, h in self.latency.items()},
+                "counters": dict(self.counters),
+                **self.extra,
+            }
+
+    def write(self, path: Path) -> Dict:
+        """
+        Guarda el resumen en `path` bajo `runs.<entry_point>`, conservando el
+        de los otros scripts (los tres comparten docs/run_metrics.json). Con el
+        orquestador pueden escribir a la vez, así que leer-fusionar-reemplazar
+        va bajo un bloqueo exclusivo sobre `<path>.lock` (_file_lock).
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        if self.profile_stage:
+            summary["profile"] = {"stage": self.profile_stage, "path": self._dump_profile(
+                path.with_name(f"profile_{self.entry_point}_{self.profile_stage}.prof"))}
+
+        with _file_lock(path.with_name(path.name + ".lock")):
+            try:
+                report = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                report = {}
+            report.setdefault("runs", {})[self.entry_point] = summary
+            report["generated_at"] = summary["finished_at"]
+
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, path)
+        return summary
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"[INFO] Tiempo total: {s['wall_seconds']:.2f} s")
+        for name, st in sorted(s["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            rate = f" | {st['rows_per_s']:.1f} filas/s" if st["rows_per_s"] else ""
+            print(f"[INFO]   {name:<10} {st['seconds']:>9.3f} s  x{st['calls']}{rate}")
+        for target, h in s["http_latency"].items():
+            print(f"[INFO]   HTTP {target}: {h['count']} peticiones | p50 {h['p50_ms']} ms | "
+                  f"p90 {h['p90_ms']} ms | p99 {h['p99_ms']} ms")